@@ -2,20 +2,96 @@
 """
 DagKnows Status Checker
 Verifies that the installation is working correctly
+
+Checks run concurrently (those that need Docker once the Docker check has
+passed), each with its own deadline and all within an overall budget
+(DK_STATUS_BUDGET seconds). Their output is buffered per check and printed
+in a fixed order, so a slow check delays only its own section.
+
+Usage:
+    python3 check-status.py                       # Colored report
+    python3 check-status.py --format json         # One JSON document
+    python3 check-status.py --format openmetrics  # OpenMetrics text for scrapers
+    python3 check-status.py --daemon              # Keep a status snapshot up to date
+    python3 check-status.py --cached              # Report from the daemon's snapshot
+    python3 check-status.py --sampler             # Record container resource usage
+    python3 check-status.py --resources           # Top consumers and trends (hour/day/week)
+
+The machine-readable formats carry each check's result, duration, the
+individual results it printed and the data it collected (container
+states, versions, port and probe latencies).
+
+The status daemon re-runs the checks every DK_STATUS_INTERVAL seconds and
+shortly after any container of the project starts, stops, dies or changes
+health (one Docker event subscription). Each result is written atomically
+to SNAPSHOT_FILE and served on the unix socket SNAPSHOT_SOCKET, so --cached
+answers without touching Docker.
+
+The resource sampler records each service's CPU, memory, block I/O and
+network usage from the Docker stats stream into fixed-size ring files
+under .stats/ (see resource_stats.py); --resources reports from them.
 """
 
+import argparse
+import io
 import os
+import socket
+import socketserver
 import sys
 import subprocess
 import json
+import signal
+import threading
+import time
+from datetime import datetime
 from pathlib import Path
 
 try:
-    import yaml
+    import manifest_store
     YAML_AVAILABLE = True
 except ImportError:
+    # manifest_store needs pyyaml
     YAML_AVAILABLE = False
 
+try:
+    import docker_api
+    import health_probe
+    import resource_stats
+    DOCKER_API_AVAILABLE = True
+except ImportError:
+    DOCKER_API_AVAILABLE = False
+
+try:
+    import config_agent
+    CONFIG_AGENT_AVAILABLE = True
+except ImportError:
+    CONFIG_AGENT_AVAILABLE = False
+
+# Engine API client, set by check_docker() when the socket is accessible
+DOCKER_CLIENT = None
+
+DB_SERVICES = ('postgres', 'elasticsearch')
+
+# Seconds all checks together may take (override with DK_STATUS_BUDGET)
+STATUS_BUDGET = 8
+
+# The check (CheckRun) the current thread is running, for print_check and record_data
+CHECK_CONTEXT = threading.local()
+
+# Status daemon: snapshot file and socket (relative to this directory)
+SNAPSHOT_FILE = '.status-snapshot.json'
+SNAPSHOT_SOCKET = '.status.sock'
+
+# Seconds between scheduled refreshes (override with DK_STATUS_INTERVAL)
+STATUS_INTERVAL = 30
+
+# Quiet seconds after a container event before refreshing (events come in bursts)
+EVENT_SETTLE_SECONDS = 2
+
+# Container events that can change the status (health checks also emit exec_* events)
+STATUS_EVENTS = ['create', 'start', 'restart', 'stop', 'die', 'kill', 'oom', 'destroy',
+                 'pause', 'unpause', 'health_status']
+
 # ANSI color codes
 class Colors:
     HEADER = '\033[95m'
@@ -32,7 +108,10 @@ def print_header(text):
     print(f"{Colors.HEADER}{Colors.BOLD}{'='*60}{Colors.ENDC}\n")
 
 def print_check(name, status, message=""):
-    """Print a check result"""
+    """Print a check result (and record it on the running check)"""
+    run = getattr(CHECK_CONTEXT, 'run', None)
+    if run:
+        run.items.append({'name': name, 'passed': bool(status), 'message': message})
     if status:
         symbol = f"{Colors.OKGREEN}✓{Colors.ENDC}"
         status_text = f"{Colors.OKGREEN}OK{Colors.ENDC}"
@@ -44,6 +123,12 @@ def print_check(name, status, message=""):
     if message:
         print(f"  {Colors.WARNING}→ {message}{Colors.ENDC}")
 
+def record_data(key, value):
+    """Attach collected data to the running check (reported by --format json/openmetrics)"""
+    run = getattr(CHECK_CONTEXT, 'run', None)
+    if run:
+        run.data[key] = value
+
 def run_command(cmd, capture_output=True):
     """Run a command and return output"""
     try:
@@ -59,6 +144,29 @@ def run_command(cmd, capture_output=True):
     except Exception as e:
         return False, str(e)
 
+def list_compose_containers(compose_file=None):
+    """
+    List compose containers as dicts shaped like 'docker compose ps --format json'.
+    Uses the Engine API when available (one request, no process spawn).
+    Returns None if the containers could not be listed.
+    """
+    if DOCKER_CLIENT:
+        try:
+            containers = DOCKER_CLIENT.compose_ps()
+        except (docker_api.DockerAPIError, OSError):
+            return None
+        if compose_file == 'db-docker-compose.yml':
+            return [c for c in containers if c.get('Service') in DB_SERVICES]
+        return containers
+
+    cmd = f"docker compose -f {compose_file} ps --format json" if compose_file else "docker compose ps --format json"
+    success, output = run_command(cmd)
+    if not success:
+        return None
+
+    # Docker compose ps can output multiple JSON objects
+    return [json.loads(line) for line in output.strip().split('\n') if line.strip()]
+
 def check_required_files():
     """Check if required files exist"""
     print_header("Required Files Check")
@@ -83,8 +191,21 @@ def check_required_files():
 
 def check_docker():
     """Check Docker installation and status"""
+    global DOCKER_CLIENT
     print_header("Docker Check")
 
+    # A reachable Engine API socket proves Docker is installed, running and accessible
+    if DOCKER_API_AVAILABLE:
+        DOCKER_CLIENT = docker_api.get_client()
+    record_data('engine_api', DOCKER_CLIENT is not None)
+    if DOCKER_CLIENT:
+        print_check("Docker installed", True, "")
+        print_check("Docker running", True, "")
+        success, _ = run_command("docker compose version")
+        print_check("Docker Compose installed", success,
+                   "Run: sudo apt-get install docker-compose-v2" if not success else "")
+        return success
+
     # Check if docker is installed
     success, _ = run_command("docker --version")
     print_check("Docker installed", success,
@@ -124,9 +245,16 @@ def check_docker_network():
     """Check if required Docker network exists"""
     print_header("Docker Network Check")
     
-    success, output = run_command("docker network ls")
+    if DOCKER_CLIENT:
+        try:
+            networks = DOCKER_CLIENT.networks('saaslocalnetwork')
+            success, output = True, ' '.join(n.get('Name', '') for n in networks)
+        except (docker_api.DockerAPIError, OSError) as e:
+            success, output = False, str(e)
+    else:
+        success, output = run_command("docker network ls")
     if success:
-        has_network = 'saaslocalnetwork' in output
+        has_network = 'saaslocalnetwork' in output.split()
         print_check("saaslocalnetwork exists", has_network,
                    "Run: docker network create saaslocalnetwork" if not has_network else "")
         return has_network
@@ -136,31 +264,35 @@ def check_containers():
     """Check if containers are running"""
     print_header("Container Status Check")
     
-    success, output = run_command("docker compose ps --format json")
-    if not success:
+    try:
+        containers = list_compose_containers()
+    except json.JSONDecodeError:
+        # Fallback to simple text parsing
+        success, output = run_command("docker compose ps")
+        print(output)
+        return "postgres" in output and "elasticsearch" in output
+
+    if containers is None:
         print_check("Unable to check containers", False,
                    "Services may not be started. Run: make updb && make up")
         return False
     
-    if not output.strip():
+    if not containers:
         print_check("No containers running", False,
                    "Services not started. Run: make updb && make up")
         return False
     
-    # Parse JSON output
     try:
-        # Docker compose ps can output multiple JSON objects
-        containers = []
-        for line in output.strip().split('\n'):
-            if line.strip():
-                containers.append(json.loads(line))
-        
         expected_services = [
             'postgres', 'elasticsearch', 'nginx', 'req-router',
             'taskservice', 'wsfe', 'settings', 'dagknows-nuxt',
             'conv-mgr', 'apigateway', 'jobsched'
         ]
         
+        record_data('containers', {
+            c.get('Service', ''): {'state': c.get('State', ''), 'health': c.get('Health', '')}
+            for c in containers
+        })
         running_services = set()
         for container in containers:
             service = container.get('Service', '')
@@ -177,16 +309,12 @@ def check_containers():
         
         # Check for missing services
         missing = set(expected_services) - running_services
+        record_data('missing', sorted(missing))
         if missing:
             print(f"\n{Colors.WARNING}Missing services: {', '.join(missing)}{Colors.ENDC}")
             return False
         
         return True
-    except json.JSONDecodeError:
-        # Fallback to simple text parsing
-        success, output = run_command("docker compose ps")
-        print(output)
-        return "postgres" in output and "elasticsearch" in output
     except Exception as e:
         print_check("Error parsing container status", False, str(e))
         return False
@@ -195,20 +323,22 @@ def check_database_containers():
     """Check database containers specifically"""
     print_header("Database Container Check")
     
-    success, output = run_command("docker compose -f db-docker-compose.yml ps --format json")
-    if not success or not output.strip():
+    try:
+        containers = list_compose_containers('db-docker-compose.yml')
+    except json.JSONDecodeError:
+        containers = None
+    if not containers:
         print_check("Database containers", False,
                    "Run: make updb")
         return False
     
     try:
-        containers = []
-        for line in output.strip().split('\n'):
-            if line.strip():
-                containers.append(json.loads(line))
-        
         postgres_ok = False
         elastic_ok = False
+        record_data('containers', {
+            c.get('Service', ''): {'state': c.get('State', ''), 'health': c.get('Health', '')}
+            for c in containers
+        })
         
         for container in containers:
             service = container.get('Service', '')
@@ -224,12 +354,11 @@ def check_database_containers():
                 print_check("Elasticsearch", running)
         
         return postgres_ok and elastic_ok
-    except:
-        # Fallback
-        return "postgres" in output and "elasticsearch" in output
+    except Exception:
+        return False
 
 def check_ports():
-    """Check if required ports are accessible"""
+    """Check that nginx answers on its ports, timing connect, TLS and first byte"""
     print_header("Port Accessibility Check")
     
     ports = {
@@ -237,15 +366,60 @@ def check_ports():
         443: "HTTPS",
     }
     
-    all_ok = True
-    for port, description in ports.items():
-        success, _ = run_command(f"nc -z localhost {port}")
-        print_check(f"Port {port} ({description})", success,
-                   "Port not accessible" if not success else "")
-        if not success:
-            all_ok = False
-    
-    return all_ok
+    if not DOCKER_API_AVAILABLE:
+        # Without health_probe.py only check that something listens
+        all_ok = True
+        results = {}
+        for port, description in ports.items():
+            start = time.monotonic()
+            success, _ = run_command(f"nc -z localhost {port}")
+            results[str(port)] = {'open': success, 'seconds': round(time.monotonic() - start, 4)}
+            print_check(f"Port {port} ({description})", success,
+                       "Port not accessible" if not success else "")
+            if not success:
+                all_ok = False
+        record_data('ports', results)
+        return all_ok
+
+    history = health_probe.LatencyHistory()
+    results = health_probe.run_front_door({port: port == 443 for port in ports})
+    data = {}
+    for result in results:
+        baseline = history.baseline(result.port)
+        regression = history.is_regression(result, baseline)
+        message = result.summary()
+        if regression:
+            message += f"; slower than usual (median {baseline['p50_ms']:.1f}ms over {baseline['samples']} checks)"
+        print_check(f"Port {result.port} ({ports[result.port]})", result.passed, message)
+        data[str(result.port)] = dict(result.to_dict(), open=result.connect_ms is not None,
+                                      seconds=round(result.total_ms / 1000, 4), baseline=baseline,
+                                      regression=regression)
+    history.record(results)
+
+    record_data('ports', data)
+    return all(result.passed for result in results)
+
+def check_health():
+    """Probe service endpoints in parallel: serving, and within latency budget"""
+    print_header("Service Health Probes")
+
+    if not DOCKER_API_AVAILABLE:
+        print(f"  {Colors.WARNING}docker_api.py not found - skipping health probes{Colors.ENDC}")
+        return True
+
+    inventory = docker_api.load_inventory(DOCKER_CLIENT, run_command)
+    results = health_probe.run_probes(health_probe.build_probes(inventory.services()))
+    record_data('probes', {
+        result.service: {
+            'target': result.target, 'passed': result.passed, 'samples': len(result.latencies),
+            'p50_ms': round(result.p50, 1), 'p95_ms': round(result.p95, 1), 'max_ms': round(result.max, 1),
+            'budget_ms': result.budget_ms, 'error': result.error,
+        }
+        for result in results
+    })
+    for result in results:
+        print_check(f"{result.service} ({result.target})", result.passed, result.summary())
+    return all(result.passed for result in results)
 
 def check_data_directories():
     """Check if data directories exist and have correct permissions"""
@@ -276,48 +450,45 @@ def check_versions():
         print(f"  Run: make migrate-versions")
         print()
 
-        # Try to detect versions from running containers
+        # Try to detect versions from running containers (one listing, not an inspect each)
         print("  Detecting from running containers...")
-        success, output = run_command("docker compose ps --format json")
-        if success and output.strip():
+        inventory = docker_api.load_inventory(DOCKER_CLIENT, run_command) if DOCKER_API_AVAILABLE else None
+        services = inventory.services() if inventory else {}
+        record_data('versions', {service: {'tag': info['tag'], 'source': 'container'}
+                                 for service, info in services.items()})
+        if not services:
+            print(f"  {Colors.WARNING}Could not detect versions{Colors.ENDC}")
+        else:
             has_latest = False
-            try:
-                for line in output.strip().split('\n'):
-                    if not line.strip():
-                        continue
-                    container = json.loads(line)
-                    service = container.get('Service', '')
-                    container_id = container.get('ID', '')
-
-                    if container_id:
-                        # Get image from docker inspect
-                        img_success, img_output = run_command(f"docker inspect --format='{{{{.Config.Image}}}}' {container_id}")
-                        if img_success:
-                            image = img_output.strip()
-                            # Extract tag
-                            tag = 'latest'
-                            if ':' in image:
-                                tag = image.rsplit(':', 1)[1]
-                            if tag == 'latest':
-                                has_latest = True
-                            print(f"  {service:.<40} {tag}")
-
-                if has_latest:
-                    print()
-                    print(f"  {Colors.WARNING}Note: Images using ':latest' tag - actual version not shown{Colors.ENDC}")
-                    print(f"  {Colors.WARNING}Run 'make migrate-versions' to enable version tracking{Colors.ENDC}")
-            except json.JSONDecodeError:
-                print(f"  {Colors.WARNING}Could not detect versions{Colors.ENDC}")
+            for service, info in services.items():
+                tag = info['tag']
+                if tag == 'latest':
+                    has_latest = True
+                print(f"  {service:.<40} {tag}")
+
+            if has_latest:
+                print()
+                print(f"  {Colors.WARNING}Note: Images using ':latest' tag - actual version not shown{Colors.ENDC}")
+                print(f"  {Colors.WARNING}Run 'make migrate-versions' to enable version tracking{Colors.ENDC}")
         return False
 
     # Read manifest
     if YAML_AVAILABLE:
         try:
-            with open(manifest_file, 'r') as f:
-                manifest = yaml.safe_load(f)
+            # Includes changes a running (or interrupted) version-manager has journaled
+            manifest = manifest_store.load_manifest(manifest_file)
 
             services = manifest.get('services', {})
             overrides = manifest.get('custom_overrides', {})
+            record_data('versions', {
+                name: {
+                    'tag': (overrides.get(name) or {}).get('tag') or info.get('current_tag', 'unknown'),
+                    'deployed_at': info.get('deployed_at', ''),
+                    'custom': bool((overrides.get(name) or {}).get('tag')),
+                    'source': 'manifest',
+                }
+                for name, info in services.items()
+            })
 
             for name, info in services.items():
                 tag = info.get('current_tag', 'unknown')
@@ -343,38 +514,37 @@ def check_versions():
         return True
 
 def get_dagknows_url():
-    """Try to get the DagKnows URL from config"""
-    try:
-        # Try to decrypt and read .env.gpg temporarily
-        result = subprocess.run("gpg -o .env.tmp -d .env.gpg",
-                              shell=True, capture_output=True,
-                              stdin=subprocess.PIPE, timeout=1)
-        
-        if os.path.exists('.env.tmp'):
-            with open('.env.tmp', 'r') as f:
-                for line in f:
-                    if line.startswith('DAGKNOWS_URL='):
-                        url = line.split('=', 1)[1].strip()
-                        os.remove('.env.tmp')
-                        return url
-            os.remove('.env.tmp')
-    except:
-        pass
-    
-    return None
+    """Try to get the DagKnows URL from config (never asks for the passphrase)"""
+    if not CONFIG_AGENT_AVAILABLE:
+        return None
+    # .env, the config agent, or .env.gpg if gpg-agent has the passphrase cached
+    config = config_agent.load_config(interactive=False, timeout=1)
+    return (config or {}).get('DAGKNOWS_URL') or None
 
-def print_summary(checks_passed):
+def print_timings(timings):
+    """One line with each check's elapsed time, in check order"""
+    parts = []
+    for key, (elapsed, timed_out) in timings.items():
+        parts.append(f"{key} >{elapsed:.1f}s (timed out)" if timed_out else f"{key} {elapsed:.1f}s")
+    print(f"Check times: {', '.join(parts)}\n")
+
+def print_summary(checks_passed, timings=None, elapsed=None, show_url=True):
     """Print final summary"""
     print_header("Summary")
     
     total = len(checks_passed)
     passed = sum(checks_passed.values())
+
+    if timings:
+        print_timings(timings)
+    if elapsed is not None:
+        print(f"Completed in {elapsed:.1f}s\n")
     
     if passed == total:
         print(f"{Colors.OKGREEN}{Colors.BOLD}All checks passed! ✓{Colors.ENDC}")
         print(f"\n{Colors.OKGREEN}Your DagKnows installation appears to be working correctly.{Colors.ENDC}\n")
         
-        dagknows_url = get_dagknows_url()
+        dagknows_url = get_dagknows_url() if show_url else None
         if dagknows_url:
             print(f"Access your instance at: {Colors.BOLD}{dagknows_url}{Colors.ENDC}")
     else:
@@ -394,33 +564,538 @@ def print_summary(checks_passed):
             print("  - Start database services: make updb")
         if not checks_passed.get('containers'):
             print("  - Start application services: make up")
+        if checks_passed.get('containers') and not checks_passed.get('health'):
+            print("  - Services are running but not answering in time: check logs with make logs")
         print()
 
+# ============================================
+# CONCURRENT CHECK RUNNER
+# ============================================
+
+# (key, check, deadline in seconds, needs Docker), in report order
+CHECKS = [
+    ('files', check_required_files, 1, False),
+    ('docker', check_docker, 5, False),
+    ('network', check_docker_network, 3, True),
+    ('data_dirs', check_data_directories, 1, True),
+    ('db_containers', check_database_containers, 3, True),
+    ('containers', check_containers, 3, True),
+    ('ports', check_ports, 3, True),
+    ('health', check_health, 6, True),
+    ('versions', check_versions, 3, True),
+]
+
+def get_status_budget():
+    """Overall budget in seconds: DK_STATUS_BUDGET, or STATUS_BUDGET"""
+    try:
+        return max(1.0, float(os.environ.get('DK_STATUS_BUDGET', STATUS_BUDGET)))
+    except ValueError:
+        return STATUS_BUDGET
+
+class CheckOutput:
+    """
+    Stand-in for sys.stdout that sends what a check thread prints to that
+    check's buffer; everything else goes to the real stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        return (getattr(self.local, 'buffer', None) or self.stream).write(text)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class CheckRun:
+    """One check running on its own (daemon) thread, so a stuck check can be abandoned"""
+
+    def __init__(self, key, check, deadline):
+        self.key = key
+        self.check = check
+        self.deadline = deadline
+        self.output = io.StringIO()
+        self.items = []  # print_check results
+        self.data = {}  # record_data values
+        self.result = False
+        self.timed_out = False
+        self.started = None
+        self.elapsed = 0.0
+        self.done = threading.Event()
+
+    def start(self, stdout):
+        def run():
+            stdout.local.buffer = self.output
+            CHECK_CONTEXT.run = self
+            try:
+                self.result = bool(self.check())
+            except Exception as e:
+                print_check(f"{self.key} check", False, f"Error: {e}")
+            finally:
+                self.elapsed = time.monotonic() - self.started
+                self.done.set()
+
+        self.started = time.monotonic()
+        threading.Thread(target=run, daemon=True).start()
+
+    def wait(self, budget_end):
+        """Wait until the check finishes, its deadline or the overall budget; True if it finished"""
+        end = min(self.started + self.deadline, budget_end)
+        return self.done.wait(max(0.0, end - time.monotonic()))
+
+def run_checks(budget=None, echo=True):
+    """
+    Run CHECKS concurrently. With echo, print each one's output in order as
+    soon as it and the checks before it are done. Returns the CheckRuns in
+    order; checks skipped because Docker is not available were never started.
+    """
+    budget_end = time.monotonic() + (budget or get_status_budget())
+    # Left installed afterwards: a check abandoned at its deadline may still
+    # print, and that must go to its own buffer, not into the report
+    if not isinstance(sys.stdout, CheckOutput):
+        sys.stdout = CheckOutput(sys.stdout)
+    stdout = sys.stdout
+    runs = [CheckRun(key, check, deadline) for key, check, deadline, _ in CHECKS]
+    needs_docker = [key for key, _, _, docker in CHECKS if docker]
+    docker_ok = False
+
+    for run in runs:
+        if run.key not in needs_docker:
+            run.start(stdout)
+
+    for run in runs:
+        if run.key in needs_docker:
+            if not docker_ok:
+                continue
+            if run.started is None:
+                for other in runs:
+                    if other.key in needs_docker:
+                        other.start(stdout)
+
+        if not run.wait(budget_end):
+            run.timed_out = True
+            run.elapsed = time.monotonic() - run.started
+            run.result = False
+        if echo:
+            stdout.stream.write(run.output.getvalue())
+            if run.timed_out:
+                print_check(f"{run.key} check", False, f"Did not finish within {run.elapsed:.1f}s")
+        if run.key == 'docker':
+            docker_ok = run.result
+    return runs
+
+def status_document(runs, elapsed, budget):
+    """Results of runs as a JSON-serializable document"""
+    checks = []
+    for run in runs:
+        if run.started is None:
+            result = 'skipped'
+        elif run.timed_out:
+            result = 'timed_out'
+        else:
+            result = 'passed' if run.result else 'failed'
+        checks.append({
+            'name': run.key,
+            'result': result,
+            'passed': result == 'passed',
+            'duration_seconds': round(run.elapsed, 4),
+            'deadline_seconds': run.deadline,
+            'items': list(run.items),
+            'data': dict(run.data),
+        })
+    ran = [check for check in checks if check['result'] != 'skipped']
+    passed = sum(1 for check in ran if check['passed'])
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'status': 'ok' if passed == len(ran) else 'failed',
+        'passed': passed,
+        'total': len(ran),
+        'duration_seconds': round(elapsed, 4),
+        'budget_seconds': budget,
+        'checks': checks,
+    }
+
+def metric_label_value(value):
+    """Escape a label value for the OpenMetrics text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def metric_labels(**labels):
+    """OpenMetrics label set, e.g. {service="wsfe",state="running"}"""
+    return '{' + ','.join(f'{key}="{metric_label_value(value)}"' for key, value in labels.items()) + '}'
+
+def format_openmetrics(document):
+    """Render a status document in the OpenMetrics text format"""
+    families = {}  # name -> (type, help, [sample lines])
+    seen = set()
+
+    def sample(name, kind, help_text, value, suffix='', **labels):
+        series = f"{name}{suffix}{metric_labels(**labels) if labels else ''}"
+        if series in seen:
+            return  # e.g. a database container reported by two checks
+        seen.add(series)
+        families.setdefault(name, (kind, help_text, []))[2].append(f"{series} {value}")
+
+    sample('dkapp_status_passed', 'gauge', 'Whether every status check passed',
+           int(document['status'] == 'ok'))
+    sample('dkapp_status_duration_seconds', 'gauge', 'Time taken by the whole status check',
+           document['duration_seconds'])
+    for check in document['checks']:
+        if check['result'] == 'skipped':
+            continue
+        sample('dkapp_check_passed', 'gauge', 'Whether a status check passed',
+               int(check['passed']), check=check['name'])
+        sample('dkapp_check_timed_out', 'gauge', 'Whether a status check missed its deadline',
+               int(check['result'] == 'timed_out'), check=check['name'])
+        sample('dkapp_check_duration_seconds', 'gauge', 'Time taken by a status check',
+               check['duration_seconds'], check=check['name'])
+
+        data = check['data']
+        for service, info in (data.get('containers') or {}).items():
+            sample('dkapp_container_running', 'gauge', 'Whether a compose service container is running',
+                   int(info['state'] == 'running'), service=service, state=info['state'], health=info['health'])
+        for service, info in (data.get('versions') or {}).items():
+            sample('dkapp_service_version', 'info', 'Version deployed for a service', 1,
+                   suffix='_info', service=service, tag=info['tag'])
+        for port, info in (data.get('ports') or {}).items():
+            sample('dkapp_port_open', 'gauge', 'Whether a local port accepts connections',
+                   int(info['open']), port=port)
+            sample('dkapp_port_check_seconds', 'gauge', 'Time taken to check a local port',
+                   info['seconds'], port=port)
+            for phase, key in (('connect', 'connect_ms'), ('tls', 'tls_ms'),
+                               ('tls_resumed', 'resumed_tls_ms'), ('first_byte', 'ttfb_ms')):
+                if info.get(key) is not None:
+                    sample('dkapp_front_door_seconds', 'gauge', 'Front-door (nginx) request time by phase',
+                           round(info[key] / 1000, 5), port=port, phase=phase)
+            if info.get('tls_resumed') is not None:
+                sample('dkapp_front_door_tls_resumed', 'gauge', 'Whether nginx resumed a TLS session',
+                       int(info['tls_resumed']), port=port)
+            if info.get('baseline'):
+                sample('dkapp_front_door_baseline_seconds', 'gauge',
+                       'Median front-door total time over the rolling history',
+                       round(info['baseline']['p50_ms'] / 1000, 5), port=port)
+        for service, info in (data.get('probes') or {}).items():
+            sample('dkapp_probe_passed', 'gauge', 'Whether a service health probe passed',
+                   int(info['passed']), service=service)
+            for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('1', 'max_ms')):
+                if info['samples']:
+                    sample('dkapp_probe_latency_seconds', 'gauge', 'Health probe latency by quantile',
+                           round(info[key] / 1000, 4), service=service, quantile=quantile)
+
+    lines = []
+    for name, (kind, help_text, samples) in families.items():
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"# HELP {name} {help_text}")
+        lines.extend(samples)
+    lines.append("# EOF")
+    return '\n'.join(lines) + '\n'
+
+# ============================================
+# RESOURCE USAGE
+# ============================================
+
+# A sampler whose newest record is older than this is reported as not running
+SAMPLER_STALE_SECONDS = 300
+
+def run_sampler():
+    """Record resource usage until interrupted ('make stats-stop' sends SIGTERM)"""
+    client = docker_api.get_client() if DOCKER_API_AVAILABLE else None
+    if not client:
+        print(f"{Colors.FAIL}Cannot reach the Docker Engine API - the sampler needs docker_api.py "
+              f"and access to the Docker socket{Colors.ENDC}")
+        return False
+    sampler = resource_stats.ResourceSampler(client)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sampler.stop())
+    print(f"{datetime.now().isoformat(timespec='seconds')} sampling project {sampler.project} "
+          f"into {resource_stats.STATS_DIR}/", flush=True)
+    try:
+        sampler.run()
+    except KeyboardInterrupt:
+        pass
+    return True
+
+def report_resources(output_format):
+    """Print top consumers and trends from the sampler's history"""
+    report = resource_stats.resource_report()
+    if output_format == 'json':
+        print(json.dumps({'generated_at': time.time(), 'services': report}, indent=2))
+        return True
+    if output_format == 'openmetrics':
+        lines = []
+        families = (
+            ('dkapp_service_cpu_percent', 'CPU use of a service over a window', 'cpu'),
+            ('dkapp_service_memory_bytes', 'Memory use of a service over a window', 'mem'),
+        )
+        for name, help_text, key in families:
+            lines += [f"# TYPE {name} gauge", f"# HELP {name} {help_text}"]
+            for service, windows in report.items():
+                for window, summary in windows.items():
+                    for stat in ('avg', 'max'):
+                        if summary:
+                            lines.append(f"{name}{metric_labels(service=service, window=window, stat=stat)} "
+                                         f"{summary[f'{key}_{stat}']}")
+        name = 'dkapp_service_io_bytes'
+        lines += [f"# TYPE {name} gauge", f"# HELP {name} Block and network I/O of a service over a window"]
+        for service, windows in report.items():
+            for window, summary in windows.items():
+                for key in ('blk_read', 'blk_write', 'net_rx', 'net_tx'):
+                    if summary:
+                        lines.append(f"{name}{metric_labels(service=service, window=window, kind=key)} {summary[key]}")
+        lines.append("# EOF")
+        print('\n'.join(lines))
+        return True
+
+    print_header("Resource Usage")
+    if not report:
+        print(f"  {Colors.WARNING}No resource history yet - start the sampler: make stats-start{Colors.ENDC}\n")
+        return False
+
+    # 'to' is the start of the newest one-minute record
+    latest = max((windows['day'] or {}).get('to', 0) for windows in report.values())
+    age = time.time() - latest - 60
+    if age > SAMPLER_STALE_SECONDS:
+        print(f"  {Colors.WARNING}Newest sample is {age / 3600:.1f}h old - is the sampler running? "
+              f"(make stats-start){Colors.ENDC}\n")
+
+    print(f"{Colors.BOLD}Services by CPU over the last hour{Colors.ENDC} "
+          f"(averages; 'vs 7d' is memory now against the weekly average)\n")
+    for line in resource_stats.format_report(report):
+        print(f"  {line}")
+    print()
+    return True
+
+# ============================================
+# STATUS DAEMON
+# ============================================
+
+def get_status_interval():
+    """Seconds between scheduled refreshes: DK_STATUS_INTERVAL, or STATUS_INTERVAL"""
+    try:
+        return max(5, int(os.environ.get('DK_STATUS_INTERVAL', STATUS_INTERVAL)))
+    except ValueError:
+        return STATUS_INTERVAL
+
+def write_snapshot(data, path=SNAPSHOT_FILE):
+    """Replace the snapshot file atomically (write to temp file, then rename)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def read_snapshot():
+    """The daemon's latest snapshot: from its socket, else from the snapshot file (None if neither)"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1)
+            sock.connect(SNAPSHOT_SOCKET)
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return json.loads(b''.join(chunks))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(SNAPSHOT_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+class SnapshotServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Answers every connection with the current snapshot, then closes it"""
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        self.status_daemon = daemon
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, SnapshotHandler)
+
+class SnapshotHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.sendall(self.server.status_daemon.snapshot)
+
+class StatusDaemon:
+    """Keeps the status snapshot current: on a schedule, and soon after container events"""
+
+    def __init__(self, interval=None):
+        self.interval = interval or get_status_interval()
+        self.snapshot = b'{}'
+        self.wake = threading.Event()
+        self.last_event = 0.0
+
+    def log(self, message):
+        print(f"{datetime.now().isoformat(timespec='seconds')} {message}", flush=True)
+
+    def refresh(self, reason):
+        start = time.monotonic()
+        budget = get_status_budget()
+        runs = run_checks(budget, echo=False)
+        document = status_document(runs, time.monotonic() - start, budget)
+        document['generated_at'] = time.time()
+        for check, run in zip(document['checks'], runs):
+            check['text'] = run.output.getvalue()
+
+        self.snapshot = json.dumps(document).encode()
+        write_snapshot(self.snapshot)
+        self.log(f"refreshed ({reason}): {document['passed']}/{document['total']} checks passed "
+                 f"in {document['duration_seconds']:.1f}s")
+
+    def watch_events(self):
+        """Hold one event subscription for the compose project, reconnecting if it drops"""
+        project = docker_api.compose_project_name()
+        # Resubscribe from the last event seen, so nothing is missed between subscriptions
+        last_seen = time.time_ns()
+        while True:
+            if not DOCKER_CLIENT:
+                time.sleep(self.interval)
+                continue
+            try:
+                conn, events = DOCKER_CLIENT.event_stream(
+                    filters={'type': ['container'], 'event': STATUS_EVENTS,
+                             'label': [f"{docker_api.COMPOSE_PROJECT_LABEL}={project}"]},
+                    since=f"{last_seen // 10**9}.{last_seen % 10**9:09d}"
+                )
+                try:
+                    for event in events:
+                        seen = event.get('timeNano') or event.get('time', 0) * 10**9
+                        if seen <= last_seen:
+                            continue  # Repeated by the resubscription
+                        last_seen = seen
+                        if event.get('Action', '').split(':')[0] in STATUS_EVENTS:
+                            self.last_event = time.monotonic()
+                            self.wake.set()
+                finally:
+                    conn.close()
+                time.sleep(EVENT_SETTLE_SECONDS)
+            except socket.timeout:
+                continue  # A quiet stream, not a failure: reconnect now
+            except Exception as e:
+                # Scheduled refreshes carry on meanwhile
+                self.log(f"event subscription failed: {e}")
+                time.sleep(self.interval)
+
+    def run(self):
+        # 'make status-daemon-stop' sends SIGTERM; exit through the cleanup below
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.refresh('startup')
+        server = SnapshotServer(SNAPSHOT_SOCKET, self)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        if DOCKER_API_AVAILABLE:
+            threading.Thread(target=self.watch_events, daemon=True).start()
+        self.log(f"serving {SNAPSHOT_SOCKET}, refreshing every {self.interval}s and on container events")
+
+        try:
+            while True:
+                if not self.wake.wait(self.interval):
+                    self.refresh('scheduled')
+                    continue
+                # Let a burst of events (e.g. 'make up') finish before checking,
+                # but a flapping container must not hold off refreshes forever
+                woken = time.monotonic()
+                while (time.monotonic() - self.last_event < EVENT_SETTLE_SECONDS
+                       and time.monotonic() - woken < self.interval):
+                    time.sleep(0.5)
+                self.wake.clear()
+                self.refresh('container event')
+        finally:
+            server.server_close()
+            if os.path.exists(SNAPSHOT_SOCKET):
+                os.remove(SNAPSHOT_SOCKET)
+
+def report_cached(output_format):
+    """
+    Report from the daemon's snapshot. Returns the exit code, or None when
+    there is no snapshot younger than three refresh intervals.
+    """
+    document = read_snapshot()
+    if not document or 'generated_at' not in document:
+        return None
+    age = time.time() - document['generated_at']
+    if age > 3 * get_status_interval():
+        return None
+
+    exit_code = 0 if document['status'] == 'ok' else 1
+    for check in document['checks']:
+        text = check.pop('text', '')
+        if output_format == 'text':
+            sys.stdout.write(text)
+    if output_format == 'json':
+        print(json.dumps(document, indent=2))
+    elif output_format == 'openmetrics':
+        sys.stdout.write(format_openmetrics(document))
+    else:
+        ran = [check for check in document['checks'] if check['result'] != 'skipped']
+        print_summary({check['name']: check['passed'] for check in ran},
+                      {check['name']: (check['duration_seconds'], check['result'] == 'timed_out') for check in ran},
+                      show_url=False)
+        print(f"Snapshot taken {age:.0f}s ago by the status daemon\n")
+    return exit_code
+
 def main():
     """Main status check workflow"""
-    print_header("DagKnows Status Check")
-    print(f"{Colors.BOLD}Checking DagKnows installation status...{Colors.ENDC}\n")
+    parser = argparse.ArgumentParser(description='Check the DagKnows installation')
+    parser.add_argument('--format', choices=['text', 'json', 'openmetrics'], default='text',
+                        help='Output format (default: text)')
+    parser.add_argument('--cached', action='store_true',
+                        help="Report the status daemon's snapshot (runs the checks if there is no recent one)")
+    parser.add_argument('--daemon', action='store_true',
+                        help='Run the status daemon: keep the snapshot current and serve it')
+    parser.add_argument('--resources', action='store_true',
+                        help='Report container resource usage (top consumers, hour/day/week trends) and exit')
+    parser.add_argument('--sampler', action='store_true',
+                        help='Run the resource sampler: record container resource usage until stopped')
+    parser.add_argument('--interval', type=int,
+                        help=f'Daemon refresh interval in seconds (default: DK_STATUS_INTERVAL or {STATUS_INTERVAL})')
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    text = args.format == 'text'
     
     # Change to script directory
     script_dir = Path(__file__).parent.absolute()
     os.chdir(script_dir)
+
+    if args.daemon:
+        StatusDaemon(args.interval).run()
+        return
+    if args.sampler or args.resources:
+        if not DOCKER_API_AVAILABLE:
+            print(f"{Colors.FAIL}docker_api.py and resource_stats.py are required{Colors.ENDC}")
+            sys.exit(1)
+        ok = run_sampler() if args.sampler else report_resources(args.format)
+        sys.exit(0 if ok else 1)
+
+    if text:
+        print_header("DagKnows Status Check")
+    if args.cached:
+        exit_code = report_cached(args.format)
+        if exit_code is not None:
+            sys.exit(exit_code)
+        if text:
+            print(f"{Colors.WARNING}No recent snapshot from the status daemon - checking now{Colors.ENDC}\n")
+    if text:
+        print(f"{Colors.BOLD}Checking DagKnows installation status...{Colors.ENDC}\n")
     
-    # Run all checks
-    checks = {}
-    
-    checks['files'] = check_required_files()
-    checks['docker'] = check_docker()
-    
-    if checks['docker']:
-        checks['network'] = check_docker_network()
-        checks['data_dirs'] = check_data_directories()
-        checks['db_containers'] = check_database_containers()
-        checks['containers'] = check_containers()
-        checks['ports'] = check_ports()
-        checks['versions'] = check_versions()
-    
-    # Print summary
-    print_summary(checks)
+    # Run all checks (concurrently; output stays in order)
+    budget = get_status_budget()
+    runs = run_checks(budget, echo=text)
+    checks = {run.key: run.result for run in runs if run.started is not None}
+    elapsed = time.monotonic() - start
+
+    if args.format == 'json':
+        print(json.dumps(status_document(runs, elapsed, budget), indent=2))
+    elif args.format == 'openmetrics':
+        sys.stdout.write(format_openmetrics(status_document(runs, elapsed, budget)))
+    else:
+        timings = {run.key: (run.elapsed, run.timed_out) for run in runs if run.started is not None}
+        print_summary(checks, timings, elapsed)
     
     # Return exit code based on results
     sys.exit(0 if all(checks.values()) else 1)
@@ -0,0 +1,287 @@
+"""
+DagKnows Config Agent
+Decrypts .env.gpg once per session and keeps the values in memory.
+
+'make up', 'make updb', 'make build', the version manager's restarts and
+reconfigure.py all need the configuration. Instead of each running gpg
+and writing a plaintext .env, the first one starts a short-lived agent: a
+background process holding the decrypted values, answering on a unix
+socket (.config-agent.sock, mode 0600, own user only). Later commands get
+the values from it and hand them to docker compose in the environment of
+the compose process, where compose reads ${VARIABLES} from. Nothing
+decrypted is written to disk.
+
+The agent exits after its TTL (DK_CONFIG_TTL seconds, default 900) or
+when stopped. An unencrypted .env, if present, is used as before.
+
+Usage (via version-manager.py, Makefile):
+    python3 version-manager.py config-agent start|stop|status
+    python3 version-manager.py with-config -- docker compose up -d
+    values = config_agent.load_config()    # .env, the agent, or one decryption
+"""
+
+import json
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+
+# ============================================
+# CONSTANTS
+# ============================================
+
+ENV_FILE = '.env'
+ENV_GPG_FILE = '.env.gpg'
+AGENT_SOCKET = '.config-agent.sock'
+
+# Seconds the agent keeps the values (override with DK_CONFIG_TTL)
+DEFAULT_TTL = 900
+
+# Passphrase file used by the auto-restart (systemd) mode to decrypt .env.gpg
+PASSPHRASE_FILE = '/root/.dkapp-passphrase'
+
+# Seconds to wait for a new agent to answer
+AGENT_START_TIMEOUT = 5
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def get_ttl() -> int:
+    """Agent TTL in seconds from DK_CONFIG_TTL, or the default"""
+    try:
+        return max(1, int(os.environ.get('DK_CONFIG_TTL', DEFAULT_TTL)))
+    except ValueError:
+        return DEFAULT_TTL
+
+
+def parse_env(text: str) -> Dict[str, str]:
+    """KEY=value lines of an env file (comments and blank lines skipped)"""
+    values = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#') and '=' in line:
+            key, value = line.split('=', 1)
+            values[key] = value
+    return values
+
+
+def read_env_file(path: str = ENV_FILE) -> Optional[Dict[str, str]]:
+    """Values of an unencrypted env file, or None if there is none"""
+    try:
+        with open(path, 'r') as f:
+            return parse_env(f.read())
+    except OSError:
+        return None
+
+
+def passphrase_file_available() -> bool:
+    """Whether the auto-restart passphrase file exists (it is root-only, so check through sudo)"""
+    try:
+        return subprocess.run(['sudo', '-n', 'test', '-f', PASSPHRASE_FILE],
+                              capture_output=True).returncode == 0
+    except OSError:
+        return False
+
+
+def decrypt(path: str = ENV_GPG_FILE, interactive: bool = True,
+            timeout: Optional[float] = None) -> Optional[Dict[str, str]]:
+    """
+    Decrypt path to memory (gpg writes to a pipe, never a file). Uses the
+    auto-restart passphrase file when readable through sudo; otherwise gpg
+    asks for the passphrase, unless not interactive (then only a passphrase
+    cached by gpg-agent works). Returns None if decryption failed.
+    """
+    if not os.path.exists(path):
+        return None
+    has_passphrase = passphrase_file_available()
+    if has_passphrase:
+        cmd = ['sudo', '-n', 'gpg', '--batch', '--quiet', '--passphrase-file', PASSPHRASE_FILE, '-d', path]
+    elif interactive:
+        cmd = ['gpg', '--quiet', '-d', path]
+    else:
+        cmd = ['gpg', '--batch', '--quiet', '--pinentry-mode', 'error', '-d', path]
+
+    try:
+        # stderr (and gpg's passphrase prompt) stays on the terminal when interactive
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, timeout=timeout,
+                                stdin=None if interactive else subprocess.DEVNULL,
+                                stderr=None if interactive and not has_passphrase else subprocess.DEVNULL)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    return parse_env(result.stdout.decode(errors='replace'))
+
+
+# ============================================
+# AGENT CLIENT
+# ============================================
+
+def request(command: str, path: str = AGENT_SOCKET) -> Optional[Dict]:
+    """Send one command ('get', 'status' or 'stop') to the agent; None if it is not running"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(2)
+            sock.connect(path)
+            sock.sendall(command.encode() + b'\n')
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return json.loads(b''.join(chunks))
+    except (OSError, ValueError):
+        return None
+
+
+def agent_values() -> Optional[Dict[str, str]]:
+    """The running agent's values, or None"""
+    reply = request('get')
+    return reply.get('values') if reply else None
+
+
+def load_config(start_agent: bool = False, interactive: bool = True,
+                timeout: Optional[float] = None) -> Optional[Dict[str, str]]:
+    """
+    The configuration: .env if present, else the agent's values, else a
+    decryption of .env.gpg (kept by a newly started agent if start_agent).
+    None if there is no configuration or it could not be decrypted.
+    """
+    values = read_env_file()
+    if values is not None:
+        return values
+    values = agent_values()
+    if values is not None:
+        return values
+    if start_agent and interactive:
+        return agent_values() if start() else None
+    return decrypt(interactive=interactive, timeout=timeout)
+
+
+# ============================================
+# AGENT
+# ============================================
+
+class AgentServer(socketserver.UnixStreamServer):
+    """Serves the values until the TTL runs out or a 'stop' request"""
+
+    def __init__(self, path: str, values: Dict[str, str], ttl: int):
+        self.values = values
+        self.expires_at = time.monotonic() + ttl
+        self.stopping = False
+        if os.path.exists(path):
+            os.remove(path)
+        # Socket file readable and writable by this user only
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(path, AgentHandler)
+        finally:
+            os.umask(old_umask)
+
+    def remaining(self) -> int:
+        return max(0, round(self.expires_at - time.monotonic()))
+
+    def serve_until_expired(self):
+        self.timeout = 1
+        while not self.stopping and self.remaining() > 0:
+            self.handle_request()
+
+
+class AgentHandler(socketserver.StreamRequestHandler):
+    timeout = 2  # A client that sends nothing must not hold up the others
+
+    def handle(self):
+        # Only this user (or root) may read the values, whatever the socket mode
+        try:
+            _, uid, _ = struct.unpack('3i', self.request.getsockopt(
+                socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+            if uid not in (os.getuid(), 0):
+                return
+        except (OSError, AttributeError):
+            pass
+
+        command = self.rfile.readline().decode(errors='replace').strip()
+        server = self.server
+        if command == 'get':
+            reply = {'values': server.values, 'expires_in': server.remaining()}
+        elif command == 'status':
+            reply = {'pid': os.getpid(), 'keys': len(server.values), 'expires_in': server.remaining()}
+        elif command == 'stop':
+            server.stopping = True
+            reply = {'stopped': True}
+        else:
+            reply = {'error': f"unknown command: {command}"}
+        self.wfile.write(json.dumps(reply).encode())
+
+
+def start(ttl: Optional[int] = None) -> bool:
+    """
+    Decrypt .env.gpg in the foreground (asking for the passphrase if needed),
+    then leave an agent serving the values in the background. True if an
+    agent is running afterwards (a running one is kept).
+    """
+    if request('status'):
+        return True
+    values = decrypt()
+    if values is None:
+        return False
+
+    ttl = ttl or get_ttl()
+    sys.stdout.flush()
+    if os.fork() > 0:
+        # Parent: wait for the agent to answer, then forget the values
+        values = None
+        deadline = time.monotonic() + AGENT_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if request('status'):
+                return True
+            time.sleep(0.05)
+        return False
+
+    # Child: detach from the terminal and serve until the TTL runs out
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    server = None
+    try:
+        server = AgentServer(AGENT_SOCKET, values, ttl)
+        server.serve_until_expired()
+    finally:
+        if server:
+            server.server_close()
+        if os.path.exists(AGENT_SOCKET):
+            os.remove(AGENT_SOCKET)
+        os._exit(0)
+
+
+def stop() -> bool:
+    """Stop the agent (dropping the values); True if one was running"""
+    return bool(request('stop'))
+
+
+def status() -> Optional[Dict]:
+    """{'pid', 'keys', 'expires_in'} of the running agent, or None"""
+    return request('status')
+
+
+def exec_with_config(argv, values: Dict[str, str]) -> bool:
+    """
+    Replace this process with argv, with values added to its environment
+    (variables already set take precedence, as they do over .env in docker
+    compose). Returns False if argv could not be started.
+    """
+    env = dict(values)
+    env.update(os.environ)
+    try:
+        os.execvpe(argv[0], argv, env)
+    except OSError:
+        return False
@@ -64,8 +64,25 @@ if [ -f "$DKAPP_DIR/versions.env" ]; then
     set -a && . "$DKAPP_DIR/versions.env" && set +a
 fi
 
-log "Starting containers with docker compose -f $COMPOSE_FILE..."
-if ! docker compose -f "$DKAPP_DIR/$COMPOSE_FILE" up -d; then
+if python3 -c "import yaml" 2>/dev/null; then
+    # Start services in dependency order, each as soon as its dependencies are
+    # up. The databases unit returns once they have started: the app unit waits
+    # for them to be healthy only for the services that use them, so the rest
+    # of the app starts while Elasticsearch is still initializing.
+    STARTUP_ARGS="--compose-file $COMPOSE_FILE"
+    if [ "$COMPOSE_FILE" = "db-docker-compose.yml" ]; then
+        STARTUP_ARGS="$STARTUP_ARGS --no-wait"
+    fi
+    log "Starting containers from $COMPOSE_FILE in dependency order..."
+    python3 "$DKAPP_DIR/version-manager.py" startup $STARTUP_ARGS 2>&1 | tee -a "$LOG_FILE"
+    STARTUP_STATUS=${PIPESTATUS[0]}
+else
+    log "Starting containers with docker compose -f $COMPOSE_FILE (PyYAML not installed)..."
+    STARTUP_STATUS=0
+    docker compose -f "$DKAPP_DIR/$COMPOSE_FILE" up -d || STARTUP_STATUS=$?
+fi
+
+if [ "$STARTUP_STATUS" -ne 0 ]; then
     log "ERROR: Failed to start containers"
     # Still clean up .env file on failure
     if [ -f "$PASSPHRASE_FILE" ] && [ -f "$ENV_FILE" ]; then
@@ -74,10 +91,6 @@ if ! docker compose -f "$DKAPP_DIR/$COMPOSE_FILE" up -d; then
     exit 1
 fi
 
-# Wait for containers to stabilize before starting log capture (15s to ensure all services are ready)
-log "Waiting for containers to stabilize..."
-sleep 15
-
 # Start background log capture
 LOG_CAPTURE_DIR="$DKAPP_DIR/logs"
 DBLOG_CAPTURE_DIR="$DKAPP_DIR/dblogs"
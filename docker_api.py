@@ -0,0 +1,731 @@
+"""
+DagKnows Docker API Client
+Minimal Docker Engine API client over the local unix socket.
+
+Used by version-manager.py, migrate-to-versioned.py and check-status.py so
+that listing containers, inspecting images, pulling, and reading events or
+logs happen over one reused HTTP connection instead of spawning a 'docker'
+CLI process (often wrapped in 'sg docker -c') per operation.
+
+Compose itself has no Engine API equivalent, so 'docker compose up/down'
+still goes through the CLI. When the socket is not accessible (e.g. the
+docker group is not active in this session), get_client() returns None and
+callers fall back to the CLI with the 'sg docker' wrapper.
+"""
+
+import base64
+import http.client
+import json
+import os
+import re
+import shlex
+import socket
+import struct
+import subprocess
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+
+# ============================================
+# CONSTANTS
+# ============================================
+
+DOCKER_SOCKET = '/var/run/docker.sock'
+DEFAULT_TIMEOUT = 30
+PULL_TIMEOUT = 300
+
+# stream() default: use the client timeout (an explicit None blocks without a timeout)
+_CLIENT_TIMEOUT = object()
+
+# Compose labels on every container it creates
+COMPOSE_PROJECT_LABEL = 'com.docker.compose.project'
+COMPOSE_SERVICE_LABEL = 'com.docker.compose.service'
+
+
+class DockerAPIError(Exception):
+    """Error response from the Docker Engine API"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+# ============================================
+# CONNECTION
+# ============================================
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection that talks to a unix domain socket"""
+
+    def __init__(self, socket_path: str, timeout: float = DEFAULT_TIMEOUT):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+    def abort(self):
+        """Close from another thread, waking up a read blocked on this connection"""
+        if self.sock:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.close()
+
+
+def get_socket_path() -> Optional[str]:
+    """Resolve the Docker socket path, honouring DOCKER_HOST=unix://... (None for TCP hosts)"""
+    docker_host = os.environ.get('DOCKER_HOST', '')
+    if docker_host:
+        if docker_host.startswith('unix://'):
+            return docker_host[len('unix://'):]
+        return None
+    return DOCKER_SOCKET
+
+
+def split_registry(image: str) -> str:
+    """Return the registry host of an image reference (docker.io when none is given)"""
+    first = image.split('/', 1)[0]
+    if '/' in image and ('.' in first or ':' in first or first == 'localhost'):
+        return first
+    return 'docker.io'
+
+
+def parse_health(status: str) -> str:
+    """Extract the health state from a container list Status ('Up 5 minutes (healthy)')"""
+    match = re.search(r'\((healthy|unhealthy|health: starting)\)', status or '')
+    if not match:
+        return ''
+    return 'starting' if match.group(1) == 'health: starting' else match.group(1)
+
+
+def compose_project_name(directory: str = None) -> str:
+    """Compose project name: COMPOSE_PROJECT_NAME, or the normalized directory name"""
+    name = os.environ.get('COMPOSE_PROJECT_NAME')
+    if name:
+        return name
+    directory = directory or os.getcwd()
+    return re.sub(r'[^a-z0-9_-]', '', os.path.basename(os.path.abspath(directory)).lower())
+
+
+# ============================================
+# CLIENT
+# ============================================
+
+class DockerClient:
+    """
+    Docker Engine API client. Each thread keeps one keep-alive connection;
+    unbounded streams (events, followed logs) use a dedicated connection.
+    """
+
+    def __init__(self, socket_path: str = DOCKER_SOCKET, timeout: float = DEFAULT_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._auth_cache = {}
+
+    # ------------------
+    # Transport
+    # ------------------
+
+    def _connection(self) -> UnixHTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = UnixHTTPConnection(self.socket_path, self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def _send(self, conn: UnixHTTPConnection, method: str, path: str, params: Dict = None,
+              body: Dict = None, headers: Dict = None) -> http.client.HTTPResponse:
+        query = {k: v for k, v in (params or {}).items() if v is not None}
+        url = f"{path}?{urlencode(query)}" if query else path
+        payload = json.dumps(body).encode() if body is not None else None
+        all_headers = {'Content-Type': 'application/json'} if payload else {}
+        all_headers.update(headers or {})
+        conn.request(method, url, body=payload, headers=all_headers)
+        response = conn.getresponse()
+        if response.status >= 400:
+            raw = response.read().decode(errors='replace')
+            try:
+                message = json.loads(raw).get('message', raw)
+            except (json.JSONDecodeError, AttributeError):
+                message = raw
+            raise DockerAPIError(response.status, message.strip())
+        return response
+
+    def request(self, method: str, path: str, params: Dict = None, body: Dict = None,
+                headers: Dict = None) -> bytes:
+        """Send a request on this thread's keep-alive connection and return the full body"""
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                response = self._send(conn, method, path, params, body, headers)
+                return response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError,
+                    http.client.CannotSendRequest, http.client.ResponseNotReady):
+                # Daemon closed the idle keep-alive connection; reconnect once
+                self._reset_connection()
+                if attempt:
+                    raise
+            except DockerAPIError:
+                raise
+            except Exception:
+                self._reset_connection()
+                raise
+        return b''
+
+    def request_json(self, method: str, path: str, params: Dict = None, body: Dict = None,
+                     headers: Dict = None):
+        """Send a request and decode the JSON response"""
+        raw = self.request(method, path, params, body, headers)
+        return json.loads(raw) if raw else None
+
+    def stream(self, method: str, path: str, params: Dict = None, headers: Dict = None,
+               timeout: Optional[float] = _CLIENT_TIMEOUT,
+               body: Dict = None) -> Tuple[UnixHTTPConnection, http.client.HTTPResponse]:
+        """
+        Open a dedicated connection for a streamed response. Caller closes the
+        connection. timeout=None reads without a timeout (unbounded streams).
+        """
+        if timeout is _CLIENT_TIMEOUT:
+            timeout = self.timeout
+        conn = UnixHTTPConnection(self.socket_path, timeout)
+        try:
+            return conn, self._send(conn, method, path, params, body=body, headers=headers)
+        except Exception:
+            conn.close()
+            raise
+
+    @staticmethod
+    def _json_lines(response: http.client.HTTPResponse) -> Iterator[Dict]:
+        for line in response:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    # ------------------
+    # System
+    # ------------------
+
+    def ping(self) -> bool:
+        """True if the daemon answers /_ping"""
+        try:
+            return self.request('GET', '/_ping') == b'OK'
+        except (OSError, DockerAPIError, http.client.HTTPException):
+            return False
+
+    def version(self) -> Dict:
+        return self.request_json('GET', '/version')
+
+    # ------------------
+    # Containers
+    # ------------------
+
+    def containers(self, all: bool = False, filters: Dict[str, List[str]] = None) -> List[Dict]:
+        """List containers (equivalent of 'docker ps')"""
+        params = {'all': 'true' if all else None,
+                  'filters': json.dumps(filters) if filters else None}
+        return self.request_json('GET', '/containers/json', params) or []
+
+    def inspect_container(self, container: str) -> Dict:
+        return self.request_json('GET', f"/containers/{quote(container, safe='')}/json")
+
+    def compose_ps(self, project: str = None, all: bool = False) -> List[Dict]:
+        """
+        List a compose project's containers in the same shape as
+        'docker compose ps --format json' (ID, Name, Service, State, Health, Image).
+        """
+        project = project or compose_project_name()
+        result = []
+        for c in self.containers(all=all, filters={'label': [f"{COMPOSE_PROJECT_LABEL}={project}"]}):
+            labels = c.get('Labels') or {}
+            names = c.get('Names') or ['']
+            image = c.get('Image', '')
+            if image.startswith('sha256:'):
+                # The tag has moved to another image since the container was
+                # created; the reference it was created from is in its config
+                try:
+                    image = (self.inspect_container(c.get('Id', '')).get('Config') or {}).get('Image') or image
+                except (DockerAPIError, OSError):
+                    pass
+            result.append({
+                'ID': c.get('Id', '')[:12],
+                'Name': names[0].lstrip('/'),
+                'Service': labels.get(COMPOSE_SERVICE_LABEL, ''),
+                'State': c.get('State', ''),
+                'Health': parse_health(c.get('Status', '')),
+                'Status': c.get('Status', ''),
+                'Image': image,
+                'ImageID': c.get('ImageID', ''),
+                'IPAddress': container_ip(c),
+                'Project': project
+            })
+        return result
+
+    def logs(self, container: str, tail: int = 100, since: int = None, follow: bool = False,
+             timestamps: bool = False) -> Iterator[Tuple[str, str]]:
+        """Yield (stream, line) log lines, demultiplexing stdout/stderr frames"""
+        tty = (self.inspect_container(container).get('Config') or {}).get('Tty', False)
+        params = {'stdout': 1, 'stderr': 1, 'tail': tail, 'since': since,
+                  'follow': 1 if follow else None, 'timestamps': 1 if timestamps else None}
+        conn, response = self.stream('GET', f"/containers/{quote(container, safe='')}/logs", params,
+                                     timeout=None if follow else self.timeout)
+        try:
+            if tty:
+                for line in response:
+                    yield 'stdout', line.decode(errors='replace').rstrip('\n')
+                return
+            buffer = {1: b'', 2: b''}
+            while True:
+                header = response.read(8)
+                if len(header) < 8:
+                    break
+                stream_type, size = struct.unpack('>BxxxL', header)
+                data = buffer.get(stream_type, b'') + response.read(size)
+                *lines, buffer[stream_type] = data.split(b'\n')
+                name = 'stderr' if stream_type == 2 else 'stdout'
+                for line in lines:
+                    yield name, line.decode(errors='replace')
+            for stream_type, rest in buffer.items():
+                if rest:
+                    yield ('stderr' if stream_type == 2 else 'stdout'), rest.decode(errors='replace')
+        finally:
+            conn.close()
+
+    def stats_stream(self, container: str) -> Tuple[UnixHTTPConnection, Iterator[Dict]]:
+        """
+        Open a container's resource usage stream (one sample about every
+        second). Returns (connection, samples); calling connection.abort()
+        from another thread ends the iteration. Ends when the container stops.
+        """
+        conn, response = self.stream('GET', f"/containers/{quote(container, safe='')}/stats",
+                                     {'stream': 'true'}, timeout=None)
+        return conn, self._json_lines(response)
+
+    def remove_container(self, container: str, force: bool = True):
+        """Remove a container (like 'docker rm -f')"""
+        self.request('DELETE', f"/containers/{quote(container, safe='')}", {'force': 'true' if force else None})
+
+    def exec_run(self, container: str, cmd: List[str], timeout: float = DEFAULT_TIMEOUT) -> Tuple[int, str]:
+        """
+        Run a command in a running container (like 'docker exec') and wait for it.
+
+        Returns:
+            Tuple of (exit_code, combined stdout/stderr)
+        """
+        created = self.request_json('POST', f"/containers/{quote(container, safe='')}/exec",
+                                    body={'Cmd': cmd, 'AttachStdout': True, 'AttachStderr': True})
+        exec_id = created['Id']
+        conn, response = self.stream('POST', f"/exec/{exec_id}/start", timeout=timeout,
+                                     body={'Detach': False, 'Tty': False})
+        output = b''
+        try:
+            while True:
+                header = response.read(8)
+                if len(header) < 8:
+                    break
+                _, size = struct.unpack('>BxxxL', header)
+                output += response.read(size)
+        finally:
+            conn.close()
+
+        exit_code = self.request_json('GET', f"/exec/{exec_id}/json").get('ExitCode')
+        return (exit_code if exit_code is not None else -1), output.decode(errors='replace')
+
+    # ------------------
+    # Images
+    # ------------------
+
+    def images(self, filters: Dict[str, List[str]] = None, shared_size: bool = False) -> List[Dict]:
+        """List local images with Id, RepoTags, RepoDigests and Size (and SharedSize if requested)"""
+        params = {'digests': 'true', 'filters': json.dumps(filters) if filters else None,
+                  'shared-size': 'true' if shared_size else None}
+        return self.request_json('GET', '/images/json', params) or []
+
+    def remove_image(self, image: str) -> List[Dict]:
+        """Remove a tag, or the image once no tag is left (like 'docker rmi'); fails if a container uses it"""
+        return self.request_json('DELETE', f"/images/{quote(image, safe='')}") or []
+
+    def inspect_image(self, image: str) -> Dict:
+        return self.request_json('GET', f"/images/{quote(image, safe='')}/json")
+
+    def registry_auth(self, registry: str) -> Optional[str]:
+        """
+        Build an X-Registry-Auth header from the credentials 'docker login' stored
+        (config.json auths or a credential helper). None means anonymous.
+        """
+        if registry in self._auth_cache:
+            return self._auth_cache[registry]
+
+        header = None
+        config_dir = os.environ.get('DOCKER_CONFIG', os.path.expanduser('~/.docker'))
+        try:
+            with open(os.path.join(config_dir, 'config.json'), 'r') as f:
+                config = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            config = {}
+
+        username = password = None
+        encoded = (config.get('auths', {}).get(registry) or {}).get('auth')
+        helper = (config.get('credHelpers') or {}).get(registry) or config.get('credsStore')
+        if encoded:
+            try:
+                username, password = base64.b64decode(encoded).decode().split(':', 1)
+            except (ValueError, UnicodeDecodeError):
+                pass
+        elif helper:
+            try:
+                result = subprocess.run([f"docker-credential-{helper}", 'get'], input=registry,
+                                        capture_output=True, text=True, timeout=10)
+                if result.returncode == 0:
+                    creds = json.loads(result.stdout)
+                    username, password = creds.get('Username'), creds.get('Secret')
+            except (OSError, subprocess.TimeoutExpired, json.JSONDecodeError):
+                pass
+
+        if username and password:
+            payload = {'username': username, 'password': password, 'serveraddress': registry}
+            header = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        self._auth_cache[registry] = header
+        return header
+
+    def forget_auth(self, registry: str = None):
+        """Drop cached credentials (e.g. after 'docker logout' cleared an expired token)"""
+        if registry:
+            self._auth_cache.pop(registry, None)
+        else:
+            self._auth_cache.clear()
+
+    def pull(self, image: str, progress: Callable[[Dict], None] = None) -> Tuple[bool, str]:
+        """
+        Pull an image, streaming the JSON progress messages to the progress callback.
+
+        Returns:
+            Tuple of (success, output) where output is the final status or error,
+            matching what 'docker pull' would print last.
+        """
+        headers = {}
+        auth = self.registry_auth(split_registry(image))
+        if auth:
+            headers['X-Registry-Auth'] = auth
+
+        try:
+            conn, response = self.stream('POST', '/images/create', {'fromImage': image},
+                                         headers=headers, timeout=PULL_TIMEOUT)
+        except DockerAPIError as e:
+            return False, e.message
+        except OSError as e:
+            return False, str(e)
+
+        last_status = ''
+        try:
+            for message in self._json_lines(response):
+                if 'error' in message:
+                    detail = (message.get('errorDetail') or {}).get('message') or message['error']
+                    return False, detail
+                if progress:
+                    progress(message)
+                if 'status' in message and 'id' not in message:
+                    last_status = message['status']
+        except (OSError, http.client.HTTPException) as e:
+            return False, str(e)
+        finally:
+            conn.close()
+
+        return True, last_status
+
+    def tag(self, image: str, repository: str, tag: str):
+        """Tag a local image as repository:tag"""
+        self.request('POST', f"/images/{quote(image, safe='')}/tag", {'repo': repository, 'tag': tag})
+
+    def save(self, names: List[str]) -> Tuple[UnixHTTPConnection, http.client.HTTPResponse]:
+        """
+        Stream several images as one 'docker save' tarball (layers shared between
+        images are written once). Caller reads the response and closes the connection.
+        """
+        query = urlencode([('names', name) for name in names])
+        conn = UnixHTTPConnection(self.socket_path, PULL_TIMEOUT)
+        try:
+            conn.request('GET', f"/images/get?{query}")
+            response = conn.getresponse()
+            if response.status >= 400:
+                raise DockerAPIError(response.status, response.read().decode(errors='replace').strip())
+            return conn, response
+        except Exception:
+            conn.close()
+            raise
+
+    def load(self, fileobj) -> Tuple[bool, List[str]]:
+        """
+        Load images from a tar stream (sent chunked, never buffered in full).
+
+        Returns:
+            Tuple of (success, messages) with the daemon's 'Loaded image' lines or error
+        """
+        conn = UnixHTTPConnection(self.socket_path, PULL_TIMEOUT)
+        try:
+            try:
+                conn.request('POST', '/images/load?quiet=1', body=fileobj,
+                             headers={'Content-Type': 'application/x-tar'}, encode_chunked=True)
+            except (BrokenPipeError, ConnectionResetError) as e:
+                # The daemon stopped reading the stream early; its response says why
+                try:
+                    response = conn.getresponse()
+                except (OSError, http.client.HTTPException):
+                    return False, [str(e)]
+            else:
+                response = conn.getresponse()
+            if response.status >= 400:
+                raw = response.read().decode(errors='replace')
+                try:
+                    return False, [json.loads(raw).get('message', raw).strip()]
+                except (json.JSONDecodeError, AttributeError):
+                    return False, [raw.strip()]
+            messages = []
+            for message in self._json_lines(response):
+                if 'error' in message:
+                    return False, messages + [message['error']]
+                if message.get('stream', '').strip():
+                    messages.append(message['stream'].strip())
+            return True, messages
+        except (OSError, http.client.HTTPException) as e:
+            return False, [str(e)]
+        finally:
+            conn.close()
+
+    # ------------------
+    # Networks and events
+    # ------------------
+
+    def networks(self, name: str = None) -> List[Dict]:
+        params = {'filters': json.dumps({'name': [name]}) if name else None}
+        return self.request_json('GET', '/networks', params) or []
+
+    def connect_network(self, network: str, container: str, aliases: List[str] = None):
+        """Attach a container to a network (like 'docker network connect --alias ...')"""
+        self.request('POST', f"/networks/{quote(network, safe='')}/connect",
+                     body={'Container': container, 'EndpointConfig': {'Aliases': aliases or []}})
+
+    def disconnect_network(self, network: str, container: str):
+        """Detach a container from a network (like 'docker network disconnect')"""
+        self.request('POST', f"/networks/{quote(network, safe='')}/disconnect",
+                     body={'Container': container, 'Force': False})
+
+    def event_stream(self, filters: Dict[str, List[str]] = None, since: int = None,
+                     until: int = None) -> Tuple[UnixHTTPConnection, Iterator[Dict]]:
+        """
+        Open an events subscription. Returns (connection, events); calling
+        connection.abort() from another thread ends the iteration.
+        """
+        params = {'filters': json.dumps(filters) if filters else None, 'since': since, 'until': until}
+        conn, response = self.stream('GET', '/events', params, timeout=None)
+        return conn, self._json_lines(response)
+
+    def events(self, filters: Dict[str, List[str]] = None, since: int = None,
+               until: int = None) -> Iterator[Dict]:
+        """Yield daemon events. Without 'until' the stream stays open until closed."""
+        conn, events = self.event_stream(filters, since, until)
+        try:
+            yield from events
+        finally:
+            conn.close()
+
+
+# ============================================
+# SHARED CLIENT
+# ============================================
+
+_client = None
+_client_checked = False
+
+
+def get_client() -> Optional[DockerClient]:
+    """
+    Return a shared DockerClient if the Engine API socket is usable by this
+    process, otherwise None (callers then fall back to the docker CLI).
+    """
+    global _client, _client_checked
+    if _client_checked:
+        return _client
+    _client_checked = True
+
+    socket_path = get_socket_path()
+    if not socket_path or not os.path.exists(socket_path):
+        return None
+    if not os.access(socket_path, os.R_OK | os.W_OK):
+        return None
+
+    client = DockerClient(socket_path)
+    if client.ping():
+        _client = client
+    return _client
+
+
+# ============================================
+# INVENTORY
+# ============================================
+
+# CLI fallback: one process each, however many containers or images there are
+INVENTORY_CONTAINERS_CLI = "docker inspect $(docker ps -aq --filter label={label}={project}) 2>/dev/null"
+INVENTORY_IMAGES_CLI = "docker image inspect $(docker image ls -q --no-trunc | sort -u) 2>/dev/null"
+INVENTORY_SOME_IMAGES_CLI = "docker image inspect {images} 2>/dev/null"
+
+
+def split_reference(image: str) -> Tuple[str, str]:
+    """
+    Split 'repo:tag' into (repo, tag); the tag defaults to 'latest' (registry
+    ports are not tags). A pinned digest ('repo:tag@sha256:...') is dropped.
+    """
+    image = image.split('@', 1)[0]
+    name, _, last = image.rpartition('/')
+    if ':' in last:
+        last, tag = last.split(':', 1)
+        return (f"{name}/{last}" if name else last), tag
+    return image, 'latest'
+
+
+class Inventory:
+    """
+    The compose project's containers and every local image, each from a
+    single listing: replaces an inspect per service or container.
+
+    containers are shaped like compose_ps() (ID, Name, Service, State,
+    Health, Image, ImageID, IPAddress); images like the /images/json
+    listing (Id, RepoTags, RepoDigests, Size).
+    """
+
+    def __init__(self, containers: List[Dict] = None, images: List[Dict] = None):
+        self.containers = containers or []
+        self.images = images or []
+        self._by_id = {image.get('Id', ''): image for image in self.images}
+        self._by_ref = {}
+        for image in self.images:
+            for ref in image.get('RepoTags') or []:
+                self._by_ref[ref] = image
+
+    def image(self, image: str) -> Dict:
+        """A local image by 'repo:tag' reference or ID ({} if not present)"""
+        return self._by_ref.get(image) or self._by_id.get(image) or {}
+
+    def image_id(self, image: str) -> str:
+        return self.image(image).get('Id', '')
+
+    def repo_digests(self, image: str) -> List[str]:
+        return self.image(image).get('RepoDigests') or []
+
+    def services(self) -> Dict[str, Dict]:
+        """
+        Per compose service: container (ID, state, health, IP address),
+        configured image reference split into image and tag, image ID and
+        repo digests.
+        """
+        result = {}
+        for container in self.containers:
+            image, tag = split_reference(container.get('Image', ''))
+            result[container.get('Service', '')] = {
+                'container_id': container.get('ID', ''),
+                'state': container.get('State', ''),
+                'health': container.get('Health', ''),
+                'image': image,
+                'tag': tag,
+                'image_id': container.get('ImageID', ''),
+                'repo_digests': self.repo_digests(container.get('ImageID', '')),
+                'ip': container.get('IPAddress', ''),
+            }
+        return result
+
+
+def container_ip(data: Dict) -> str:
+    """First IP address of a container listing or inspect document ('' if none)"""
+    networks = (data.get('NetworkSettings') or {}).get('Networks') or {}
+    return next((n.get('IPAddress') for n in networks.values() if n and n.get('IPAddress')), '')
+
+
+def container_from_inspect(data: Dict) -> Dict:
+    """Shape a 'docker inspect' container document like a compose_ps() entry"""
+    state = data.get('State') or {}
+    config = data.get('Config') or {}
+    return {
+        'ID': data.get('Id', '')[:12],
+        'Name': data.get('Name', '').lstrip('/'),
+        'Service': (config.get('Labels') or {}).get(COMPOSE_SERVICE_LABEL, ''),
+        'State': state.get('Status', ''),
+        'Health': (state.get('Health') or {}).get('Status', ''),
+        'Image': config.get('Image', ''),
+        'ImageID': data.get('Image', ''),
+        'IPAddress': container_ip(data),
+    }
+
+
+def load_inventory(client: Optional[DockerClient] = None,
+                   run: Callable[[str], Tuple[bool, str]] = None,
+                   project: str = None, containers: bool = True,
+                   images: List[str] = None) -> Inventory:
+    """
+    Build an Inventory with two Engine API requests, or without a client,
+    two docker CLI calls made through run(command) -> (success, output)
+    (callers pass their own runner, e.g. one adding the 'sg docker' wrapper).
+    Given image references, only those images are inspected instead of
+    listing every local image. Parts that cannot be listed are left empty.
+    """
+    project = project or compose_project_name()
+    container_list, image_list = [], []
+
+    if client:
+        try:
+            if containers:
+                container_list = client.compose_ps(project, all=True)
+            if images is None:
+                image_list = client.images()
+        except (DockerAPIError, OSError):
+            pass
+        for image in images or []:
+            try:
+                image_list.append(client.inspect_image(image))
+            except (DockerAPIError, OSError):
+                continue
+        return Inventory(container_list, image_list)
+
+    if run is None:
+        return Inventory()
+
+    def inspect(command: str) -> List[Dict]:
+        success, output = run(command)
+        if not success or not output.strip():
+            return []
+        try:
+            return json.loads(output) or []
+        except json.JSONDecodeError:
+            return []
+
+    if containers:
+        command = INVENTORY_CONTAINERS_CLI.format(label=COMPOSE_PROJECT_LABEL, project=project)
+        container_list = [container_from_inspect(c) for c in inspect(command)]
+    if images is None:
+        inspected = inspect(INVENTORY_IMAGES_CLI)
+    elif images:
+        inspected = inspect(INVENTORY_SOME_IMAGES_CLI.format(images=' '.join(shlex.quote(i) for i in images)))
+    else:
+        inspected = []
+    image_list = [
+        {'Id': i.get('Id', ''), 'RepoTags': i.get('RepoTags') or [], 'RepoDigests': i.get('RepoDigests') or [],
+         'Size': i.get('Size', 0)}
+        for i in inspected
+    ]
+    return Inventory(container_list, image_list)
@@ -0,0 +1,250 @@
+"""
+DagKnows ECR Cache
+On-disk TTL cache for 'aws ecr-public describe-images' responses.
+
+Shared by version-manager.py and migrate-to-versioned.py so tag resolution
+and ECR access checks reuse one listing per repository instead of starting
+the AWS CLI for every lookup.
+
+Each repository is stored as .ecr-cache/<repository>.json. Entries older
+than the TTL (DK_ECR_CACHE_TTL seconds, default 300) are refetched;
+if a refetch fails the stale entry is still served.
+
+Usage (via version-manager.py):
+    python3 version-manager.py ecr-cache                     # Show cache status
+    python3 version-manager.py ecr-cache --clear             # Invalidate all entries
+    python3 version-manager.py ecr-cache --clear --service=S # Invalidate one repository
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+
+# ============================================
+# CONSTANTS
+# ============================================
+
+CACHE_DIR = '.ecr-cache'
+DEFAULT_TTL = 300
+ECR_PUBLIC_REGION = 'us-east-1'
+PAGE_SIZE = 1000
+
+# Repository used to probe ECR access (its listing doubles as a cache warm-up)
+ACCESS_PROBE_REPOSITORY = 'req_router'
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def get_ttl() -> int:
+    """Cache TTL in seconds from DK_ECR_CACHE_TTL, or the default"""
+    try:
+        return int(os.environ.get('DK_ECR_CACHE_TTL', DEFAULT_TTL))
+    except ValueError:
+        return DEFAULT_TTL
+
+
+def cache_path(repository: str) -> str:
+    """Path of the cache file for a repository"""
+    return os.path.join(CACHE_DIR, f"{repository}.json")
+
+
+def fingerprint(image_details: List[Dict]) -> str:
+    """Stable hash of a listing's digests and tags, used to detect changes between fetches"""
+    entries = sorted(
+        (d.get('imageDigest', ''), ','.join(sorted(d.get('imageTags', []))))
+        for d in image_details
+    )
+    return hashlib.sha256(json.dumps(entries).encode()).hexdigest()[:16]
+
+
+def semantic_tags(tags: List[str]) -> List[str]:
+    """Return the semantic version tags (no 'latest' or sha tags), highest first"""
+    result = [t for t in tags if t != 'latest' and not t.startswith('sha')]
+    try:
+        result.sort(
+            key=lambda x: [int(p) if p.isdigit() else p for p in x.replace('-', '.').split('.')],
+            reverse=True
+        )
+    except (ValueError, TypeError):
+        pass
+    return result
+
+
+def load_entry(repository: str) -> Optional[Dict]:
+    """Load a cached entry, or None if missing or unreadable"""
+    try:
+        with open(cache_path(repository), 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def save_entry(repository: str, entry: Dict):
+    """Write a cache entry atomically (write to temp file, then rename)"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = cache_path(repository)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+
+
+# ============================================
+# FETCHING
+# ============================================
+
+def fetch_image_details(repository: str) -> Tuple[bool, List[Dict], str, int]:
+    """
+    Fetch every image of a repository from ECR Public, following nextToken.
+
+    Returns:
+        Tuple of (success, image_details, error_output, page_count)
+    """
+    image_details = []
+    next_token = None
+    pages = 0
+
+    while True:
+        cmd = (f"aws ecr-public describe-images --repository-name {repository} "
+               f"--region {ECR_PUBLIC_REGION} --output json --no-paginate --max-results {PAGE_SIZE}")
+        if next_token:
+            cmd += f" --next-token {next_token}"
+
+        try:
+            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=30)
+        except subprocess.TimeoutExpired:
+            return False, [], "Command timed out", pages
+        except Exception as e:
+            return False, [], str(e), pages
+
+        if result.returncode != 0:
+            return False, [], (result.stderr.strip() or result.stdout.strip()), pages
+
+        try:
+            data = json.loads(result.stdout)
+        except json.JSONDecodeError:
+            return False, [], f"Failed to parse ECR response for {repository}", pages
+
+        pages += 1
+        image_details.extend(data.get('imageDetails', []))
+        next_token = data.get('nextToken')
+        if not next_token:
+            return True, image_details, "", pages
+
+
+def describe_images(repository: str, refresh: bool = False) -> Tuple[bool, List[Dict], str]:
+    """
+    Return the imageDetails listing for a repository, served from cache when fresh.
+
+    Args:
+        repository: ECR repository name (e.g., 'req_router')
+        refresh: Ignore the TTL and refetch
+
+    Returns:
+        Tuple of (success, image_details, error_output). A stale entry is
+        returned with success=True if a refetch fails.
+    """
+    entry = load_entry(repository)
+    if entry and not refresh and time.time() - entry.get('fetched_at', 0) < get_ttl():
+        return True, entry.get('imageDetails', []), ""
+
+    success, image_details, error, pages = fetch_image_details(repository)
+    if not success:
+        if entry:
+            return True, entry.get('imageDetails', []), error
+        return False, [], error
+
+    new_fingerprint = fingerprint(image_details)
+    now = time.time()
+    changed_at = now
+    if entry and entry.get('fingerprint') == new_fingerprint:
+        changed_at = entry.get('changed_at', now)
+
+    save_entry(repository, {
+        'repository': repository,
+        'fetched_at': now,
+        'changed_at': changed_at,
+        'fingerprint': new_fingerprint,
+        'pages': pages,
+        'imageDetails': image_details
+    })
+    return True, image_details, ""
+
+
+def prefetch(repositories: List[str], workers: int = 4) -> Dict[str, bool]:
+    """Warm the cache for several repositories concurrently. Returns success per repository."""
+    if not repositories:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(repositories))) as executor:
+        results = executor.map(lambda repo: describe_images(repo)[0], repositories)
+        return dict(zip(repositories, results))
+
+
+def check_access() -> Tuple[bool, str]:
+    """
+    Check that the AWS CLI can reach the ECR Public API.
+    Uses the cached probe repository listing when fresh, so the check
+    is free after the first call and warms the cache otherwise.
+
+    Returns:
+        Tuple of (accessible, error_output)
+    """
+    success, _, error = describe_images(ACCESS_PROBE_REPOSITORY)
+    return success, error
+
+
+# ============================================
+# INVALIDATION AND STATUS
+# ============================================
+
+def invalidate(repository: str = None) -> int:
+    """Remove cached entries (one repository, or all). Returns the number removed."""
+    if repository:
+        paths = [cache_path(repository)]
+    elif os.path.isdir(CACHE_DIR):
+        paths = [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR) if name.endswith('.json')]
+    else:
+        paths = []
+
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def cache_status() -> List[Dict]:
+    """Summarize cached entries: repository, age, freshness, image count and pages"""
+    if not os.path.isdir(CACHE_DIR):
+        return []
+
+    ttl = get_ttl()
+    now = time.time()
+    status = []
+    for name in sorted(os.listdir(CACHE_DIR)):
+        if not name.endswith('.json'):
+            continue
+        entry = load_entry(name[:-len('.json')])
+        if not entry:
+            continue
+        age = now - entry.get('fetched_at', 0)
+        status.append({
+            'repository': entry.get('repository', name[:-len('.json')]),
+            'age': age,
+            'fresh': age < ttl,
+            'images': len(entry.get('imageDetails', [])),
+            'pages': entry.get('pages', 0),
+            'unchanged_for': now - entry.get('changed_at', now)
+        })
+    return status
@@ -0,0 +1,526 @@
+"""
+DagKnows Health Probes
+Active checks that services are serving requests, not just running.
+
+Each probed service is sampled PROBE_SAMPLES times through its real
+endpoint (settings and taskservice /health, req-router and the UI through
+nginx, Elasticsearch cluster health, a Postgres protocol handshake).
+Services are probed in parallel; the samples for one target reuse a
+keep-alive connection from a shared pool, so the latency figures measure
+requests rather than connection setup. Every service declares its own pass
+criteria in PROBES: accepted status codes, an optional JSON field check and
+a p95 latency budget.
+
+Front-door probes time what a client of nginx sees on ports 80 and 443:
+TCP connect, TLS handshake, whether a second handshake resumes the session
+(ssl_session_cache / session tickets) and time to first byte of a request.
+Their timings are appended to a rolling LatencyHistory so a slow front door
+shows up against its own recent median.
+
+Usage (via version-manager.py, check-status.py):
+    probes = build_probes(inventory.services())
+    for result in run_probes(probes):
+        print(result.service, result.passed, result.summary())
+
+    history = LatencyHistory()
+    results = run_front_door({80: False, 443: True})
+    for result in results:
+        print(result.port, result.passed, result.summary(), history.baseline(result.port))
+    history.record(results)
+"""
+
+import http.client
+import json
+import math
+import os
+import socket
+import ssl
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+
+# ============================================
+# CONSTANTS
+# ============================================
+
+# Requests per probed service (override with DK_PROBE_SAMPLES)
+PROBE_SAMPLES = 5
+
+# Seconds before a single request counts as failed
+PROBE_TIMEOUT = 5
+
+# Per compose service: how to reach it and what counts as serving.
+#   via:       'container' (its IP on the compose network), 'nginx' (through
+#              the front end, as users reach it) or 'localhost' (published port)
+#   port:      the service's own port (for 'nginx', used to probe one
+#              container directly, e.g. a blue/green candidate)
+#   status:    accepted (lowest, highest) HTTP status; through nginx anything
+#              below 500 means the upstream answered (e.g. 401 without a session)
+#   json:      field -> accepted values in the response body
+#   budget_ms: p95 latency limit
+PROBES = {
+    'settings': {'kind': 'http', 'via': 'container', 'port': 2225, 'path': '/health',
+                 'status': (200, 299), 'budget_ms': 500},
+    'taskservice': {'kind': 'http', 'via': 'container', 'port': 2235, 'path': '/health',
+                    'status': (200, 299), 'budget_ms': 500},
+    'req-router': {'kind': 'http', 'via': 'nginx', 'port': 8888, 'path': '/api/tasks',
+                   'status': (200, 499), 'budget_ms': 1000},
+    'dagknows-nuxt': {'kind': 'http', 'via': 'nginx', 'port': 3000, 'path': '/',
+                      'status': (200, 499), 'budget_ms': 1500},
+    'elasticsearch': {'kind': 'http', 'via': 'localhost', 'port': 9200, 'path': '/_cluster/health',
+                      'status': (200, 299), 'json': {'status': ('green', 'yellow')}, 'budget_ms': 1000},
+    'postgres': {'kind': 'postgres', 'via': 'container', 'port': 5432, 'budget_ms': 250},
+}
+
+# Postgres wire protocol: 3.0 startup message for user/database 'postgres'
+POSTGRES_PROTOCOL = 196608
+
+# Seconds before a front-door connection, handshake or response counts as failed
+FRONT_DOOR_TIMEOUT = 2
+
+# Front-door samples kept per port, and where
+FRONT_DOOR_HISTORY = 500
+FRONT_DOOR_HISTORY_FILE = '.front-door-history.json'
+
+# A front-door sample is a regression when its total time exceeds both
+# REGRESSION_FACTOR x the history's median and REGRESSION_FLOOR_MS
+REGRESSION_FACTOR = 2.0
+REGRESSION_FLOOR_MS = 50
+REGRESSION_MIN_SAMPLES = 5
+
+
+class ProbeError(Exception):
+    """A probe request failed or did not meet its criteria"""
+
+
+def get_probe_samples(samples: Optional[int] = None) -> int:
+    """Samples per service: argument, DK_PROBE_SAMPLES, or PROBE_SAMPLES"""
+    if samples is None:
+        try:
+            samples = int(os.environ.get('DK_PROBE_SAMPLES', PROBE_SAMPLES))
+        except ValueError:
+            samples = PROBE_SAMPLES
+    return max(1, samples)
+
+
+def nginx_endpoint(conf: str = 'nginx.conf') -> Tuple[str, int]:
+    """
+    (scheme, port) users reach nginx on: HTTPS when the mounted config
+    terminates TLS (port 80 only redirects then), plain HTTP otherwise.
+    """
+    try:
+        with open(conf, 'r') as f:
+            if 'ssl_certificate' in f.read():
+                return 'https', 443
+    except OSError:
+        pass
+    return 'http', 80
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 if empty)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+# ============================================
+# CONNECTION POOL
+# ============================================
+
+class ConnectionPool:
+    """Idle keep-alive connections per (scheme, host, port), shared by all probe threads"""
+
+    def __init__(self, timeout: float = PROBE_TIMEOUT):
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        # Local services use self-signed certificates; only reachability is checked
+        self._tls = ssl.create_default_context()
+        self._tls.check_hostname = False
+        self._tls.verify_mode = ssl.CERT_NONE
+
+    def get(self, scheme: str, host: str, port: int) -> http.client.HTTPConnection:
+        with self._lock:
+            idle = self._idle.get((scheme, host, port))
+            if idle:
+                return idle.pop()
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._tls)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def put(self, scheme: str, host: str, port: int, conn: http.client.HTTPConnection):
+        with self._lock:
+            self._idle.setdefault((scheme, host, port), []).append(conn)
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+# ============================================
+# PROBES
+# ============================================
+
+class ProbeResult:
+    """Outcome of sampling one service"""
+
+    def __init__(self, service: str, target: str, budget_ms: float):
+        self.service = service
+        self.target = target
+        self.budget_ms = budget_ms
+        self.latencies = []  # ms, successful samples
+        self.error = ''
+
+    @property
+    def passed(self) -> bool:
+        return not self.error and bool(self.latencies) and self.p95 <= self.budget_ms
+
+    @property
+    def p50(self) -> float:
+        return percentile(self.latencies, 50)
+
+    @property
+    def p95(self) -> float:
+        return percentile(self.latencies, 95)
+
+    @property
+    def max(self) -> float:
+        return max(self.latencies) if self.latencies else 0.0
+
+    def summary(self) -> str:
+        """e.g. 'p50 4ms p95 9ms max 9ms (5 samples)', plus the reason it failed"""
+        parts = []
+        if self.latencies:
+            parts.append(f"p50 {self.p50:.0f}ms p95 {self.p95:.0f}ms max {self.max:.0f}ms "
+                         f"({len(self.latencies)} samples)")
+        if self.error:
+            parts.append(self.error)
+        elif self.latencies and self.p95 > self.budget_ms:
+            parts.append(f"over {self.budget_ms:.0f}ms budget")
+        return '; '.join(parts)
+
+
+class Probe:
+    """One service's endpoint and pass criteria"""
+
+    def __init__(self, service: str, spec: Dict, scheme: str = 'http', host: str = '', port: int = 0):
+        self.service = service
+        self.spec = spec
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.unreachable = ''  # Reason no address could be determined
+
+    @property
+    def target(self) -> str:
+        host = self.host or self.service
+        if self.spec['kind'] == 'postgres':
+            return f"postgres://{host}:{self.port}"
+        return f"{self.scheme}://{host}:{self.port}{self.spec.get('path', '/')}"
+
+    def _http_sample(self, pool: ConnectionPool):
+        conn = pool.get(self.scheme, self.host, self.port)
+        try:
+            conn.request('GET', self.spec.get('path', '/'), headers={'Accept': 'application/json'})
+            response = conn.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError) as e:
+            conn.close()
+            raise ProbeError(str(e) or type(e).__name__)
+
+        if response.will_close:
+            conn.close()
+        else:
+            pool.put(self.scheme, self.host, self.port, conn)
+
+        low, high = self.spec.get('status', (200, 299))
+        if not low <= response.status <= high:
+            raise ProbeError(f"HTTP {response.status}")
+        for field, accepted in (self.spec.get('json') or {}).items():
+            try:
+                value = json.loads(body).get(field)
+            except (ValueError, AttributeError):
+                raise ProbeError("invalid JSON response")
+            if value not in accepted:
+                raise ProbeError(f"{field}: {value}")
+
+    def _postgres_sample(self, timeout: float):
+        """
+        Startup handshake as pg_isready does it: any authentication request
+        means the server accepts connections; an error response (e.g. 'the
+        database system is starting up') means it does not.
+        """
+        params = b'user\0postgres\0database\0postgres\0\0'
+        startup = struct.pack('!II', 8 + len(params), POSTGRES_PROTOCOL) + params
+        try:
+            with socket.create_connection((self.host, self.port), timeout=timeout) as sock:
+                sock.sendall(startup)
+                reply = sock.recv(1024)
+        except OSError as e:
+            raise ProbeError(str(e) or type(e).__name__)
+
+        if reply[:1] == b'R':
+            return
+        if reply[:1] == b'E':
+            fields = dict((f[:1], f[1:]) for f in reply[5:].split(b'\0') if f)
+            raise ProbeError(fields.get(b'M', b'error response').decode(errors='replace'))
+        raise ProbeError("unexpected response")
+
+    def sample(self, pool: ConnectionPool) -> float:
+        """Make one request; returns its latency in ms, raises ProbeError on failure"""
+        start = time.monotonic()
+        if self.spec['kind'] == 'postgres':
+            self._postgres_sample(pool.timeout)
+        else:
+            self._http_sample(pool)
+        return (time.monotonic() - start) * 1000
+
+    def run(self, pool: ConnectionPool, samples: int) -> ProbeResult:
+        """Sample the service, stopping at the first failure"""
+        result = ProbeResult(self.service, self.target, self.spec['budget_ms'])
+        if self.unreachable:
+            result.error = self.unreachable
+            return result
+        for _ in range(samples):
+            try:
+                result.latencies.append(self.sample(pool))
+            except ProbeError as e:
+                result.error = str(e)
+                break
+        return result
+
+
+def build_probes(services: Dict[str, Dict], only: List[str] = None,
+                 nginx_conf: str = 'nginx.conf') -> List[Probe]:
+    """
+    Probes for the services in PROBES (or only those listed), addressed using
+    services, an Inventory.services() mapping (container state and IP).
+    """
+    nginx_scheme, nginx_port = nginx_endpoint(nginx_conf)
+    probes = []
+    for name, spec in PROBES.items():
+        if only is not None and name not in only:
+            continue
+        via = spec['via']
+        if via == 'nginx':
+            probe = Probe(name, spec, nginx_scheme, 'localhost', nginx_port)
+            if (services.get('nginx') or {}).get('state') != 'running':
+                probe.unreachable = 'nginx is not running'
+        elif via == 'localhost':
+            probe = Probe(name, spec, 'http', 'localhost', spec['port'])
+        else:
+            info = services.get(name) or {}
+            probe = Probe(name, spec, 'http', info.get('ip', ''), spec['port'])
+            if info.get('state') != 'running':
+                probe.unreachable = f"container {info.get('state') or 'not created'}"
+            elif not probe.host:
+                probe.unreachable = 'no container IP address'
+        probes.append(probe)
+    return probes
+
+
+def container_probe(service: str, ip: str) -> Probe:
+    """Probe one container of service directly on its own port, bypassing nginx"""
+    spec = PROBES[service]
+    probe = Probe(service, spec, 'http', ip, spec['port'])
+    if not ip:
+        probe.unreachable = 'no container IP address'
+    return probe
+
+
+def run_probes(probes: List[Probe], samples: Optional[int] = None,
+               pool: Optional[ConnectionPool] = None) -> List[ProbeResult]:
+    """Run all probes in parallel; results are in the order of probes"""
+    if not probes:
+        return []
+    samples = get_probe_samples(samples)
+    own_pool = pool is None
+    pool = pool or ConnectionPool()
+    try:
+        with ThreadPoolExecutor(max_workers=len(probes)) as executor:
+            return list(executor.map(lambda probe: probe.run(pool, samples), probes))
+    finally:
+        if own_pool:
+            pool.close()
+
+
+# ============================================
+# FRONT DOOR
+# ============================================
+
+class FrontDoorResult:
+    """Timings of one request to a local nginx port, in ms (None where not reached)"""
+
+    def __init__(self, port: int, tls: bool):
+        self.port = port
+        self.tls = tls
+        self.connect_ms = None
+        self.tls_ms = None
+        self.resumed = None  # Whether a second handshake resumed the TLS session
+        self.resumed_tls_ms = None
+        self.ttfb_ms = None
+        self.status = None  # HTTP status of the response
+        self.error = ''
+
+    @property
+    def passed(self) -> bool:
+        return not self.error
+
+    @property
+    def total_ms(self) -> float:
+        return (self.connect_ms or 0) + (self.tls_ms or 0) + (self.ttfb_ms or 0)
+
+    def summary(self) -> str:
+        """e.g. 'connect 0.1ms, TLS 2.3ms (resumed 0.8ms), first byte 1.2ms (HTTP 301)'"""
+        parts = []
+        if self.connect_ms is not None:
+            parts.append(f"connect {self.connect_ms:.1f}ms")
+        if self.tls_ms is not None:
+            tls = f"TLS {self.tls_ms:.1f}ms"
+            if self.resumed:
+                tls += f" (resumed {self.resumed_tls_ms:.1f}ms)"
+            elif self.resumed is False:
+                tls += " (no session resumption)"
+            parts.append(tls)
+        if self.ttfb_ms is not None:
+            parts.append(f"first byte {self.ttfb_ms:.1f}ms (HTTP {self.status})")
+        if self.error:
+            parts.append(self.error)
+        return ', '.join(parts)
+
+    def to_dict(self) -> Dict:
+        return {
+            'connect_ms': self.connect_ms, 'tls_ms': self.tls_ms, 'tls_resumed': self.resumed,
+            'resumed_tls_ms': self.resumed_tls_ms, 'ttfb_ms': self.ttfb_ms, 'status': self.status,
+            'total_ms': round(self.total_ms, 2), 'error': self.error,
+        }
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.monotonic() - start) * 1000, 2)
+
+
+def _first_response(sock: socket.socket, host: str, path: str) -> int:
+    """Send a GET and wait for the first bytes of the response; returns its HTTP status"""
+    request = (f"GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: dkapp-status\r\n"
+               f"Connection: close\r\n\r\n")
+    sock.sendall(request.encode())
+    first = sock.recv(1024)
+    if not first:
+        raise ProbeError("connection closed without a response")
+    status_line = first.split(b'\r\n', 1)[0].split()
+    if len(status_line) < 2 or not status_line[0].startswith(b'HTTP/') or not status_line[1].isdigit():
+        raise ProbeError("not an HTTP response")
+    return int(status_line[1])
+
+
+def probe_front_door(port: int, tls: bool, host: str = 'localhost', path: str = '/',
+                     timeout: float = FRONT_DOOR_TIMEOUT) -> FrontDoorResult:
+    """
+    Connect to host:port, handshake if tls, and time the first byte of a GET.
+    For TLS a second connection offers the first one's session, showing
+    whether nginx resumes sessions (an abbreviated handshake).
+    """
+    result = FrontDoorResult(port, tls)
+    context = None
+    if tls:
+        # Local certificates are often self-signed; only the timings matter here
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+    try:
+        start = time.monotonic()
+        sock = socket.create_connection((host, port), timeout=timeout)
+        result.connect_ms = _elapsed_ms(start)
+        session = None
+        try:
+            if tls:
+                start = time.monotonic()
+                sock = context.wrap_socket(sock, server_hostname=host)
+                result.tls_ms = _elapsed_ms(start)
+            start = time.monotonic()
+            result.status = _first_response(sock, host, path)
+            result.ttfb_ms = _elapsed_ms(start)
+            if tls:
+                # Read after the response so TLS 1.3 session tickets have arrived
+                session = sock.session
+        finally:
+            sock.close()
+
+        if session is not None:
+            start = time.monotonic()
+            with socket.create_connection((host, port), timeout=timeout) as raw:
+                with context.wrap_socket(raw, server_hostname=host, session=session) as resumed:
+                    result.resumed_tls_ms = _elapsed_ms(start)
+                    result.resumed = resumed.session_reused
+    except ssl.SSLError as e:
+        result.error = f"TLS handshake failed: {e.reason or e}"
+    except ProbeError as e:
+        result.error = str(e)
+    except OSError as e:
+        result.error = str(e) or type(e).__name__
+    return result
+
+
+def run_front_door(ports: Dict[int, bool], host: str = 'localhost') -> List[FrontDoorResult]:
+    """Probe each port (-> whether it speaks TLS) in parallel; results in the order of ports"""
+    with ThreadPoolExecutor(max_workers=max(1, len(ports))) as executor:
+        return list(executor.map(lambda port: probe_front_door(port, ports[port], host), ports))
+
+
+class LatencyHistory:
+    """Rolling front-door timings per port, kept in a JSON file (newest last)"""
+
+    def __init__(self, path: str = FRONT_DOOR_HISTORY_FILE, limit: int = FRONT_DOOR_HISTORY):
+        self.path = path
+        self.limit = limit
+
+    def load(self) -> Dict[str, List[Dict]]:
+        try:
+            with open(self.path, 'r') as f:
+                history = json.load(f)
+            return history if isinstance(history, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def samples(self, port: int) -> List[Dict]:
+        return self.load().get(str(port), [])
+
+    def baseline(self, port: int) -> Optional[Dict[str, float]]:
+        """Median and p95 total time of the port's successful samples (None if too few)"""
+        totals = [sample['total_ms'] for sample in self.samples(port) if not sample.get('error')]
+        if len(totals) < REGRESSION_MIN_SAMPLES:
+            return None
+        return {'p50_ms': percentile(totals, 50), 'p95_ms': percentile(totals, 95), 'samples': len(totals)}
+
+    def is_regression(self, result: FrontDoorResult, baseline: Optional[Dict[str, float]]) -> bool:
+        """Whether a successful result is well above the port's usual total time"""
+        if not baseline or not result.passed:
+            return False
+        return result.total_ms > max(REGRESSION_FLOOR_MS, REGRESSION_FACTOR * baseline['p50_ms'])
+
+    def record(self, results: List[FrontDoorResult]):
+        """Append results, keep the newest limit samples per port and rewrite the file atomically"""
+        history = self.load()
+        now = time.time()
+        for result in results:
+            samples = history.setdefault(str(result.port), [])
+            samples.append(dict(result.to_dict(), time=round(now, 1)))
+            del samples[:-self.limit]
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(history, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass  # History is best effort (e.g. read-only checkout)
@@ -0,0 +1,249 @@
+"""
+DagKnows Image Bundles
+Single-file image bundles for air-gapped installs.
+
+A bundle is a compressed tar stream holding a small metadata member
+(dkapp-bundle.json: services, tags and digests from the manifest) followed
+by the members of one 'docker save' of every image. Saving all images in
+one call stores each layer shared between them only once.
+
+Both directions stream: export copies members from the docker save stream
+straight into the compressor, and import feeds them from the decompressor
+straight into docker load through a pipe, so no full tarball is ever
+staged on disk. zstd is used when the binary is installed (multi-threaded),
+otherwise gzip at a fast compression level.
+
+Usage (via version-manager.py):
+    python3 version-manager.py bundle-export --output=FILE   # Write bundle ('-' for stdout)
+    python3 version-manager.py bundle-import --input=FILE    # Load bundle ('-' for stdin)
+"""
+
+import gzip
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import threading
+from typing import BinaryIO, Callable, Dict, Optional, Tuple
+
+
+# ============================================
+# CONSTANTS
+# ============================================
+
+BUNDLE_FORMAT = 1
+METADATA_MEMBER = 'dkapp-bundle.json'
+CHUNK_SIZE = 1024 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# gzip level 1 keeps compression close to disk speed
+GZIP_LEVEL = 1
+ZSTD_LEVEL = 3
+
+
+class BundleError(Exception):
+    """Malformed or unreadable bundle"""
+
+
+class ImageStreamClosed(BundleError):
+    """docker load stopped reading the image stream (usually because loading failed)"""
+
+
+# ============================================
+# COMPRESSION
+# ============================================
+
+def choose_compression(requested: str = 'auto') -> str:
+    """Resolve 'auto' to zstd when the binary is installed, else gzip"""
+    if requested == 'auto':
+        return 'zstd' if shutil.which('zstd') else 'gzip'
+    if requested == 'zstd' and not shutil.which('zstd'):
+        raise BundleError("zstd compression requested but the 'zstd' binary is not installed")
+    return requested
+
+
+def default_bundle_name(compression: str, stamp: str) -> str:
+    """Default output file name, e.g. dkapp-bundle-20250101-120000.tar.zst"""
+    extension = 'zst' if compression == 'zstd' else 'gz'
+    return f"dkapp-bundle-{stamp}.tar.{extension}"
+
+
+class CompressedWriter:
+    """Write-only file object compressing to a path, or to stdout for '-'"""
+
+    def __init__(self, path: str, compression: str):
+        self.path = path
+        self.compression = compression
+        # __stdout__: callers may point sys.stdout at stderr to keep progress out of the stream
+        self._file = sys.__stdout__.buffer if path == '-' else open(path, 'wb')
+        self._process = None
+
+        if compression == 'zstd':
+            self._process = subprocess.Popen(
+                ['zstd', '-q', '-c', '-T0', f'-{ZSTD_LEVEL}'],
+                stdin=subprocess.PIPE, stdout=self._file, bufsize=CHUNK_SIZE
+            )
+            self._stream = self._process.stdin
+        else:
+            self._stream = gzip.GzipFile(fileobj=self._file, mode='wb', compresslevel=GZIP_LEVEL, mtime=0)
+
+    def write(self, data: bytes) -> int:
+        return self._stream.write(data)
+
+    def close(self):
+        """Flush the compressor and wait for it; raises BundleError if zstd failed"""
+        self._stream.close()
+        if self._process and self._process.wait() != 0:
+            raise BundleError(f"zstd exited with status {self._process.returncode}")
+        if self._file is not sys.__stdout__.buffer:
+            self._file.close()
+        else:
+            self._file.flush()
+
+
+class DecompressedReader:
+    """Read-only file object decompressing a path, or stdin for '-' (format from magic bytes)"""
+
+    def __init__(self, path: str):
+        self._file = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        self._process = None
+        self._feeder = None
+
+        magic = self._file.peek(4)[:4]
+        if magic.startswith(GZIP_MAGIC):
+            self.compression = 'gzip'
+            self._stream = gzip.GzipFile(fileobj=self._file, mode='rb')
+        elif magic == ZSTD_MAGIC:
+            if not shutil.which('zstd'):
+                raise BundleError("Bundle is zstd-compressed but the 'zstd' binary is not installed")
+            self.compression = 'zstd'
+            self._process = subprocess.Popen(['zstd', '-q', '-d', '-c'], stdin=subprocess.PIPE,
+                                             stdout=subprocess.PIPE, bufsize=CHUNK_SIZE)
+            # Feed from a thread: bytes already buffered by peek() must reach zstd too
+            self._feeder = threading.Thread(target=self._feed, daemon=True)
+            self._feeder.start()
+            self._stream = self._process.stdout
+        else:
+            raise BundleError("Not a dkapp bundle (expected gzip or zstd data)")
+
+    def _feed(self):
+        try:
+            shutil.copyfileobj(self._file, self._process.stdin, CHUNK_SIZE)
+        except (BrokenPipeError, ValueError):
+            pass
+        finally:
+            try:
+                self._process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def read(self, size: int = -1) -> bytes:
+        return self._stream.read(size)
+
+    def close(self):
+        self._stream.close()
+        if self._process:
+            self._process.wait()
+        if self._file is not sys.stdin.buffer:
+            self._file.close()
+
+
+# ============================================
+# BUNDLE STREAMS
+# ============================================
+
+def write_bundle(output, metadata: Dict, image_stream: BinaryIO) -> Dict:
+    """
+    Write metadata plus every member of a 'docker save' stream into output.
+
+    Returns:
+        Dict with 'members' and 'bytes' (uncompressed image data copied)
+    """
+    stats = {'members': 0, 'bytes': 0}
+    with tarfile.open(fileobj=output, mode='w|', bufsize=CHUNK_SIZE, copybufsize=CHUNK_SIZE) as bundle:
+        payload = json.dumps(metadata, indent=2).encode()
+        info = tarfile.TarInfo(METADATA_MEMBER)
+        info.size = len(payload)
+        info.mtime = int(metadata.get('created_ts', 0))
+        bundle.addfile(info, io.BytesIO(payload))
+
+        with tarfile.open(fileobj=image_stream, mode='r|', bufsize=CHUNK_SIZE) as images:
+            for member in images:
+                bundle.addfile(member, images.extractfile(member) if member.isfile() else None)
+                stats['members'] += 1
+                stats['bytes'] += member.size
+    return stats
+
+
+def read_bundle(source) -> Tuple[Dict, BinaryIO, Callable[[], Dict]]:
+    """
+    Open a bundle stream and read its metadata.
+
+    Returns:
+        Tuple of (metadata, image_stream, finish). image_stream yields the
+        'docker save' tarball for docker load, rebuilt on the fly through a
+        pipe; finish() joins the writer and returns its stats (raises
+        BundleError if it failed, ImageStreamClosed if the reader went away).
+    """
+    bundle = tarfile.open(fileobj=source, mode='r|', bufsize=CHUNK_SIZE)
+    first = bundle.next()
+    if first is None or first.name != METADATA_MEMBER:
+        raise BundleError(f"Bundle does not start with {METADATA_MEMBER}")
+    try:
+        metadata = json.load(bundle.extractfile(first))
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise BundleError(f"Unreadable bundle metadata: {e}")
+    if metadata.get('format') != BUNDLE_FORMAT:
+        raise BundleError(f"Unsupported bundle format: {metadata.get('format')}")
+
+    read_fd, write_fd = os.pipe()
+    result = {'members': 0, 'bytes': 0, 'error': None, 'closed': False}
+
+    def pump():
+        try:
+            with os.fdopen(write_fd, 'wb', buffering=CHUNK_SIZE) as pipe, \
+                    tarfile.open(fileobj=pipe, mode='w|', bufsize=CHUNK_SIZE, copybufsize=CHUNK_SIZE) as images:
+                # next() rather than iteration: iterating would revisit the metadata member
+                member = bundle.next()
+                while member is not None:
+                    images.addfile(member, bundle.extractfile(member) if member.isfile() else None)
+                    result['members'] += 1
+                    result['bytes'] += member.size
+                    member = bundle.next()
+        except BrokenPipeError:
+            result['error'] = 'docker load stopped reading the image stream'
+            result['closed'] = True
+        except (tarfile.TarError, OSError, EOFError) as e:
+            result['error'] = str(e)
+
+    writer = threading.Thread(target=pump, daemon=True)
+    writer.start()
+
+    def finish() -> Dict:
+        writer.join()
+        if result['closed']:
+            raise ImageStreamClosed(result['error'])
+        if result['error']:
+            raise BundleError(result['error'])
+        return result
+
+    return metadata, os.fdopen(read_fd, 'rb', buffering=CHUNK_SIZE), finish
+
+
+def format_size(num_bytes: Optional[int]) -> str:
+    """Human-readable size (e.g., '1.4 GB')"""
+    if num_bytes is None:
+        return 'unknown'
+    if num_bytes < 1024:
+        return f"{num_bytes} B"
+    size = num_bytes / 1024
+    for unit in ('KB', 'MB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
@@ -0,0 +1,351 @@
+"""
+DagKnows Manifest Store
+Crash-safe, bounded storage for version-manifest.yaml.
+
+Saving appends only what changed (the keys that differ from the last save)
+to an fsync'd journal in .version-backups/, instead of rewriting the
+manifest and copying it into a new backup every time. The manifest itself
+is rewritten by compaction, once per command (at exit) or every
+COMPACT_EVERY changes: it is written to a temporary file and renamed over
+the old one, so a crash leaves the old or the new manifest, never a
+partial one. Loading replays any journal entries a crash left behind.
+
+Before compaction replaces the manifest, the previous version is kept as
+.version-backups/version-manifest.yaml.<timestamp>, a hard link to a
+content-addressed copy in .version-backups/objects/, so identical backups
+share one file. Retention keeps the newest KEEP_RECENT backups plus the
+last one of each of the KEEP_DAYS most recent days that have backups.
+
+Usage (via version-manager.py, check-status.py):
+    store = ManifestStore('version-manifest.yaml', '.version-backups')
+    manifest = store.load()
+    store.record(manifest)     # After each change: O(change)
+    store.compact(manifest)    # Rewrite the manifest, prune backups
+"""
+
+import copy
+import fcntl
+import hashlib
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import yaml
+
+
+# ============================================
+# CONSTANTS
+# ============================================
+
+JOURNAL_FILE = 'manifest-journal.jsonl'
+OBJECTS_DIR = 'objects'
+LOCK_FILE = '.lock'
+
+# Rewrite the manifest after this many journaled changes even mid-command
+COMPACT_EVERY = 50
+
+# Backup retention: newest N, plus the last backup of each of the most recent days
+KEEP_RECENT = 20
+KEEP_DAYS = 30
+
+BACKUP_STAMP = '%Y%m%d%H%M%S'
+
+# libyaml's parser when PyYAML was built with it (several times faster)
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+# ============================================
+# CHANGE SETS
+# ============================================
+
+def diff(old: Dict, new: Dict, path: List = None) -> List[List]:
+    """
+    Changes turning old into new: [path, value] sets a value, [path] deletes it.
+    Nested mappings are compared key by key; other values are replaced whole.
+    """
+    path = path or []
+    changes = []
+    for key in old:
+        if key not in new:
+            changes.append([path + [key]])
+    for key, value in new.items():
+        if key not in old:
+            changes.append([path + [key], value])
+        elif old[key] != value:
+            if isinstance(old[key], dict) and isinstance(value, dict):
+                changes.extend(diff(old[key], value, path + [key]))
+            else:
+                changes.append([path + [key], value])
+    return changes
+
+
+def apply(document: Dict, changes: List[List]):
+    """Apply changes from diff() to document in place"""
+    for change in changes:
+        path = change[0]
+        parent = document
+        for key in path[:-1]:
+            if not isinstance(parent.get(key), dict):
+                parent[key] = {}
+            parent = parent[key]
+        if len(change) == 1:
+            parent.pop(path[-1], None)
+        else:
+            parent[path[-1]] = change[1]
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def dump_manifest(manifest: Dict) -> bytes:
+    """Serialize a manifest the way version-manifest.yaml has always been written"""
+    return yaml.dump(manifest, default_flow_style=False, sort_keys=False).encode()
+
+
+def fsync_directory(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path: str, data: bytes):
+    """Replace path with data via a temporary file and rename"""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+# ============================================
+# STORE
+# ============================================
+
+class ManifestStore:
+    """Journaled storage for one manifest file"""
+
+    def __init__(self, path: str = 'version-manifest.yaml', backup_dir: str = '.version-backups'):
+        self.path = os.path.abspath(path)
+        self.backup_dir = os.path.abspath(backup_dir)
+        self.journal_path = os.path.join(self.backup_dir, JOURNAL_FILE)
+        self.name = os.path.basename(self.path)
+        self.backup_pattern = re.compile(re.escape(self.name) + r'\.(\d{14})$')
+        # State as of the last load/record; changes are computed against it
+        self.saved = {}
+        self.pending = 0
+        self.discarded = 0
+
+    @contextmanager
+    def _locked(self):
+        """Serialize writers (e.g., update-safe and a concurrent 'make pull')"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        with open(os.path.join(self.backup_dir, LOCK_FILE), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_file(self) -> bytes:
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return b''
+
+    def _read_journal(self):
+        """Journal header and entries; a torn last line (crash mid-append) is dropped"""
+        try:
+            with open(self.journal_path, 'r') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return None, []
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+        if not records or 'base' not in records[0]:
+            return None, []
+        return records[0], records[1:]
+
+    def load(self) -> Optional[Dict]:
+        """
+        Read the manifest, replaying changes journaled since it was last
+        written. Returns None if there is no manifest.
+
+        Journal entries only apply to the manifest version they were recorded
+        against; if the file was edited or restored by hand since, it wins and
+        the entries are discarded (counted in self.discarded).
+        """
+        data = self._read_file()
+        manifest = yaml.load(data, Loader=YAML_LOADER) if data else None
+        header, entries = self._read_journal()
+
+        self.pending = 0
+        self.discarded = 0
+        if entries:
+            if header['base'] == content_hash(data):
+                manifest = manifest if isinstance(manifest, dict) else {}
+                for entry in entries:
+                    apply(manifest, entry.get('changes', []))
+                self.pending = len(entries)
+            else:
+                self.discarded = len(entries)
+
+        self.saved = copy.deepcopy(manifest) if isinstance(manifest, dict) else {}
+        return manifest
+
+    def record(self, manifest: Dict) -> int:
+        """
+        Journal the changes since the last load/record, compacting every
+        COMPACT_EVERY entries. Returns the number of changed keys.
+        """
+        changes = diff(self.saved, manifest)
+        if not changes:
+            return 0
+
+        with self._locked():
+            header, entries = self._read_journal()
+            base = content_hash(self._read_file())
+            if header is None or header.get('base') != base:
+                # No journal yet, or the manifest was rewritten since: start one for this version
+                header, entries = {'base': base, 'created': time.time()}, []
+                write_atomic(self.journal_path, (json.dumps(header) + '\n').encode())
+
+            entry = {'seq': len(entries) + 1, 'time': time.time(), 'changes': changes}
+            with open(self.journal_path, 'a') as f:
+                f.write(json.dumps(entry, default=str) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.saved = copy.deepcopy(manifest)
+        self.pending = entry['seq']
+        if self.pending >= COMPACT_EVERY:
+            self.compact(manifest)
+        return len(changes)
+
+    def compact(self, manifest: Dict) -> bool:
+        """
+        Write manifest over the manifest file atomically (backing up the
+        version it replaces) and clear the journal. Returns True if written.
+        """
+        data = dump_manifest(manifest)
+        with self._locked():
+            current = self._read_file()
+            written = current != data
+            if written:
+                if current:
+                    self._store_backup(current)
+                write_atomic(self.path, data)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self.prune()
+
+        self.saved = copy.deepcopy(manifest)
+        self.pending = 0
+        return written
+
+    def flush(self, manifest: Dict):
+        """Journal outstanding changes and compact if anything is journaled"""
+        self.record(manifest)
+        if self.pending:
+            self.compact(manifest)
+        elif self.discarded:
+            with self._locked():
+                header, _ = self._read_journal()
+                if header and header.get('base') != content_hash(self._read_file()):
+                    os.remove(self.journal_path)
+            self.discarded = 0
+
+    # ============================================
+    # BACKUPS
+    # ============================================
+
+    def _store_backup(self, data: bytes) -> str:
+        """
+        Keep data as <name>.<timestamp>, hard-linked to its content-addressed
+        object. Nothing new is stored if the newest backup has the same content.
+        """
+        objects_dir = os.path.join(self.backup_dir, OBJECTS_DIR)
+        os.makedirs(objects_dir, exist_ok=True)
+        object_path = os.path.join(objects_dir, content_hash(data))
+        if not os.path.exists(object_path):
+            write_atomic(object_path, data)
+
+        backups = self.list_backups()
+        if backups:
+            newest = os.path.join(self.backup_dir, backups[-1])
+            try:
+                if os.path.samefile(newest, object_path):
+                    return newest
+            except OSError:
+                pass
+
+        stamp = datetime.now().strftime(BACKUP_STAMP)
+        backup_path = os.path.join(self.backup_dir, f"{self.name}.{stamp}")
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
+        try:
+            os.link(object_path, backup_path)
+        except OSError:
+            write_atomic(backup_path, data)
+        return backup_path
+
+    def backup(self) -> Optional[str]:
+        """Back up the manifest file as it is now; returns the backup path (None if no manifest)"""
+        with self._locked():
+            data = self._read_file()
+            return self._store_backup(data) if data else None
+
+    def list_backups(self) -> List[str]:
+        """Backup file names, oldest first"""
+        try:
+            names = os.listdir(self.backup_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if self.backup_pattern.match(name))
+
+    def prune(self, keep_recent: int = KEEP_RECENT, keep_days: int = KEEP_DAYS) -> int:
+        """
+        Apply the retention policy to backups and drop objects no backup
+        links to anymore. Returns the number of backups removed.
+        """
+        backups = self.list_backups()
+        keep = set(backups[-keep_recent:]) if keep_recent > 0 else set()
+
+        last_of_day = {}
+        for name in backups:
+            last_of_day[self.backup_pattern.match(name).group(1)[:8]] = name
+        for day in sorted(last_of_day, reverse=True)[:keep_days]:
+            keep.add(last_of_day[day])
+
+        removed = 0
+        for name in backups:
+            if name not in keep:
+                os.remove(os.path.join(self.backup_dir, name))
+                removed += 1
+
+        objects_dir = os.path.join(self.backup_dir, OBJECTS_DIR)
+        if os.path.isdir(objects_dir):
+            for name in os.listdir(objects_dir):
+                object_path = os.path.join(objects_dir, name)
+                if os.stat(object_path).st_nlink <= 1:
+                    os.remove(object_path)
+        return removed
+
+
+def load_manifest(path: str = 'version-manifest.yaml', backup_dir: str = '.version-backups') -> Optional[Dict]:
+    """Read-only load of the current manifest (including journaled changes)"""
+    return ManifestStore(path, backup_dir).load()
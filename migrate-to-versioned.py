@@ -13,12 +13,13 @@ Usage:
     python3 migrate-to-versioned.py
 """
 
-import json
 import os
 import shutil
 import subprocess
 import sys
 import yaml
+import docker_api
+import ecr_cache
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Optional, Tuple
@@ -153,14 +154,24 @@ def restore_backup(filepath: str, backup_path: str):
 # Global flag to track if we need sg docker wrapper
 USE_SG_DOCKER = False
 
+# Engine API client over the docker socket (None when only the CLI is usable)
+DOCKER_CLIENT = None
+
 
 def check_docker_access() -> bool:
     """
-    Check if Docker is accessible. Automatically tries sg docker if needed.
-    Sets global USE_SG_DOCKER flag for other functions to use.
+    Check if Docker is accessible. Prefers the Engine API socket, then the
+    CLI, automatically trying sg docker if needed.
+    Sets global DOCKER_CLIENT / USE_SG_DOCKER for other functions to use.
     Returns True if Docker is accessible (directly or via sg), False otherwise.
     """
-    global USE_SG_DOCKER
+    global USE_SG_DOCKER, DOCKER_CLIENT
+
+    # Socket access needs no process spawn at all
+    DOCKER_CLIENT = docker_api.get_client()
+    if DOCKER_CLIENT:
+        USE_SG_DOCKER = False
+        return True
 
     # First check if Docker daemon is running (doesn't require docker group)
     daemon_running, _ = run_command(
@@ -236,48 +247,27 @@ def resolve_latest_tag_from_ecr(service_name: str, digest: str, registry: str =
         # you must be the owner of the registry or have explicit permissions
         repo_name = service_name
         
-        # Try the describe-images command for public ECR
-        success, output = run_command(
-            f"aws ecr-public describe-images --repository-name {repo_name} "
-            f"--region us-east-1 --output json 2>&1",
-            timeout=30
-        )
+        # Image listing comes from the shared on-disk ECR cache, refetched when stale
+        success, image_details, output = ecr_cache.describe_images(repo_name)
 
         if success:
-            try:
-                ecr_data = json.loads(output)
-                # Find images with matching digest
-                for image_detail in ecr_data.get('imageDetails', []):
-                    image_digest = image_detail.get('imageDigest', '')
-                    # Match digest - handle both full and short digest formats
-                    if digest and (image_digest == digest or digest.endswith(image_digest) or image_digest.endswith(digest.split(':')[-1] if ':' in digest else digest)):
-                        # Get tags for this image, prefer semantic versions over 'latest'
-                        tags = image_detail.get('imageTags', [])
-                        semantic_tags = [t for t in tags if t != 'latest' and not t.startswith('sha')]
-                        if semantic_tags:
-                            # Sort to get the most recent semantic version
-                            try:
-                                semantic_tags.sort(key=lambda x: [int(p) if p.isdigit() else p for p in x.replace('-', '.').split('.')], reverse=True)
-                            except (ValueError, AttributeError):
-                                pass
-                            return semantic_tags[0]
-                
-                # If we couldn't match by digest, try to find the image tagged as 'latest'
-                for image_detail in ecr_data.get('imageDetails', []):
-                    tags = image_detail.get('imageTags', [])
-                    if 'latest' in tags:
-                        semantic_tags = [t for t in tags if t != 'latest' and not t.startswith('sha')]
-                        if semantic_tags:
-                            try:
-                                semantic_tags.sort(key=lambda x: [int(p) if p.isdigit() else p for p in x.replace('-', '.').split('.')], reverse=True)
-                            except (ValueError, AttributeError):
-                                pass
-                            return semantic_tags[0]
-                            
-            except json.JSONDecodeError:
-                print_warning(f"Failed to parse ECR response for {repo_name}")
-            except KeyError:
-                pass
+            # Find images with matching digest
+            for image_detail in image_details:
+                image_digest = image_detail.get('imageDigest', '')
+                # Match digest - handle both full and short digest formats
+                if digest and (image_digest == digest or digest.endswith(image_digest) or image_digest.endswith(digest.split(':')[-1] if ':' in digest else digest)):
+                    # Get tags for this image, prefer semantic versions over 'latest'
+                    semantic_tags = ecr_cache.semantic_tags(image_detail.get('imageTags', []))
+                    if semantic_tags:
+                        return semantic_tags[0]
+
+            # If we couldn't match by digest, try to find the image tagged as 'latest'
+            for image_detail in image_details:
+                tags = image_detail.get('imageTags', [])
+                if 'latest' in tags:
+                    semantic_tags = ecr_cache.semantic_tags(tags)
+                    if semantic_tags:
+                        return semantic_tags[0]
         else:
             # AWS CLI failed - show appropriate message
             if "could not be found" in output.lower() or "repositorynotfound" in output.lower():
@@ -287,71 +277,66 @@ def resolve_latest_tag_from_ecr(service_name: str, digest: str, registry: str =
                 print_info("  Note: You need to be the registry owner to query ECR Public API")
             elif "unable to locate credentials" in output.lower():
                 print_warning("AWS credentials not configured")
+            elif output.startswith("Failed to parse"):
+                print_warning(f"Failed to parse ECR response for {repo_name}")
             else:
                 print_warning(f"Unable to query ECR for {repo_name} - will use 'latest'")
 
     return None
 
 
+def list_running_containers() -> list:
+    """
+    Running compose containers with their configured image and image ID,
+    from one Engine API request (or one 'docker inspect' of all of them).
+    """
+    inventory = docker_api.load_inventory(DOCKER_CLIENT, lambda command: run_command(docker_command(command)))
+    return [
+        {'Service': c['Service'], 'ID': c['ID'], 'Image': c['Image'], 'ImageID': c['ImageID']}
+        for c in inventory.containers
+        if c.get('State') == 'running' and c.get('Service') in COMPOSE_TO_SERVICE
+    ]
+
+
 def get_running_images() -> Dict:
     """Get currently running container images and their versions"""
     images = {}
 
-    # Try docker compose ps with JSON format (use sg docker if needed)
-    success, output = run_command(docker_command("docker compose ps --format json"))
-    if not success or not output.strip():
-        return images
+    for container in list_running_containers():
+        compose_service = container.get('Service', '')
+
+        if compose_service not in COMPOSE_TO_SERVICE:
+            continue
+
+        service_name = COMPOSE_TO_SERVICE[compose_service]
+        container_id = container.get('ID', '')
+        image = container.get('Image', '')
+        digest = container.get('ImageID', '')
+
+        # Parse image:tag
+        tag = 'latest'
+        image_name = image
+        if ':' in image:
+            parts = image.rsplit(':', 1)
+            image_name = parts[0]
+            tag = parts[1]
+
+        # If tag is 'latest', try to resolve actual version from ECR
+        if tag == 'latest' and digest:
+            print_info(f"Detected 'latest' tag for {service_name}, querying ECR for actual version...")
+            resolved_tag = resolve_latest_tag_from_ecr(service_name, digest, image_name)
+            if resolved_tag:
+                tag = resolved_tag
+                print_success(f"Resolved {service_name}: latest → {tag}")
+            else:
+                print_warning(f"Could not resolve version for {service_name}, using 'latest'")
 
-    try:
-        for line in output.strip().split('\n'):
-            if not line.strip():
-                continue
-            container = json.loads(line)
-            compose_service = container.get('Service', '')
-
-            if compose_service not in COMPOSE_TO_SERVICE:
-                continue
-
-            service_name = COMPOSE_TO_SERVICE[compose_service]
-            container_id = container.get('ID', '')
-
-            if not container_id:
-                continue
-
-            # Get image info from docker inspect (use sg docker if needed)
-            success, inspect_output = run_command(docker_command(f"docker inspect {container_id}"))
-            if success:
-                inspect_data = json.loads(inspect_output)
-                if inspect_data:
-                    image = inspect_data[0].get('Config', {}).get('Image', '')
-                    digest = inspect_data[0].get('Image', '')
-
-                    # Parse image:tag
-                    tag = 'latest'
-                    image_name = image
-                    if ':' in image:
-                        parts = image.rsplit(':', 1)
-                        image_name = parts[0]
-                        tag = parts[1]
-
-                    # If tag is 'latest', try to resolve actual version from ECR
-                    if tag == 'latest' and digest:
-                        print_info(f"Detected 'latest' tag for {service_name}, querying ECR for actual version...")
-                        resolved_tag = resolve_latest_tag_from_ecr(service_name, digest, image_name)
-                        if resolved_tag:
-                            tag = resolved_tag
-                            print_success(f"Resolved {service_name}: latest → {tag}")
-                        else:
-                            print_warning(f"Could not resolve version for {service_name}, using 'latest'")
-
-                    images[service_name] = {
-                        'image': image_name,
-                        'tag': tag,
-                        'digest': digest,
-                        'container_id': container_id
-                    }
-    except json.JSONDecodeError:
-        pass
+        images[service_name] = {
+            'image': image_name,
+            'tag': tag,
+            'digest': digest,
+            'container_id': container_id
+        }
 
     return images
 
@@ -513,13 +498,9 @@ def check_aws_cli() -> Tuple[bool, bool]:
     if not success:
         return False, False
     
-    # Check if we can access ECR Public (test with a simple describe call)
-    # Try to describe one of our repositories
-    success, output = run_command(
-        "aws ecr-public describe-images --repository-name req_router "
-        "--region us-east-1 --max-results 1 --output json 2>&1",
-        timeout=15
-    )
+    # Check if we can access ECR Public by listing one of our repositories
+    # (through the ECR cache, so later tag resolution reuses the listing)
+    success, output = ecr_cache.check_access()
     
     if success:
         return True, True
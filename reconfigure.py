@@ -10,6 +10,8 @@ import getpass
 import re
 from pathlib import Path
 
+import config_agent
+
 # ANSI color codes
 class Colors:
     HEADER = '\033[95m'
@@ -39,41 +41,22 @@ def print_info(text):
     print(f"{Colors.OKBLUE}ℹ {text}{Colors.ENDC}")
 
 def read_env_file():
-    """Read and parse the .env.gpg file"""
-    import subprocess
-    
+    """Read and parse the .env.gpg file (decrypted in memory, or from the config agent)"""
     if not os.path.exists('.env.gpg'):
         print_error(".env.gpg file not found. Have you run the installation?")
         return None
     
     print_info("Decrypting current configuration...")
-    print_warning("You will need to enter your encryption password:")
-    
-    try:
-        # Decrypt the .env.gpg file
-        subprocess.run("gpg -o .env -d .env.gpg", shell=True, check=True)
-        
-        # Read the decrypted file
-        config = {}
-        with open('.env', 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    config[key] = value
-        
-        print_success("Configuration loaded successfully")
-        return config
-    except subprocess.CalledProcessError:
+    config = config_agent.agent_values()
+    if config is None:
+        print_warning("You will need to enter your encryption password:")
+        config = config_agent.decrypt()
+    if config is None:
         print_error("Failed to decrypt .env.gpg. Wrong password?")
         return None
-    except Exception as e:
-        print_error(f"Error reading configuration: {e}")
-        return None
-    finally:
-        # Clean up decrypted file
-        if os.path.exists('.env'):
-            os.remove('.env')
+    
+    print_success("Configuration loaded successfully")
+    return config
 
 def write_env_file(config):
     """Write configuration to .env file"""
@@ -94,6 +77,8 @@ def encrypt_env_file():
     try:
         subprocess.run("gpg -c .env", shell=True, check=True)
         os.remove('.env')
+        # A running config agent still holds the old values
+        config_agent.stop()
         print_success("Configuration encrypted successfully")
         return True
     except subprocess.CalledProcessError:
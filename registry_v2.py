@@ -0,0 +1,331 @@
+"""
+DagKnows Registry Client
+Minimal Docker Registry HTTP API v2 client.
+
+Used by version-manager.py to talk to the local pull-through registry
+mirror (health, catalog, and warming it by fetching manifests and blobs
+so the mirror caches them) and to check ECR for newer tags, without going
+through the Docker daemon or the AWS CLI.
+
+Registries that require a token (public ECR, Docker Hub) get an anonymous
+pull token, or one obtained with the credentials 'docker login' stored.
+With a ResponseCache, tag lists and manifests are fetched with conditional
+requests (If-None-Match) and manifests addressed by digest, which never
+change, are served from disk without a request.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+
+# ============================================
+# CONSTANTS
+# ============================================
+
+DEFAULT_TIMEOUT = 10
+BLOB_TIMEOUT = 300
+CHUNK_SIZE = 1024 * 1024
+
+MANIFEST_LIST_TYPES = (
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.index.v1+json',
+)
+MANIFEST_TYPES = (
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+)
+MANIFEST_ACCEPT = ', '.join(MANIFEST_LIST_TYPES + MANIFEST_TYPES)
+
+# Tag list page size; registries return a Link header for the next page
+TAGS_PAGE_SIZE = 1000
+
+# Conditional-request cache for tag lists and manifests
+RESPONSE_CACHE_DIR = '.registry-cache'
+
+DOCKER_CONFIG = os.path.join(os.path.expanduser('~'), '.docker', 'config.json')
+
+# platform.machine() -> OCI architecture
+ARCHITECTURES = {'x86_64': 'amd64', 'amd64': 'amd64', 'aarch64': 'arm64', 'arm64': 'arm64'}
+
+
+class RegistryError(Exception):
+    """Registry unreachable or returned an error"""
+
+
+# ============================================
+# CLIENT
+# ============================================
+
+def docker_credentials(host: str, config_path: str = DOCKER_CONFIG) -> str:
+    """
+    Base64 'user:password' that 'docker login' stored for host in the Docker
+    config ('' if none, or if they are kept by a credential helper).
+    """
+    try:
+        with open(config_path, 'r') as f:
+            auths = json.load(f).get('auths') or {}
+    except (OSError, ValueError):
+        return ''
+    for key in (host, f"https://{host}", f"http://{host}"):
+        if (auths.get(key) or {}).get('auth'):
+            return auths[key]['auth']
+    return ''
+
+
+def parse_challenge(header: str) -> Tuple[str, Dict[str, str]]:
+    """Split a WWW-Authenticate header into (scheme, parameters)"""
+    scheme, _, rest = header.strip().partition(' ')
+    return scheme.lower(), dict(re.findall(r'(\w+)="([^"]*)"', rest))
+
+
+class ResponseCache:
+    """
+    On-disk cache of registry JSON responses with their ETag, one file per
+    URL under RESPONSE_CACHE_DIR. Safe to share between threads.
+    """
+
+    def __init__(self, directory: str = RESPONSE_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest()[:32] + '.json')
+
+    def load(self, url: str) -> Optional[Dict]:
+        try:
+            with open(self._path(url), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, url: str, document: Dict, headers: Dict, etag: str):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(url)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'url': url, 'etag': etag, 'headers': headers, 'document': document,
+                       'fetched_at': time.time()}, f)
+        os.replace(tmp_path, path)
+
+
+def host_architecture() -> str:
+    """OCI architecture name of this host (e.g., 'amd64')"""
+    machine = platform.machine().lower()
+    return ARCHITECTURES.get(machine, machine)
+
+
+class RegistryClient:
+    """Registry v2 API client for one registry host (e.g., 'localhost:5000')"""
+
+    def __init__(self, host: str, scheme: str = 'http', timeout: float = DEFAULT_TIMEOUT,
+                 credentials: str = '', cache: Optional[ResponseCache] = None):
+        self.host = host
+        self.base_url = f"{scheme}://{host}"
+        self.timeout = timeout
+        self.credentials = credentials  # base64 'user:password', as in the Docker config
+        self.cache = cache
+        self._tokens = {}  # scope -> bearer token
+        self._basic = False  # Registry asked for basic auth
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'not_modified': 0, 'cached': 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _authorization(self, scope: str) -> str:
+        if self._basic and self.credentials:
+            return f"Basic {self.credentials}"
+        token = self._tokens.get(scope)
+        return f"Bearer {token}" if token else ''
+
+    def _fetch_token(self, challenge: Dict[str, str], scope: str) -> bool:
+        """Get a bearer token from the challenge's realm (anonymously without credentials)"""
+        query = {'service': challenge.get('service', '')}
+        if challenge.get('scope') or scope:
+            query['scope'] = challenge.get('scope') or scope
+        request = urllib.request.Request(f"{challenge['realm']}?{urllib.parse.urlencode(query)}")
+        if self.credentials:
+            request.add_header('Authorization', f"Basic {self.credentials}")
+        try:
+            self._count('requests')
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                document = json.loads(response.read())
+        except (urllib.error.URLError, OSError, ValueError):
+            return False
+        token = document.get('token') or document.get('access_token')
+        if token:
+            with self._lock:
+                self._tokens[scope] = token
+        return bool(token)
+
+    def _open(self, path: str, accept: str = None, timeout: float = None, headers: Dict[str, str] = None):
+        """
+        Open path, answering one authentication challenge. A 304 response is
+        raised as HTTPError for the caller to handle.
+        """
+        match = re.match(r'/v2/(.+?)/(?:manifests|blobs|tags)/', path)
+        scope = f"repository:{match.group(1)}:pull" if match else ''
+
+        for attempt in range(2):
+            request = urllib.request.Request(f"{self.base_url}{path}")
+            if accept:
+                request.add_header('Accept', accept)
+            for name, value in (headers or {}).items():
+                request.add_header(name, value)
+            authorization = self._authorization(scope)
+            if authorization:
+                # Not sent along when blobs redirect to storage
+                request.add_unredirected_header('Authorization', authorization)
+            try:
+                self._count('requests')
+                return urllib.request.urlopen(request, timeout=timeout or self.timeout)
+            except urllib.error.HTTPError as e:
+                if e.code == 304:
+                    raise
+                if e.code == 401 and attempt == 0:
+                    auth_scheme, challenge = parse_challenge(e.headers.get('WWW-Authenticate', ''))
+                    if auth_scheme == 'bearer' and challenge.get('realm') and self._fetch_token(challenge, scope):
+                        continue
+                    if auth_scheme == 'basic' and self.credentials:
+                        self._basic = True
+                        continue
+                raise RegistryError(f"{e.code} {e.reason} for {path}")
+            except (urllib.error.URLError, OSError) as e:
+                reason = getattr(e, 'reason', e)
+                raise RegistryError(f"{self.host} unreachable: {reason}")
+
+    def get_json(self, path: str, accept: str = None) -> Tuple[Dict, Dict]:
+        """
+        GET a JSON document. Returns (document, response headers).
+        With a cache, a stored copy is revalidated with If-None-Match, and
+        manifests requested by digest are served from it outright.
+        """
+        url = f"{self.base_url}{path}"
+        cached = self.cache.load(url) if self.cache else None
+        if cached and '/manifests/sha256:' in path:
+            self._count('cached')
+            return cached['document'], cached['headers']
+
+        conditional = {'If-None-Match': cached['etag']} if cached and cached.get('etag') else None
+        try:
+            with self._open(path, accept, headers=conditional) as response:
+                body = response.read()
+                # Header case varies between registries and proxies
+                headers = {name.title(): value for name, value in response.headers.items()}
+        except urllib.error.HTTPError as e:
+            if not cached:
+                raise RegistryError(f"{e.code} {e.reason} for {path}")
+            self._count('not_modified')
+            return cached['document'], cached['headers']
+        try:
+            document = json.loads(body) if body else {}
+        except json.JSONDecodeError:
+            raise RegistryError(f"Invalid JSON from {path}")
+
+        if self.cache:
+            etag = headers.get('Etag', '')
+            if etag or '/manifests/sha256:' in path:
+                kept = {k: v for k, v in headers.items() if k in ('Content-Type', 'Docker-Content-Digest', 'Link')}
+                self.cache.save(url, document, kept, etag)
+        return document, headers
+
+    def ping(self) -> Tuple[bool, str]:
+        """Check the /v2/ endpoint. Returns (reachable, error)."""
+        try:
+            self.get_json('/v2/')
+            return True, ""
+        except RegistryError as e:
+            return False, str(e)
+
+    def catalog(self) -> List[str]:
+        """Repositories stored by the registry"""
+        document, _ = self.get_json('/v2/_catalog?n=1000')
+        return document.get('repositories') or []
+
+    def tags(self, repository: str) -> List[str]:
+        """Every tag of a repository, following the Link header across pages"""
+        tags = []
+        path = f"/v2/{repository}/tags/list?n={TAGS_PAGE_SIZE}"
+        while path:
+            document, headers = self.get_json(path)
+            tags.extend(document.get('tags') or [])
+            match = re.search(r'<([^>]+)>\s*;\s*rel="?next"?', headers.get('Link', ''))
+            path = None
+            if match:
+                next_url = urllib.parse.urlparse(match.group(1))
+                path = f"{next_url.path}?{next_url.query}" if next_url.query else next_url.path
+        return tags
+
+    def image_info(self, repository: str, reference: str) -> Dict:
+        """
+        Digest, compressed size and layers of an image for this host's platform:
+        {'digest' (what 'docker pull' records), 'platform_digest', 'size', 'layers' (digest -> size)}
+        """
+        document, headers = self.get_json(f"/v2/{repository}/manifests/{reference}", MANIFEST_ACCEPT)
+        digest = headers.get('Docker-Content-Digest', '')
+        entry = self._platform_entry(document, headers, repository, reference)
+        if entry:
+            manifest, platform_digest = self.manifest(repository, entry)
+        else:
+            manifest, platform_digest = document, digest
+        layers = {layer.get('digest'): layer.get('size', 0) for layer in manifest.get('layers') or []}
+        config = manifest.get('config') or {}
+        return {
+            'digest': digest or platform_digest,
+            'platform_digest': platform_digest,
+            'size': sum(layers.values()) + config.get('size', 0),
+            'layers': layers,
+        }
+
+    def manifest(self, repository: str, reference: str) -> Tuple[Dict, str]:
+        """
+        Fetch an image manifest, resolving a manifest list / OCI index to this
+        host's platform. Returns (manifest, digest).
+        """
+        document, headers = self.get_json(f"/v2/{repository}/manifests/{reference}", MANIFEST_ACCEPT)
+        entry = self._platform_entry(document, headers, repository, reference)
+        if entry:
+            return self.manifest(repository, entry)
+
+        return document, headers.get('Docker-Content-Digest', '') or (reference if reference.startswith('sha256:') else '')
+
+    def _platform_entry(self, document: Dict, headers: Dict, repository: str, reference: str) -> str:
+        """Digest of this host's image if document is a manifest list / OCI index, else ''"""
+        media_type = document.get('mediaType') or headers.get('Content-Type', '')
+        if media_type not in MANIFEST_LIST_TYPES and 'manifests' not in document:
+            return ''
+        arch = host_architecture()
+        entries = document.get('manifests') or []
+        match = next((m for m in entries
+                      if m.get('platform', {}).get('os') == 'linux'
+                      and m.get('platform', {}).get('architecture') == arch), None)
+        if not match:
+            raise RegistryError(f"No linux/{arch} image for {repository}:{reference}")
+        return match['digest']
+
+    def read_blob(self, repository: str, digest: str) -> int:
+        """Download a blob and discard it (warms a pull-through cache). Returns bytes read."""
+        total = 0
+        with self._open(f"/v2/{repository}/blobs/{digest}", timeout=BLOB_TIMEOUT) as response:
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    return total
+                total += len(chunk)
+
+    def fetch_image(self, repository: str, reference: str) -> int:
+        """Fetch an image's manifest, config and layers. Returns bytes downloaded."""
+        manifest, _ = self.manifest(repository, reference)
+        digests = [manifest.get('config', {}).get('digest')]
+        digests += [layer.get('digest') for layer in manifest.get('layers') or []]
+        return sum(self.read_blob(repository, digest) for digest in digests if digest)
+
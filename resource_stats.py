@@ -0,0 +1,390 @@
+"""
+DagKnows Resource Stats
+Per-service CPU, memory, block I/O and network history from the Docker stats stream.
+
+The sampler keeps one stats subscription per running container of the
+compose project (Docker sends a sample about every second) and folds the
+samples into one record per service and minute. Records are stored in a
+fixed-size ring file per service under .stats/, RRD-style, in two tiers:
+one-minute records for the last day and fifteen-minute records for the
+last week. A record's slot is its start time modulo the tier length, so
+the files never grow and old records are simply overwritten (about 130 KB
+per service).
+
+Usage (via check-status.py --sampler / --resources, 'make stats'):
+    ResourceSampler(client).run()           # Blocks, recording until stopped
+    report = resource_report()              # {service: {window: summary}}
+"""
+
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import docker_api
+from image_bundle import format_size
+
+
+# ============================================
+# CONSTANTS
+# ============================================
+
+STATS_DIR = '.stats'
+
+# (name, seconds per record, records kept)
+TIERS = (
+    ('minute', 60, 1440),     # 1 day
+    ('quarter', 900, 672),    # 1 week
+)
+
+# Report windows: (name, seconds, tier read)
+WINDOWS = (
+    ('hour', 3600, 'minute'),
+    ('day', 86400, 'minute'),
+    ('week', 7 * 86400, 'quarter'),
+)
+
+# Record: start (epoch s), samples, CPU % avg/max, memory bytes avg/max,
+# then bytes read/written on block devices and received/sent on the network
+RECORD = struct.Struct('<IHffQQQQQQ')
+FILE_MAGIC = b'DKSTATS1'
+
+# Seconds between looking for started or stopped containers
+CONTAINER_REFRESH = 15
+
+
+def parse_sample(sample: Dict) -> Optional[Dict]:
+    """
+    CPU %, memory in use and cumulative I/O counters from one Docker stats
+    sample, computed as 'docker stats' does (None for a stopped container).
+    """
+    cpu = sample.get('cpu_stats') or {}
+    precpu = sample.get('precpu_stats') or {}
+    memory = sample.get('memory_stats') or {}
+    if not cpu.get('system_cpu_usage') or 'usage' not in memory:
+        return None
+
+    cpu_delta = (cpu.get('cpu_usage') or {}).get('total_usage', 0) - \
+        (precpu.get('cpu_usage') or {}).get('total_usage', 0)
+    system_delta = cpu.get('system_cpu_usage', 0) - precpu.get('system_cpu_usage', 0)
+    online = cpu.get('online_cpus') or len((cpu.get('cpu_usage') or {}).get('percpu_usage') or []) or 1
+    cpu_percent = cpu_delta / system_delta * online * 100 if system_delta > 0 and cpu_delta > 0 else 0.0
+
+    # Page cache is reclaimable; cgroup v2 reports it as inactive_file, v1 as total_inactive_file
+    details = memory.get('stats') or {}
+    cache = details.get('inactive_file', details.get('total_inactive_file', 0))
+    mem = max(0, memory.get('usage', 0) - cache)
+
+    blk_read = blk_write = 0
+    for entry in (sample.get('blkio_stats') or {}).get('io_service_bytes_recursive') or []:
+        op = entry.get('op', '').lower()
+        if op == 'read':
+            blk_read += entry.get('value', 0)
+        elif op == 'write':
+            blk_write += entry.get('value', 0)
+
+    net_rx = net_tx = 0
+    for interface in (sample.get('networks') or {}).values():
+        net_rx += interface.get('rx_bytes', 0)
+        net_tx += interface.get('tx_bytes', 0)
+
+    return {'cpu': cpu_percent, 'mem': mem, 'mem_limit': memory.get('limit', 0),
+            'counters': (blk_read, blk_write, net_rx, net_tx)}
+
+
+# ============================================
+# RING STORE
+# ============================================
+
+class Record:
+    """One service's usage over one tier interval"""
+
+    def __init__(self, start: int, samples: int = 0, cpu_avg: float = 0.0, cpu_max: float = 0.0,
+                 mem_avg: int = 0, mem_max: int = 0, io: Tuple[int, int, int, int] = (0, 0, 0, 0)):
+        self.start = start
+        self.samples = samples
+        self.cpu_avg = cpu_avg
+        self.cpu_max = cpu_max
+        self.mem_avg = mem_avg
+        self.mem_max = mem_max
+        self.io = io  # (block read, block write, net rx, net tx) bytes in the interval
+
+    def pack(self) -> bytes:
+        return RECORD.pack(self.start, min(self.samples, 0xFFFF), self.cpu_avg, self.cpu_max,
+                           int(self.mem_avg), int(self.mem_max), *self.io)
+
+    @classmethod
+    def unpack(cls, data: bytes) -> 'Record':
+        start, samples, cpu_avg, cpu_max, mem_avg, mem_max, *io = RECORD.unpack(data)
+        return cls(start, samples, cpu_avg, cpu_max, mem_avg, mem_max, tuple(io))
+
+    def merge(self, other: 'Record'):
+        """Fold other (a record within this one's interval) into this one"""
+        total = self.samples + other.samples
+        if total:
+            self.cpu_avg = (self.cpu_avg * self.samples + other.cpu_avg * other.samples) / total
+            self.mem_avg = (self.mem_avg * self.samples + other.mem_avg * other.samples) / total
+        self.samples = total
+        self.cpu_max = max(self.cpu_max, other.cpu_max)
+        self.mem_max = max(self.mem_max, other.mem_max)
+        self.io = tuple(a + b for a, b in zip(self.io, other.io))
+
+
+class RingStore:
+    """Fixed-size ring file per service: a header, then each tier's slots"""
+
+    def __init__(self, directory: str = STATS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._offsets = {}
+        offset = len(FILE_MAGIC)
+        for name, _, slots in TIERS:
+            self._offsets[name] = offset
+            offset += slots * RECORD.size
+        self.file_size = offset
+
+    def path(self, service: str) -> str:
+        return os.path.join(self.directory, f"{service}.ring")
+
+    def services(self) -> List[str]:
+        try:
+            return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.ring'))
+        except OSError:
+            return []
+
+    def _slot(self, tier: str, start: int) -> int:
+        _, step, slots = next(t for t in TIERS if t[0] == tier)
+        return self._offsets[tier] + (start // step % slots) * RECORD.size
+
+    def _open(self, service: str):
+        """Open the service's ring file for update, (re)creating it if missing or from another layout"""
+        path = self.path(service)
+        try:
+            f = open(path, 'r+b')
+            if f.read(len(FILE_MAGIC)) == FILE_MAGIC and os.fstat(f.fileno()).st_size == self.file_size:
+                return f
+            f.close()
+        except OSError:
+            os.makedirs(self.directory, exist_ok=True)
+        f = open(path, 'w+b')
+        f.write(FILE_MAGIC)
+        f.truncate(self.file_size)
+        return f
+
+    def write(self, service: str, record: Record):
+        """Store a one-minute record, and fold it into its fifteen-minute record"""
+        with self._lock, self._open(service) as f:
+            f.seek(self._slot('minute', record.start))
+            f.write(record.pack())
+
+            _, step, _ = TIERS[1]
+            quarter_start = record.start - record.start % step
+            offset = self._slot('quarter', quarter_start)
+            f.seek(offset)
+            existing = Record.unpack(f.read(RECORD.size))
+            quarter = Record(quarter_start)
+            if existing.start == quarter_start:
+                quarter = existing
+            quarter.merge(record)
+            f.seek(offset)
+            f.write(quarter.pack())
+
+    def read(self, service: str, tier: str, since: float) -> List[Record]:
+        """The tier's records starting at or after since, oldest first"""
+        try:
+            with open(self.path(service), 'rb') as f:
+                if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                    return []
+                f.seek(self._offsets[tier])
+                _, _, slots = next(t for t in TIERS if t[0] == tier)
+                data = f.read(slots * RECORD.size)
+        except OSError:
+            return []
+        records = [Record.unpack(data[i:i + RECORD.size]) for i in range(0, len(data) - RECORD.size + 1, RECORD.size)]
+        return sorted((r for r in records if r.samples and r.start >= since), key=lambda r: r.start)
+
+
+# ============================================
+# SAMPLER
+# ============================================
+
+class ServiceBucket:
+    """Samples of one service within the current minute"""
+
+    def __init__(self, start: int):
+        self.start = start
+        self.samples = 0
+        self.cpu_sum = 0.0
+        self.cpu_max = 0.0
+        self.mem_sum = 0
+        self.mem_max = 0
+        self.io = [0, 0, 0, 0]
+
+    def add(self, usage: Dict, io_delta: Tuple[int, int, int, int]):
+        self.samples += 1
+        self.cpu_sum += usage['cpu']
+        self.cpu_max = max(self.cpu_max, usage['cpu'])
+        self.mem_sum += usage['mem']
+        self.mem_max = max(self.mem_max, usage['mem'])
+        self.io = [a + b for a, b in zip(self.io, io_delta)]
+
+    def record(self) -> Record:
+        return Record(self.start, self.samples, self.cpu_sum / self.samples, self.cpu_max,
+                      self.mem_sum // self.samples, self.mem_max, tuple(self.io))
+
+
+class ResourceSampler:
+    """Streams stats for the project's running containers and records one sample per service and minute"""
+
+    def __init__(self, client: docker_api.DockerClient, store: Optional[RingStore] = None,
+                 project: Optional[str] = None):
+        self.client = client
+        self.store = store or RingStore()
+        self.project = project or docker_api.compose_project_name()
+        self.streams = {}  # container ID -> connection
+        self.buckets = {}  # service -> ServiceBucket
+        self.counters = {}  # container ID -> last cumulative (blk read, blk write, net rx, net tx)
+        self.stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def _follow(self, container_id: str, service: str):
+        """Feed one container's stats stream into its service's bucket until it ends"""
+        try:
+            conn, samples = self.client.stats_stream(container_id)
+        except Exception:
+            self.streams.pop(container_id, None)
+            return
+        self.streams[container_id] = conn
+        try:
+            for sample in samples:
+                usage = parse_sample(sample)
+                if usage is None:
+                    continue
+                with self._lock:
+                    previous = self.counters.get(container_id)
+                    self.counters[container_id] = usage['counters']
+                    if previous is None:
+                        continue  # First sample only sets the baseline for the I/O counters
+                    # A counter that went down was reset (container restarted)
+                    delta = tuple(now - before if now >= before else now
+                                  for now, before in zip(usage['counters'], previous))
+                    minute = int(time.time()) // 60 * 60
+                    bucket = self.buckets.setdefault(service, ServiceBucket(minute))
+                    bucket.add(usage, delta)
+        except Exception:
+            pass
+        finally:
+            conn.close()
+            with self._lock:
+                self.streams.pop(container_id, None)
+                self.counters.pop(container_id, None)
+
+    def refresh_containers(self):
+        """Start following containers that appeared since the last refresh"""
+        try:
+            containers = self.client.compose_ps(self.project)
+        except Exception:
+            return
+        for container in containers:
+            if container['State'] != 'running' or not container['Service'] or container['ID'] in self.streams:
+                continue
+            self.streams[container['ID']] = None
+            threading.Thread(target=self._follow, args=(container['ID'], container['Service']),
+                             daemon=True).start()
+
+    def flush(self, force: bool = False):
+        """Write the buckets of finished minutes (or all of them, when stopping)"""
+        minute = int(time.time()) // 60 * 60
+        with self._lock:
+            done = [service for service, bucket in self.buckets.items()
+                    if force or bucket.start < minute]
+            records = {service: self.buckets.pop(service).record() for service in done}
+        for service, record in records.items():
+            if record.samples:
+                self.store.write(service, record)
+
+    def run(self):
+        """Sample until stop() is called"""
+        last_refresh = 0.0
+        try:
+            while not self.stopping.is_set():
+                if time.monotonic() - last_refresh >= CONTAINER_REFRESH:
+                    self.refresh_containers()
+                    last_refresh = time.monotonic()
+                self.flush()
+                self.stopping.wait(1)
+        finally:
+            for conn in list(self.streams.values()):
+                if conn:
+                    conn.abort()
+            self.flush(force=True)
+
+    def stop(self):
+        self.stopping.set()
+
+
+# ============================================
+# REPORT
+# ============================================
+
+def summarize(records: List[Record]) -> Optional[Dict]:
+    """Averages, peaks and I/O totals over records (None if there are none)"""
+    if not records:
+        return None
+    merged = Record(records[0].start)
+    for record in records:
+        merged.merge(record)
+    return {
+        'cpu_avg': round(merged.cpu_avg, 2), 'cpu_max': round(merged.cpu_max, 2),
+        'mem_avg': int(merged.mem_avg), 'mem_max': int(merged.mem_max),
+        'blk_read': merged.io[0], 'blk_write': merged.io[1], 'net_rx': merged.io[2], 'net_tx': merged.io[3],
+        'from': records[0].start, 'to': records[-1].start, 'samples': merged.samples,
+    }
+
+
+def resource_report(store: Optional[RingStore] = None, now: Optional[float] = None) -> Dict[str, Dict]:
+    """{service: {'hour'|'day'|'week': summary or None}} for every recorded service"""
+    store = store or RingStore()
+    now = now or time.time()
+    return {
+        service: {name: summarize(store.read(service, tier, now - seconds)) for name, seconds, tier in WINDOWS}
+        for service in store.services()
+    }
+
+
+def trend(recent: Optional[Dict], baseline: Optional[Dict], key: str) -> str:
+    """Change of recent vs baseline average, e.g. '+35%' ('' when not comparable)"""
+    if not recent or not baseline or not baseline[key]:
+        return ''
+    change = (recent[key] - baseline[key]) / baseline[key] * 100
+    return f"{change:+.0f}%"
+
+
+def format_report(report: Dict[str, Dict], top: int = 0) -> List[str]:
+    """Table lines: services by CPU over the last hour, with day and week averages and trends"""
+    def cpu_key(item):
+        hour = item[1]['hour'] or item[1]['day'] or {}
+        return hour.get('cpu_avg', 0)
+
+    rows = sorted(report.items(), key=cpu_key, reverse=True)
+    if top:
+        rows = rows[:top]
+    lines = [f"{'SERVICE':<22} {'CPU 1h':>7} {'24h':>6} {'7d':>6} {'peak 1h':>8}  "
+             f"{'MEM 1h':>9} {'24h':>9} {'7d':>9} {'vs 7d':>6}  {'DISK 24h r/w':>19}  {'NET 24h rx/tx':>19}"]
+    for service, windows in rows:
+        hour, day, week = windows['hour'], windows['day'], windows['week']
+
+        def cpu(summary, key='cpu_avg'):
+            return f"{summary[key]:.1f}%" if summary else '-'
+
+        def mem(summary):
+            return format_size(summary['mem_avg']) if summary else '-'
+
+        disk = f"{format_size(day['blk_read'])}/{format_size(day['blk_write'])}" if day else '-'
+        net = f"{format_size(day['net_rx'])}/{format_size(day['net_tx'])}" if day else '-'
+        lines.append(f"{service:<22} {cpu(hour):>7} {cpu(day):>6} {cpu(week):>6} "
+                     f"{cpu(hour, 'cpu_max'):>8}  "
+                     f"{mem(hour):>9} {mem(day):>9} {mem(week):>9} {trend(hour, week, 'mem_avg'):>6}  "
+                     f"{disk:>19}  {net:>19}")
+    return lines
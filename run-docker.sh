@@ -5,8 +5,17 @@
 # Usage: ./run-docker.sh docker compose logs -f
 #        ./run-docker.sh docker compose up -d
 
-# Check if docker is accessible directly
-if docker ps >/dev/null 2>&1; then
+# Check if docker is accessible directly. A readable/writable local socket
+# means it is, without spawning 'docker ps'; other DOCKER_HOST setups probe.
+DOCKER_SOCK="/var/run/docker.sock"
+case "${DOCKER_HOST:-}" in
+    unix://*) DOCKER_SOCK="${DOCKER_HOST#unix://}" ;;
+    ?*) DOCKER_SOCK="" ;;
+esac
+if [ -n "$DOCKER_SOCK" ] && [ -S "$DOCKER_SOCK" ] && [ -r "$DOCKER_SOCK" ] && [ -w "$DOCKER_SOCK" ]; then
+    exec "$@"
+fi
+if [ -z "$DOCKER_SOCK" ] && docker ps >/dev/null 2>&1; then
     # Direct access works - run command normally
     exec "$@"
 fi
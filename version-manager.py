@@ -12,23 +12,94 @@ Usage:
     python3 version-manager.py rollback --service=S          # Rollback to previous
     python3 version-manager.py set --service=S --tag=TAG     # Set custom version (hotfixes)
     python3 version-manager.py update-safe                   # Safe update to latest with rollback
-    python3 version-manager.py check-updates                 # Check for available updates
-    python3 version-manager.py generate-env                  # Generate versions.env
+    python3 version-manager.py prefetch                      # Stage the update's images ahead of time
+    python3 version-manager.py update-safe --prefetched      # Safe update using staged images only
+    python3 version-manager.py bluegreen deploy|switch-back|finish|status [--service=S]  # Blue/green
+    python3 version-manager.py startup [--compose-file=F]    # Start services in dependency order
+    python3 version-manager.py wait-ready [--timeout=SEC]    # Wait until services are healthy
+    python3 version-manager.py check-updates [--registry=R]  # Check the registry for newer versions
+    python3 version-manager.py generate-env [--force]        # Generate versions.env (skipped if current)
+    python3 version-manager.py pinning enable|disable|status # Deploy by image digest instead of tag
     python3 version-manager.py pull-from-manifest            # Pull versions from manifest
+    python3 version-manager.py gc [--dry-run]                # Remove images no rollback needs
     python3 version-manager.py ecr-login                     # Login to private ECR
+    python3 version-manager.py ecr-cache [--clear]           # Show/invalidate ECR listing cache
+    python3 version-manager.py bundle-export [--output=FILE] # Export images for air-gapped install
+    python3 version-manager.py bundle-import --input=FILE    # Import an image bundle
+    python3 version-manager.py mirror setup|enable|disable|warm|status  # Local registry mirror
+    python3 version-manager.py config-agent start|stop|status  # Hold decrypted .env.gpg in memory
+    python3 version-manager.py with-config -- COMMAND...     # Run COMMAND with the configuration
 """
 
+import hashlib
+import os
+import sys
+
+
+# ============================================
+# GENERATE-ENV FAST PATH
+# ============================================
+# 'generate-env' runs on every 'make up', 'make start' and systemd start.
+# When versions.env already carries the fingerprint of the current inputs,
+# exit before importing yaml, the Docker client and the rest of this script.
+
+VERSIONS_ENV_INPUTS = ['version-manifest.yaml', '.version-backups/manifest-journal.jsonl']
+FINGERPRINT_PREFIX = '# Fingerprint: '
+
+
+def versions_env_fingerprint(base_dir: str) -> str:
+    """Hash of what versions.env is generated from: the manifest, its journal and this script"""
+    digest = hashlib.sha256()
+    for name in VERSIONS_ENV_INPUTS:
+        try:
+            with open(os.path.join(base_dir, name), 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+        digest.update(b'\0')
+    script = os.stat(os.path.abspath(__file__))
+    digest.update(f"{script.st_size}:{script.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+def versions_env_current(base_dir: str) -> bool:
+    """True if versions.env was generated from the current inputs"""
+    try:
+        with open(os.path.join(base_dir, 'versions.env'), 'r') as f:
+            header = [f.readline().strip() for _ in range(5)]
+    except OSError:
+        return False
+    return FINGERPRINT_PREFIX + versions_env_fingerprint(base_dir) in header
+
+
+if __name__ == '__main__' and sys.argv[1:] == ['generate-env']:
+    if versions_env_current(os.path.dirname(os.path.abspath(__file__))):
+        print("\033[92m\u2713 versions.env is up to date\033[0m")
+        sys.exit(0)
+
 import argparse
+import atexit
+import copy
 import json
-import os
-import shutil
+import queue
+import re
+import shlex
 import subprocess
-import sys
+import tarfile
+import threading
 import time
 import yaml
+import config_agent
+import docker_api
+import ecr_cache
+import health_probe
+import image_bundle
+import manifest_store
+import registry_v2
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
 
 
 # ============================================
@@ -58,9 +129,25 @@ SERVICE_TO_COMPOSE = {
     'dagknows_nuxt': 'dagknows-nuxt'
 }
 
+COMPOSE_TO_SERVICE = {compose: service for service, compose in SERVICE_TO_COMPOSE.items()}
+
 DEFAULT_REGISTRY = 'public.ecr.aws/n5k3t9x2'
 HISTORY_LIMIT = 5
 
+# Number of images pulled in parallel (override with --workers or DK_PULL_WORKERS)
+DEFAULT_PULL_WORKERS = 4
+
+# Pull errors worth retrying with backoff (registry throttling, flaky network)
+TRANSIENT_PULL_ERRORS = (
+    'toomanyrequests',
+    'tls handshake timeout',
+    'i/o timeout',
+    'connection reset by peer',
+    'unexpected eof',
+    'command timed out',
+    'service unavailable',
+)
+
 
 # ============================================
 # COLORS AND OUTPUT
@@ -158,14 +245,24 @@ def confirm(prompt: str, default: bool = False) -> bool:
 # Global flag to track if we need sg docker wrapper
 USE_SG_DOCKER = False
 
+# Engine API client over the docker socket (None when only the CLI is usable)
+DOCKER_CLIENT: Optional[docker_api.DockerClient] = None
+
 
 def check_docker_access() -> bool:
     """
-    Check if Docker is accessible. Automatically tries sg docker if needed.
-    Sets global USE_SG_DOCKER flag for other functions to use.
+    Check if Docker is accessible. Prefers the Engine API socket, then the
+    CLI, automatically trying sg docker if needed.
+    Sets global DOCKER_CLIENT / USE_SG_DOCKER for other functions to use.
     Returns True if Docker is accessible (directly or via sg), False otherwise.
     """
-    global USE_SG_DOCKER
+    global USE_SG_DOCKER, DOCKER_CLIENT
+
+    # Socket access needs no process spawn at all
+    DOCKER_CLIENT = docker_api.get_client()
+    if DOCKER_CLIENT:
+        USE_SG_DOCKER = False
+        return True
 
     # First check if Docker daemon is running (doesn't require docker group)
     daemon_running, _ = run_command(
@@ -213,6 +310,9 @@ def docker_command(cmd: str) -> str:
 # DOCKER HELPER FUNCTIONS
 # ============================================
 
+_CREDENTIALS_LOCK = threading.Lock()
+
+
 def clear_stale_ecr_credentials(registry: str) -> bool:
     """
     Clear stale Docker credentials for public ECR.
@@ -222,8 +322,12 @@ def clear_stale_ecr_credentials(registry: str) -> bool:
         True if logout was attempted, False otherwise
     """
     if 'public.ecr.aws' in registry:
-        print_info("Clearing stale Docker credentials for public.ecr.aws...")
-        run_command(docker_command("docker logout public.ecr.aws") + " 2>&1", capture=False)
+        # Concurrent pulls can all hit the expired token at once
+        with _CREDENTIALS_LOCK:
+            print_info("Clearing stale Docker credentials for public.ecr.aws...")
+            run_command(docker_command("docker logout public.ecr.aws") + " 2>&1", capture=False)
+            if DOCKER_CLIENT:
+                DOCKER_CLIENT.forget_auth('public.ecr.aws')
         return True
     return False
 
@@ -231,7 +335,7 @@ def clear_stale_ecr_credentials(registry: str) -> bool:
 def docker_pull_with_retry(image: str, max_retries: int = 2) -> Tuple[bool, str]:
     """
     Pull a Docker image with automatic retry on expired token errors.
-    Uses sg docker wrapper if needed.
+    Uses the Engine API when available, otherwise the CLI (with sg docker if needed).
 
     Args:
         image: Full image name (e.g., 'public.ecr.aws/n5k3t9x2/req_router:latest')
@@ -241,8 +345,10 @@ def docker_pull_with_retry(image: str, max_retries: int = 2) -> Tuple[bool, str]
         Tuple of (success, output)
     """
     for attempt in range(max_retries):
-        cmd = docker_command(f"docker pull {image}")
-        success, output = run_command(cmd)
+        if DOCKER_CLIENT:
+            success, output = DOCKER_CLIENT.pull(image)
+        else:
+            success, output = run_command(docker_command(f"docker pull {image}"))
 
         if success:
             return True, output
@@ -263,635 +369,3033 @@ def docker_pull_with_retry(image: str, max_retries: int = 2) -> Tuple[bool, str]
     return False, output
 
 
-# ============================================
-# ECR TAG RESOLUTION (uses AWS CLI, not Docker login)
-# ============================================
+def get_inventory(containers: bool = True, images: List[str] = None) -> docker_api.Inventory:
+    """Compose containers and local images (or just the given ones), one listing each (Engine API or CLI)"""
+    return docker_api.load_inventory(DOCKER_CLIENT, lambda command: run_command(docker_command(command)),
+                                     containers=containers, images=images)
 
 
-def check_ecr_access() -> bool:
-    """Check if AWS CLI can access ECR Public API"""
-    success, output = run_command(
-        "aws ecr-public describe-images --repository-name req_router "
-        "--region us-east-1 --max-results 1 --output json 2>&1",
-        timeout=15
-    )
+def format_repo_digests(inventory: docker_api.Inventory, image: str) -> str:
+    """
+    RepoDigests of a local image, formatted as
+    docker inspect --format='{{.RepoDigests}}' prints them. Empty if not present.
+    """
+    if not inventory.image(image):
+        return ""
+    return f"[{' '.join(inventory.repo_digests(image))}]"
+
+
+def tag_image(source: str, target: str) -> bool:
+    """Tag a local image under another reference"""
+    repository, tag = target.rsplit(':', 1)
+    if DOCKER_CLIENT:
+        try:
+            DOCKER_CLIENT.tag(source, repository, tag)
+            return True
+        except (docker_api.DockerAPIError, OSError):
+            return False
+
+    success, _ = run_command(docker_command(f"docker tag {source} {target}"))
     return success
 
 
-def resolve_tag_from_ecr(service_name: str, image_digest: str = None) -> Optional[str]:
+def list_compose_containers(all: bool = False) -> Optional[List[Dict]]:
     """
-    Query ECR Public to find the semantic version tag for a service.
-    
-    Args:
-        service_name: Name of the service (e.g., 'req_router')
-        image_digest: Optional digest to match (e.g., 'sha256:abc123...')
-        
-    Returns:
-        Semantic version tag (e.g., '1.35') or None if unable to resolve
+    Containers of the compose project (stopped ones too if all), shaped like
+    'docker compose ps --format json'. Returns None if they could not be listed.
     """
-    # Query AWS ECR Public API for image details
-    success, output = run_command(
-        f"aws ecr-public describe-images --repository-name {service_name} "
-        f"--region us-east-1 --output json 2>&1",
-        timeout=30
-    )
-    
+    if DOCKER_CLIENT:
+        try:
+            return DOCKER_CLIENT.compose_ps(all=all)
+        except (docker_api.DockerAPIError, OSError):
+            return None
+
+    flags = "-a --format json" if all else "--format json"
+    success, output = run_command(docker_command(f"docker compose ps {flags}"))
     if not success:
         return None
-    
     try:
-        ecr_data = json.loads(output)
-        image_details = ecr_data.get('imageDetails', [])
-        
-        # If we have a digest, try to match it first
-        if image_digest:
-            # Clean up digest format (remove brackets and prefix)
-            clean_digest = image_digest.strip('[]').split('@')[-1] if '@' in image_digest else image_digest
-            
-            for image_detail in image_details:
-                ecr_digest = image_detail.get('imageDigest', '')
-                if clean_digest and ecr_digest and (ecr_digest == clean_digest or clean_digest in ecr_digest or ecr_digest in clean_digest):
-                    tags = image_detail.get('imageTags', [])
-                    semantic_tags = [t for t in tags if t != 'latest' and not t.startswith('sha')]
-                    if semantic_tags:
-                        # Sort to get highest version
-                        try:
-                            semantic_tags.sort(
-                                key=lambda x: [int(p) if p.isdigit() else p for p in x.replace('-', '.').split('.')],
-                                reverse=True
-                            )
-                        except (ValueError, AttributeError):
-                            pass
-                        return semantic_tags[0]
-        
-        # Fallback: Find the image tagged as 'latest' and get its semantic version
-        for image_detail in image_details:
-            tags = image_detail.get('imageTags', [])
-            if 'latest' in tags:
-                semantic_tags = [t for t in tags if t != 'latest' and not t.startswith('sha')]
-                if semantic_tags:
-                    try:
-                        semantic_tags.sort(
-                            key=lambda x: [int(p) if p.isdigit() else p for p in x.replace('-', '.').split('.')],
-                            reverse=True
-                        )
-                    except (ValueError, AttributeError):
-                        pass
-                    return semantic_tags[0]
-                    
-    except (json.JSONDecodeError, KeyError):
-        pass
-    
-    return None
+        return [json.loads(line) for line in output.strip().split('\n') if line.strip()]
+    except json.JSONDecodeError:
+        return None
 
 
 # ============================================
-# VERSION MANAGER CLASS
+# LOCAL IMAGE INDEX
 # ============================================
 
-class VersionManager:
-    def __init__(self):
-        self.manifest_file = 'version-manifest.yaml'
-        self.versions_env = 'versions.env'
-        self.backup_dir = '.version-backups'
-        self.manifest = self.load_manifest()
-
-    def load_manifest(self) -> Dict:
-        """Load version manifest or create default"""
-        if os.path.exists(self.manifest_file):
-            with open(self.manifest_file, 'r') as f:
-                return yaml.safe_load(f) or self.create_default_manifest()
-        return self.create_default_manifest()
+DIGEST_PATTERN = re.compile(r'sha256:[0-9a-f]{64}')
 
-    def create_default_manifest(self) -> Dict:
-        """Create a default manifest structure"""
-        return {
-            'schema_version': '1.0',
-            'deployment_id': f'dkapp-{datetime.now().strftime("%Y%m%d")}',
-            'customer_id': '',
-            'ecr': {
-                'registry': 'public.ecr.aws',
-                'repository_alias': 'n5k3t9x2',
-                'use_private': False,
-                'private_registry': '',
-                'private_region': 'us-east-1'
-            },
-            'services': {},
-            'history': {},
-            'custom_overrides': {}
-        }
 
-    def save_manifest(self):
-        """Save manifest with backup"""
-        self.backup_manifest()
-        with open(self.manifest_file, 'w') as f:
-            yaml.dump(self.manifest, f, default_flow_style=False, sort_keys=False)
-
-    def backup_manifest(self):
-        """Backup current manifest before changes"""
-        if os.path.exists(self.manifest_file):
-            os.makedirs(self.backup_dir, exist_ok=True)
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            backup_path = f"{self.backup_dir}/{self.manifest_file}.{timestamp}"
-            shutil.copy(self.manifest_file, backup_path)
-            return backup_path
-        return None
+class LocalImageIndex:
+    """
+    Map of local 'repo:tag' references to the digests they resolve to
+    (image ID plus every repo digest), built from one batched inspect.
+    """
 
-    def get_registry(self) -> str:
-        """Get current registry URL"""
-        ecr = self.manifest.get('ecr', {})
-        if ecr.get('use_private') and ecr.get('private_registry'):
-            return ecr.get('private_registry')
-        registry = ecr.get('registry', 'public.ecr.aws')
-        alias = ecr.get('repository_alias', 'n5k3t9x2')
-        return f"{registry}/{alias}"
+    def __init__(self, by_tag: Dict[str, set] = None):
+        self.by_tag = by_tag or {}
+
+    @classmethod
+    def build(cls, inventory: Optional[docker_api.Inventory] = None) -> 'LocalImageIndex':
+        """List every local image in a single API request (or docker call)"""
+        images = (inventory or get_inventory(containers=False)).images
+        by_tag = {}
+        for image in images:
+            digests = {image.get('Id', '')}
+            digests.update(d.split('@', 1)[-1] for d in image.get('RepoDigests') or [])
+            digests.discard('')
+            for ref in image.get('RepoTags') or []:
+                by_tag.setdefault(ref, set()).update(digests)
+        return cls(by_tag)
+
+    def is_present(self, image: str, recorded_digest: str = '') -> bool:
+        """
+        True if image is already available locally and needs no pull.
 
-    def get_full_image(self, service: str, tag: str = None) -> str:
-        """Get full image name with registry and tag"""
-        registry = self.get_registry()
-        if tag is None:
-            tag = self.get_current_tag(service)
-        return f"{registry}/{service}:{tag}"
+        With a recorded digest (manifest image_digest and/or image_id) the
+        local tag must resolve to it. Without one, only non-'latest' tags count as present,
+        since 'latest' may have moved in the registry.
+        """
+        local = self.by_tag.get(image)
+        if not local:
+            return False
+        expected = set(DIGEST_PATTERN.findall(recorded_digest or ''))
+        if expected:
+            return bool(expected & local)
+        return not image.endswith(':latest')
 
-    def get_current_tag(self, service: str) -> str:
-        """Get current tag for a service"""
-        # Check custom overrides first
-        override = self.manifest.get('custom_overrides', {}).get(service, {})
-        if override.get('tag'):
-            return override['tag']
-        # Then check services
-        return self.manifest.get('services', {}).get(service, {}).get('current_tag', 'latest')
 
-    def get_previous_tag(self, service: str) -> Optional[str]:
-        """Get previous tag for a service from history"""
-        history = self.manifest.get('history', {}).get(service, [])
-        current_tag = self.get_current_tag(service)
+# ============================================
+# UPDATE CHECK
+# ============================================
 
-        # First pass: look for entry explicitly marked 'previous'
-        # that differs from what's currently deployed
-        for entry in history:
-            if entry.get('status') == 'previous' and entry.get('tag') != current_tag:
-                return entry.get('tag')
+# major.minor[.patch...] with an optional pre-release suffix; single numbers
+# are left out so build numbers and all-digit commit SHAs never count as versions
+VERSION_TAG_PATTERN = re.compile(r'^v?(\d+(?:\.\d+)+)(?:-([0-9A-Za-z.-]+))?$')
 
-        # Second pass: find the first non-current, non-rolled-back entry
-        # with a different tag. Handles post-rollback state where no 'previous' exists.
-        for entry in history:
-            tag = entry.get('tag')
-            status = entry.get('status', '')
-            if status not in ('current', 'rolled-back') and tag != current_tag:
-                return tag
 
+def version_key(tag: str) -> Optional[Tuple]:
+    """
+    Sort key for a version tag ('1.42', 'v2.0.1', '1.5-rc.1'), or None for
+    other tags ('latest', 'rollback-...', SHAs). A release sorts after its
+    pre-releases, and numeric parts compare as numbers (1.10 > 1.9).
+    """
+    match = VERSION_TAG_PATTERN.match(tag or '')
+    if not match:
         return None
+    release = tuple(int(part) for part in match.group(1).split('.'))
+    while len(release) > 2 and release[-1] == 0:
+        release = release[:-1]  # 1.4.0 == 1.4
+    if match.group(2) is None:
+        return release, 1, ()
+    return release, 0, tuple((0, int(part), '') if part.isdigit() else (1, 0, part)
+                             for part in match.group(2).split('.'))
+
+
+class UpdateCheck:
+    """Result of checking one service's repository for a newer release"""
+
+    def __init__(self, service: str, current: str):
+        self.service = service
+        self.current = current
+        self.latest = ''
+        self.status = 'unknown'  # update, current, unknown, error
+        self.note = ''
+        self.size = 0  # Compressed bytes of the newer image
+        self.download = 0  # Compressed bytes of its layers the current version lacks
+
+
+def check_service_update(client: registry_v2.RegistryClient, repository: str, service: str,
+                         current: str, recorded_digests: List[str]) -> UpdateCheck:
+    """
+    Compare a service's current tag with the newest release tag in repository.
+    Manifests are only fetched when the tags alone cannot decide: for the
+    download size of an update, or when the current tag is not a version
+    ('latest'), by comparing the recorded digest with the newest release.
+    """
+    check = UpdateCheck(service, current)
+    try:
+        releases = sorted((key, tag) for key, tag in ((version_key(t), t) for t in client.tags(repository))
+                          if key and key[1] == 1)
+        if not releases:
+            check.note = 'no version tags'
+            return check
+        latest_key, check.latest = releases[-1]
+        current_key = version_key(current)
+        if current_key and current_key >= latest_key:
+            check.status = 'current'
+            return check
+        if not current_key and not recorded_digests:
+            check.note = 'no digest recorded'
+            return check
+
+        latest = client.image_info(repository, check.latest)
+        if not current_key and {latest['digest'], latest['platform_digest']} & set(recorded_digests):
+            check.status = 'current'
+            check.note = 'digest matches'
+            return check
+
+        check.status = 'update'
+        check.size = check.download = latest['size']
+        try:
+            installed = client.image_info(repository, current if current_key else recorded_digests[0])
+            check.download = sum(size for digest, size in latest['layers'].items()
+                                 if digest not in installed['layers'])
+        except registry_v2.RegistryError:
+            pass  # Current version no longer listed: the whole image is new
+    except registry_v2.RegistryError as e:
+        check.status = 'error'
+        check.note = str(e)
+    return check
 
-    # ==================
-    # SHOW COMMANDS
-    # ==================
 
-    def show(self):
-        """Display current versions"""
-        print_header("Current Deployed Versions")
+# ============================================
+# IMAGE GARBAGE COLLECTION
+# ============================================
 
-        services = self.manifest.get('services', {})
-        overrides = self.manifest.get('custom_overrides', {})
+def list_images_with_sizes() -> List[Dict]:
+    """Local images with Size; from the Engine API also SharedSize (bytes in layers other images use)"""
+    if DOCKER_CLIENT:
+        try:
+            return DOCKER_CLIENT.images(shared_size=True)
+        except (docker_api.DockerAPIError, OSError):
+            return []
+    return get_inventory(containers=False).images
 
-        if not services:
-            print_warning("No versions tracked yet. Run 'make migrate-versions' to initialize.")
-            return
 
-        for name in SERVICES:
-            info = services.get(name, {})
-            tag = info.get('current_tag', 'unknown')
-            deployed = info.get('deployed_at', '')[:10] if info.get('deployed_at') else 'unknown'
+def container_image_ids() -> set:
+    """IDs of the images used by any container on the host, running or not"""
+    if DOCKER_CLIENT:
+        try:
+            return {c.get('ImageID', '') for c in DOCKER_CLIENT.containers(all=True)} - {''}
+        except (docker_api.DockerAPIError, OSError):
+            return set()
 
-            # Check for override
-            override = overrides.get(name, {})
-            if override.get('tag'):
-                tag = override['tag']
-                reason = override.get('reason', 'custom')
-                print(f"  {name:.<40} {tag:<15} ({deployed}) [{reason}]")
-            else:
-                print(f"  {name:.<40} {tag:<15} ({deployed})")
+    success, output = run_command(docker_command(
+        "docker ps -aq --no-trunc | xargs -r docker inspect --format '{{.Image}}'"
+    ))
+    return set(output.split()) if success else set()
 
-        print()
 
-    def history(self, service: str = None):
-        """Show version history"""
-        print_header("Version History")
+def plan_image_gc(images: List[Dict], repos: Dict[str, str], keep_tags: Dict[str, set],
+                  keep_ids: set) -> List[Dict]:
+    """
+    Decide what gc removes from images (an image listing).
 
-        history = self.manifest.get('history', {})
+    repos maps our repositories to their service; tags of those repositories
+    not in keep_tags[service] are removed. Images in keep_ids are left alone.
+    An image is deleted only if all its tags go (or it is an untagged old
+    version of one of our repositories).
 
-        if not history:
-            print_warning("No version history available.")
-            return
+    Returns one entry per affected image: id, refs to remove, delete (the
+    image goes away) and bytes (estimated space freed).
+    """
+    plan = []
+    for image in images:
+        tags = [t for t in image.get('RepoTags') or [] if t != '<none>:<none>']
+        ours = [t for t in tags if docker_api.split_reference(t)[0] in repos]
+        dangling = not tags and any(d.split('@')[0] in repos for d in image.get('RepoDigests') or [])
+        if (not ours and not dangling) or image.get('Id') in keep_ids:
+            continue
+
+        removable = []
+        for ref in ours:
+            repo, tag = docker_api.split_reference(ref)
+            if tag not in keep_tags.get(repos[repo], set()):
+                removable.append(ref)
+
+        if len(removable) < len(tags):
+            if removable:
+                plan.append({'id': image.get('Id', ''), 'refs': removable, 'delete': False, 'bytes': 0})
+            continue
+
+        size = image.get('Size') or 0
+        shared = image.get('SharedSize', -1)
+        plan.append({
+            'id': image.get('Id', ''),
+            'refs': removable or [image.get('Id', '')],
+            'delete': True,
+            'bytes': size - shared if shared and shared > 0 else size,
+        })
+    return plan
 
-        if service:
-            if service in history:
-                print(f"\n{Colors.BOLD}{service}:{Colors.ENDC}")
-                for entry in history[service][:HISTORY_LIMIT]:
-                    tag = entry.get('tag', 'unknown')
-                    deployed = entry.get('deployed_at', '')[:19] if entry.get('deployed_at') else 'unknown'
-                    status = entry.get('status', '')
-                    status_str = f" [{status}]" if status else ""
-                    print(f"  {tag:<20} {deployed:<25} {status_str}")
-            else:
-                print_warning(f"No history for service: {service}")
-        else:
-            for svc in SERVICES:
-                entries = history.get(svc, [])
-                if entries:
-                    print(f"\n{Colors.BOLD}{svc}:{Colors.ENDC}")
-                    for entry in entries[:HISTORY_LIMIT]:
-                        tag = entry.get('tag', 'unknown')
-                        deployed = entry.get('deployed_at', '')[:19] if entry.get('deployed_at') else 'unknown'
-                        status = entry.get('status', '')
-                        status_str = f" [{status}]" if status else ""
-                        print(f"  {tag:<20} {deployed:<25} {status_str}")
-        print()
 
-    # ==================
-    # PULL COMMANDS
-    # ==================
+def remove_image(ref: str) -> Tuple[bool, str]:
+    if DOCKER_CLIENT:
+        try:
+            DOCKER_CLIENT.remove_image(ref)
+            return True, ''
+        except (docker_api.DockerAPIError, OSError) as e:
+            return False, str(e)
 
-    def pull(self, service: str, tag: str):
-        """Pull specific version for a service
+    return run_command(docker_command(f"docker rmi {ref}"))
 
-        Each service has its own version (e.g., req_router:1.35, taskservice:1.42)
-        """
-        if service not in SERVICES:
-            print_error(f"Unknown service: {service}")
-            print_info(f"Available services: {', '.join(SERVICES)}")
-            return
 
-        print_header(f"Pulling {service}:{tag}")
+# ============================================
+# CONCURRENT PULL SCHEDULER
+# ============================================
 
-        registry = self.get_registry()
-        image = f"{registry}/{service}:{tag}"
-        print_info(f"Pulling {image}...")
+class PullJob:
+    """State of a single image pull, owned by the worker that runs it"""
 
-        success, output = docker_pull_with_retry(image)
-        if success:
-            print_success(f"Pulled {service}:{tag}")
-            self.update_service_version(service, tag)
-            self.save_manifest()
-            self.generate_env()
-            print_info("Run 'make down && make up' to apply changes")
-        else:
-            print_error(f"Failed to pull {service}:{tag}")
-            print(f"  {output}")
+    def __init__(self, service: str, tag: str, image: str, digest: str = ''):
+        self.service = service
+        self.tag = tag
+        self.image = image
+        self.digest = digest  # Pull exactly this content, then point the tag at it
+        self.status = 'pending'  # pending, pulling, pulled, present, failed
+        self.attempts = 0
+        self.elapsed = 0.0
+        self.output = ''
 
-    def pull_from_manifest(self):
-        """Pull versions specified in manifest"""
-        print_header("Pulling Versions from Manifest")
+    @property
+    def success(self) -> bool:
+        return self.status in ('pulled', 'present')
 
-        services = self.manifest.get('services', {})
-        if not services:
-            print_warning("No versions in manifest. Using :latest for all services.")
-            self.pull('latest')
-            return
 
-        registry = self.get_registry()
-        success_count = 0
+def get_pull_workers(workers: Optional[int] = None) -> int:
+    """Resolve the pull worker count from the CLI flag, DK_PULL_WORKERS or the default"""
+    if workers is None:
+        try:
+            workers = int(os.environ.get('DK_PULL_WORKERS', DEFAULT_PULL_WORKERS))
+        except ValueError:
+            workers = DEFAULT_PULL_WORKERS
+    return max(1, workers)
 
-        for name in SERVICES:
-            tag = self.get_current_tag(name)
-            image = f"{registry}/{name}:{tag}"
-            print_info(f"Pulling {image}...")
 
-            success, output = docker_pull_with_retry(image)
-            if success:
-                print_success(f"Pulled {name}:{tag}")
-                success_count += 1
-            else:
-                print_error(f"Failed to pull {name}:{tag}")
-                if output:
-                    print(f"  {output}")
+def run_pull_job(job: PullJob, max_attempts: int = 3, backoff: float = 5.0) -> PullJob:
+    """
+    Pull one image, retrying transient registry/network errors with backoff.
+    Expired-token handling is left to docker_pull_with_retry.
+    """
+    job.status = 'pulling'
+    start = time.time()
+    reference = f"{job.image.rsplit(':', 1)[0]}@{job.digest}" if job.digest else job.image
 
-        print_success(f"\nPulled {success_count}/{len(SERVICES)} services")
+    while job.attempts < max_attempts:
+        job.attempts += 1
+        success, output = docker_pull_with_retry(reference)
+        job.output = output
 
-    def pull_latest(self):
-        """Pull :latest for all services and update manifest
-        
-        This is the recommended way to update all services to latest.
-        It pulls images, updates manifest, and resolves semantic versions from ECR.
-        """
-        print_header("Pulling Latest Images")
+        if success and job.digest and not tag_image(reference, job.image):
+            success, job.output = False, f"Pulled {reference} but could not tag it as {job.image}"
+        if success:
+            job.status = 'pulled'
+            break
 
-        registry = self.get_registry()
-        pulled_services = []
+        transient = any(err in output.lower() for err in TRANSIENT_PULL_ERRORS)
+        if not transient or job.attempts >= max_attempts:
+            job.status = 'failed'
+            break
 
-        # Step 1: Pull all :latest images
-        for svc in SERVICES:
-            image = f"{registry}/{svc}:latest"
-            print_info(f"Pulling {image}...")
+        time.sleep(backoff * job.attempts)
 
-            success, output = docker_pull_with_retry(image)
-            if success:
-                pulled_services.append(svc)
-                print_success(f"Pulled {svc}:latest")
+    job.elapsed = time.time() - start
+    return job
+
+
+def pull_images(images: List[Tuple[str, str]], registry: str, workers: Optional[int] = None,
+                local_index: Optional[LocalImageIndex] = None,
+                digests: Optional[Dict[str, str]] = None,
+                pins: Optional[Dict[str, str]] = None) -> List[PullJob]:
+    """
+    Pull (service, tag) pairs with a bounded number of concurrent workers.
+
+    When local_index is given, images already present locally (matching the
+    recorded digest in digests, keyed by service) are skipped. Services in
+    pins are pulled by that digest rather than by tag.
+    Progress is printed as each pull finishes. Jobs are returned in the
+    order they were given so reports stay stable between runs.
+    """
+    jobs = [PullJob(svc, tag, f"{registry}/{svc}:{tag}", (pins or {}).get(svc, '')) for svc, tag in images]
+    if not jobs:
+        return jobs
+
+    pending = []
+    for job in jobs:
+        if local_index and local_index.is_present(job.image, (digests or {}).get(job.service, '')):
+            job.status = 'present'
+            print(f"  = {job.service}:{job.tag} (already present)")
+        else:
+            pending.append(job)
+
+    if not pending:
+        print_info("All images already present locally, nothing to pull")
+        return jobs
+
+    workers = min(get_pull_workers(workers), len(pending))
+    print_info(f"Pulling {len(pending)} image(s) with {workers} worker(s)...")
+
+    print_lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_pull_job, job) for job in pending]
+        for future in as_completed(futures):
+            job = future.result()
+            with print_lock:
+                if job.success:
+                    print(f"  \u2713 {job.service}:{job.tag} ({job.elapsed:.1f}s)")
+                else:
+                    print(f"  \u2717 {job.service}:{job.tag} (failed after {job.attempts} attempt(s))")
+
+    return jobs
+
+
+def print_pull_report(jobs: List[PullJob]):
+    """Print an aggregate result table and details for any failed pulls"""
+    if not jobs:
+        return
+
+    print()
+    print(f"  {'SERVICE':<16} {'TAG':<20} {'STATUS':<8} {'TRIES':>5} {'TIME':>8}")
+    for job in jobs:
+        status = {'pulled': 'ok', 'present': 'cached'}.get(job.status, 'FAILED')
+        print(f"  {job.service:<16} {job.tag:<20} {status:<8} {job.attempts:>5} {job.elapsed:>7.1f}s")
+
+    failed = [job for job in jobs if not job.success]
+    cached = sum(1 for job in jobs if job.status == 'present')
+    ready = len(jobs) - len(failed)
+    cached_note = f", {cached} already present" if cached else ""
+    wall_time = max(job.elapsed for job in jobs)
+    print()
+    if failed:
+        print_warning(f"Ready {ready}/{len(jobs)} images{cached_note}; {len(failed)} failed")
+        for job in failed:
+            print_error(f"{job.image}")
+            if job.output:
+                print(f"    {job.output.splitlines()[-1]}")
+    else:
+        print_success(f"Ready {ready}/{len(jobs)} images{cached_note} (slowest: {wall_time:.1f}s)")
+
+
+# ============================================
+# ROLLING RESTART
+# ============================================
+
+# Seconds to wait for a recreated service to become healthy
+SERVICE_HEALTH_TIMEOUT = 180
+
+# Set once the .env.gpg values are in this process's environment
+COMPOSE_ENV_LOADED = False
+
+# Services without a healthcheck count as up once running this long
+SERVICE_STABLE_SECONDS = 10
+
+
+def load_compose_dependencies(compose_file: str = 'docker-compose.yml') -> Dict[str, List[str]]:
+    """Map each compose service to the services it depends_on (list or mapping form)"""
+    try:
+        with open(compose_file, 'r') as f:
+            compose = yaml.load(f, Loader=manifest_store.YAML_LOADER) or {}
+    except (OSError, yaml.YAMLError):
+        return {}
+
+    dependencies = {}
+    for name, definition in (compose.get('services') or {}).items():
+        depends_on = (definition or {}).get('depends_on') or []
+        dependencies[name] = list(depends_on.keys() if isinstance(depends_on, dict) else depends_on)
+    return dependencies
+
+
+def compose_restart_order(services: List[str], compose_file: str = 'docker-compose.yml') -> List[str]:
+    """
+    Order compose services for a rolling restart: reverse of startup order,
+    so dependents are swapped before the services they depend on.
+    """
+    dependencies = load_compose_dependencies(compose_file)
+    startup_order = []
+    visiting = set()
+
+    def visit(name: str):
+        if name in startup_order or name in visiting:
+            return
+        visiting.add(name)
+        for dependency in dependencies.get(name, []):
+            visit(dependency)
+        visiting.discard(name)
+        startup_order.append(name)
+
+    for name in list(dependencies) + services:
+        visit(name)
+    return [name for name in reversed(startup_order) if name in services]
+
+
+def prepare_compose_env() -> bool:
+    """
+    Make the configuration available for compose variable substitution.
+    Compose reads an unencrypted .env itself; otherwise the values of
+    .env.gpg (from the config agent, or decrypted once by this process)
+    are exported into this process's environment, which the compose
+    commands inherit. Nothing decrypted is written to disk.
+
+    Returns:
+        False if .env.gpg could not be decrypted
+    """
+    global COMPOSE_ENV_LOADED
+    if COMPOSE_ENV_LOADED or os.path.exists('.env') or not os.path.exists('.env.gpg'):
+        return True
+
+    values = config_agent.agent_values()
+    if values is None:
+        print_info("Decrypting .env.gpg...")
+        values = config_agent.decrypt()
+    if values is None:
+        return False
+    for key, value in values.items():
+        os.environ.setdefault(key, value)
+    COMPOSE_ENV_LOADED = True
+    return True
+
+
+def config_agent_command(action: str, ttl: Optional[int] = None) -> bool:
+    """Start, stop or show the config agent that holds the decrypted .env.gpg"""
+    running = config_agent.status()
+    if action == 'status':
+        if running:
+            print_info(f"Config agent running (PID {running['pid']}): {running['keys']} values, "
+                       f"expires in {running['expires_in']}s")
+        else:
+            print_info("Config agent is not running")
+        return True
+
+    if action == 'stop':
+        if config_agent.stop():
+            print_success("Config agent stopped; decrypted values dropped")
+        else:
+            print_info("Config agent is not running")
+        return True
+
+    if os.path.exists('.env'):
+        print_info("Using the unencrypted .env; no config agent needed")
+        return True
+    if not os.path.exists('.env.gpg'):
+        print_error("No .env.gpg found. Have you run the installation?")
+        return False
+    if running:
+        print_info(f"Config agent already running (expires in {running['expires_in']}s)")
+        return True
+
+    print_info("Decrypting .env.gpg...")
+    if not config_agent.start(ttl):
+        print_error("Could not decrypt .env.gpg")
+        return False
+    running = config_agent.status() or {}
+    print_success(f"Configuration held in memory for {running.get('expires_in', 0)}s "
+                  f"(stop early: make config-agent-stop)")
+    return True
+
+
+def versions_env_prefix() -> str:
+    """Shell prefix exporting versions.env, so compose uses the manifest's versions"""
+    return "set -a && . ./versions.env && set +a && " if os.path.exists('versions.env') else ""
+
+
+def recreate_service(compose_service: str, compose_file: str = 'docker-compose.yml') -> Tuple[bool, str]:
+    """Recreate one compose service with the versions in versions.env, leaving the others running"""
+    return recreate_services([compose_service], compose_file)
+
+
+def recreate_services(compose_services: List[str], compose_file: str = 'docker-compose.yml') -> Tuple[bool, str]:
+    """Recreate compose services in one compose call (in parallel where depends_on allows)"""
+    return run_command(versions_env_prefix() + docker_command(
+        f"docker compose -f {compose_file} up -d --no-deps {' '.join(compose_services)}"
+    ))
+
+
+def wait_for_service(compose_service: str, timeout: int = SERVICE_HEALTH_TIMEOUT) -> Tuple[bool, str]:
+    """
+    Wait until a compose service's container is healthy (or running and
+    stable, if it has no healthcheck). Gives up early if it exits or turns unhealthy.
+
+    Returns:
+        Tuple of (healthy, last observed state)
+    """
+    waiter = ReadinessWaiter([compose_service], timeout, fail_fast=True)
+    ready = waiter.wait()
+    return ready, waiter.states.get(compose_service, 'not created')
+
+
+# ============================================
+# READINESS WAITER
+# ============================================
+
+DEFAULT_READY_TIMEOUT = 180
+
+# How often to re-check state (and run healthchecks) between events
+READY_PROBE_INTERVAL = 2
+
+
+def get_ready_timeout(timeout: Optional[int] = None) -> int:
+    """Resolve the readiness deadline from the CLI flag, DK_READY_TIMEOUT or the default"""
+    if timeout is None:
+        try:
+            timeout = int(os.environ.get('DK_READY_TIMEOUT', DEFAULT_READY_TIMEOUT))
+        except ValueError:
+            timeout = DEFAULT_READY_TIMEOUT
+    return max(1, timeout)
+
+
+def get_healthcheck(container_id: str) -> Optional[List[str]]:
+    """The container's healthcheck as an exec command, or None if it has none"""
+    if DOCKER_CLIENT:
+        try:
+            config = DOCKER_CLIENT.inspect_container(container_id).get('Config') or {}
+        except (docker_api.DockerAPIError, OSError):
+            return None
+        test = (config.get('Healthcheck') or {}).get('Test') or []
+    else:
+        success, output = run_command(docker_command(
+            f"docker inspect --format='{{{{json .Config.Healthcheck}}}}' {container_id}"
+        ))
+        try:
+            test = ((json.loads(output) or {}).get('Test') or []) if success else []
+        except json.JSONDecodeError:
+            test = []
+
+    if len(test) >= 2 and test[0] == 'CMD-SHELL':
+        return ['/bin/sh', '-c', test[1]]
+    if len(test) >= 2 and test[0] == 'CMD':
+        return test[1:]
+    return None
+
+
+def run_healthcheck(container_id: str, command: List[str]) -> bool:
+    """Run a healthcheck command inside the container now; True if it exits 0"""
+    if DOCKER_CLIENT:
+        try:
+            exit_code, _ = DOCKER_CLIENT.exec_run(container_id, command, timeout=10)
+            return exit_code == 0
+        except (docker_api.DockerAPIError, OSError, KeyError):
+            return False
+
+    success, _ = run_command(docker_command(f"docker exec {container_id} {shlex.join(command)}"), timeout=15)
+    return success
+
+
+class ReadinessWaiter:
+    """
+    Wait for compose services to become ready, returning as soon as they are.
+
+    A service is ready when its container is healthy, or, for services
+    without a healthcheck, once it has been running for SERVICE_STABLE_SECONDS.
+    Docker only runs healthchecks every 'interval', so while a container is
+    still 'starting' its healthcheck is also run directly; the first pass
+    counts as ready. State is re-read whenever a Docker event arrives for
+    the project (Engine API), or every READY_PROBE_INTERVAL seconds.
+    """
+
+    def __init__(self, services: List[str], timeout: Optional[int] = None, fail_fast: bool = False):
+        self.services = services
+        self.timeout = get_ready_timeout(timeout)
+        self.fail_fast = fail_fast
+        self.states = {svc: 'not created' for svc in services}
+        self.ready_at = {}
+        self.running_since = {}
+        self.probe_passed = set()
+        self.healthchecks = {}
+        self.failed = set()
+        self.stale = None
+        self.stopped = threading.Event()
+
+    def stop(self):
+        """Make wait() return (False unless everything is ready) at its next check"""
+        self.stopped.set()
+
+    def _refresh(self, start: float):
+        listed = list_compose_containers(all=True) or []
+        if self.stale is None:
+            # Already stopped when waiting began (e.g. by 'docker compose stop'): not a failure
+            self.stale = {c.get('ID') for c in listed if c.get('State') in ('exited', 'dead')}
+        # Per service: its running container, else one not already stopped when waiting began
+        containers = {}
+        for container in sorted(listed, key=lambda c: (c.get('State') == 'running', c.get('ID') not in self.stale)):
+            containers[container.get('Service')] = container
+        now = time.time()
+
+        for svc in self.services:
+            if svc in self.ready_at:
+                continue
+            container = containers.get(svc)
+            if not container:
+                self.states[svc] = 'not created'
+                continue
+
+            container_id = container.get('ID', '')
+            status, health = container.get('State', ''), container.get('Health', '')
+            self.states[svc] = f"{status} [{health}]" if health else status
+
+            if status != 'running':
+                self.running_since.pop(svc, None)
+                if status in ('exited', 'dead') and container_id not in self.stale:
+                    self.failed.add(svc)
+                continue
+
+            self.stale.discard(container_id)
+            self.failed.discard(svc)
+            if health == 'healthy' or (health == 'starting' and container_id in self.probe_passed):
+                self.states[svc] = 'running [healthy]'
+                self.ready_at[svc] = now - start
+            elif health == 'unhealthy':
+                self.failed.add(svc)
+            elif not health:
+                self.running_since.setdefault(svc, now)
+                if now - self.running_since[svc] >= SERVICE_STABLE_SECONDS:
+                    self.ready_at[svc] = now - start
+            elif health == 'starting':
+                if container_id not in self.healthchecks:
+                    self.healthchecks[container_id] = get_healthcheck(container_id)
+                command = self.healthchecks[container_id]
+                if command and run_healthcheck(container_id, command):
+                    self.probe_passed.add(container_id)
+                    self.states[svc] = 'running [healthy]'
+                    self.ready_at[svc] = now - start
+
+    def _subscribe(self) -> Tuple[Optional[object], Optional[queue.Queue]]:
+        """Subscribe to the project's container events (Engine API only)"""
+        if not DOCKER_CLIENT:
+            return None, None
+        project = docker_api.compose_project_name()
+        try:
+            conn, events = DOCKER_CLIENT.event_stream(
+                filters={'type': ['container'], 'label': [f"{docker_api.COMPOSE_PROJECT_LABEL}={project}"]},
+                since=int(time.time())
+            )
+        except (docker_api.DockerAPIError, OSError):
+            return None, None
+
+        notifications = queue.Queue()
+
+        def read_events():
+            try:
+                for event in events:
+                    notifications.put(event)
+            except Exception:
+                pass
+            notifications.put(None)
+
+        threading.Thread(target=read_events, daemon=True).start()
+        return conn, notifications
+
+    def wait(self, on_ready: Callable[[str, str, float], None] = None, start: float = None) -> bool:
+        """
+        Block until every service is ready, the deadline passes or stop() is called.
+        on_ready(service, state, seconds) is called as each service becomes ready;
+        seconds (and the deadline) count from start, default now.
+        """
+        start = start or time.time()
+        deadline = start + self.timeout
+        conn, notifications = self._subscribe()
+        reported = set()
+
+        try:
+            while True:
+                self._refresh(start)
+                for svc in self.services:
+                    if svc in self.ready_at and svc not in reported:
+                        reported.add(svc)
+                        if on_ready:
+                            on_ready(svc, self.states[svc], self.ready_at[svc])
+
+                if len(self.ready_at) == len(self.services):
+                    return True
+                if (self.fail_fast and self.failed) or self.stopped.is_set():
+                    return False
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+
+                wait = min(READY_PROBE_INTERVAL, remaining)
+                if notifications is None:
+                    time.sleep(wait)
+                    continue
+                try:
+                    event = notifications.get(timeout=wait)
+                    if event is None:
+                        notifications = None
+                    # Drain bursts (create/start/health_status arrive together)
+                    while notifications is not None and not notifications.empty():
+                        if notifications.get_nowait() is None:
+                            notifications = None
+                except queue.Empty:
+                    pass
+        finally:
+            if conn is not None:
+                conn.abort()
+
+    def pending(self) -> List[str]:
+        """Services that did not become ready"""
+        return [svc for svc in self.services if svc not in self.ready_at]
+
+
+# ============================================
+# HEALTH PROBES
+# ============================================
+
+# A freshly recreated service may need a few seconds before it meets its budget
+PROBE_SETTLE_SECONDS = 20
+
+
+def probe_services(services: List[str] = None,
+                   inventory: Optional[docker_api.Inventory] = None) -> List[health_probe.ProbeResult]:
+    """Probe compose services (default: every service in health_probe.PROBES) in parallel"""
+    inventory = inventory or get_inventory()
+    return health_probe.run_probes(health_probe.build_probes(inventory.services(), services))
+
+
+def print_probe_results(results: List[health_probe.ProbeResult]):
+    for result in results:
+        mark = '\u2713' if result.passed else '\u2717'
+        print(f"  {mark} {result.service}: {result.summary()}")
+
+
+def nginx_exec(command: List[str]) -> Tuple[bool, str]:
+    """Run a command in the running nginx container. Returns (success, output)."""
+    nginx = next((c for c in list_compose_containers() or []
+                  if c.get('Service') == 'nginx' and c.get('State') == 'running'), None)
+    if not nginx:
+        return False, 'nginx is not running'
+
+    if DOCKER_CLIENT:
+        try:
+            exit_code, output = DOCKER_CLIENT.exec_run(nginx['ID'], command)
+            return exit_code == 0, output
+        except (docker_api.DockerAPIError, OSError, KeyError) as e:
+            return False, str(e)
+
+    return run_command(docker_command(f"docker exec {nginx['ID']} {shlex.join(command)}"))
+
+
+def reload_nginx() -> bool:
+    """
+    Gracefully reload nginx so it re-resolves upstream names (it keeps the
+    address a recreated container had when nginx started otherwise)
+    """
+    success, _ = nginx_exec(['nginx', '-s', 'reload'])
+    return success
+
+
+def probe_service(compose_service: str, settle: int = PROBE_SETTLE_SECONDS) -> Tuple[bool, str]:
+    """
+    Probe one service until it passes or settle seconds have gone by.
+    Services without a probe pass.
+
+    Returns:
+        Tuple of (passed, probe summary)
+    """
+    if compose_service not in health_probe.PROBES:
+        return True, ''
+    if health_probe.PROBES[compose_service]['via'] == 'nginx':
+        reload_nginx()
+
+    deadline = time.time() + settle
+    while True:
+        result = probe_services([compose_service])[0]
+        if result.passed or time.time() >= deadline:
+            return result.passed, result.summary()
+        time.sleep(2)
+
+
+# ============================================
+# BLUE/GREEN
+# ============================================
+
+# Stateless services behind nginx that can run two versions side by side
+BLUE_GREEN_SERVICES = ['req_router', 'dagknows_nuxt']
+
+# Seconds the previous container is kept for an instant switch-back
+BLUE_GREEN_GRACE = 1800
+
+# Requests sent to a new container, once it first passes its probe, before it takes traffic
+BLUE_GREEN_WARMUP_SAMPLES = 20
+
+# Seconds to let nginx's old workers finish their requests to the previous
+# container before it is taken off the service name
+BLUE_GREEN_DRAIN_TIMEOUT = 30
+
+NGINX_CONF = 'nginx.conf'
+
+
+def start_alongside(compose_service: str, compose_file: str = 'docker-compose.yml') -> Tuple[bool, str]:
+    """Start a second container of a service with the versions in versions.env; the running one is untouched"""
+    return run_command(versions_env_prefix() + docker_command(
+        f"docker compose -f {compose_file} up -d --no-deps --no-recreate "
+        f"--scale {compose_service}=2 {compose_service}"
+    ))
+
+
+def remove_container(container_id: str) -> bool:
+    if DOCKER_CLIENT:
+        try:
+            DOCKER_CLIENT.remove_container(container_id)
+            return True
+        except (docker_api.DockerAPIError, OSError):
+            return False
+
+    success, _ = run_command(docker_command(f"docker rm -f {container_id}"))
+    return success
+
+
+def service_containers(compose_service: str) -> List[Dict]:
+    """All containers of one compose service (ID, Name, State, Image, IPAddress, ...)"""
+    return [c for c in get_inventory().containers if c.get('Service') == compose_service]
+
+
+def warm_up(compose_service: str, container_id: str, timeout: int = SERVICE_HEALTH_TIMEOUT) -> Tuple[bool, str]:
+    """
+    Probe a new container directly (not through nginx) until it passes, then
+    send BLUE_GREEN_WARMUP_SAMPLES more requests, which must pass as well.
+
+    Returns:
+        Tuple of (ready, probe summary or reason)
+    """
+    deadline = time.time() + timeout
+    while True:
+        container = next((c for c in service_containers(compose_service) if c['ID'] == container_id), None)
+        if not container or container.get('State') != 'running':
+            return False, f"container {container.get('State') if container else 'removed'}"
+
+        result = health_probe.run_probes([health_probe.container_probe(compose_service, container.get('IPAddress', ''))])[0]
+        if result.passed:
+            break
+        if time.time() >= deadline:
+            return False, result.summary()
+        time.sleep(2)
+
+    warm = health_probe.run_probes([health_probe.container_probe(compose_service, container.get('IPAddress', ''))],
+                                   samples=BLUE_GREEN_WARMUP_SAMPLES)[0]
+    return warm.passed, warm.summary()
+
+
+def nginx_upstream_pattern(compose_service: str) -> re.Pattern:
+    """proxy_pass targets for a service: its name, or one of its containers' names"""
+    name = re.escape(compose_service)
+    project = re.escape(docker_api.compose_project_name())
+    return re.compile(rf"(proxy_pass\s+https?://)(?:{name}|{project}-{name}-\d+)(?=[:/;])")
+
+
+def container_networks(container_id: str) -> Dict[str, List[str]]:
+    """Networks a container is attached to, with its DNS aliases on each"""
+    if DOCKER_CLIENT:
+        try:
+            data = DOCKER_CLIENT.inspect_container(container_id)
+        except (docker_api.DockerAPIError, OSError):
+            return {}
+    else:
+        success, output = run_command(docker_command(f"docker inspect {container_id}"))
+        if not success:
+            return {}
+        try:
+            data = (json.loads(output) or [{}])[0]
+        except json.JSONDecodeError:
+            return {}
+    networks = (data.get('NetworkSettings') or {}).get('Networks') or {}
+    return {name: (info or {}).get('Aliases') or [] for name, info in networks.items()}
+
+
+def set_service_alias(container_id: str, compose_service: str, enabled: bool) -> bool:
+    """
+    Add or remove the service name as a container's DNS alias on its networks.
+    Without it, clients using the service name (other services, not only
+    nginx) stop reaching the container; its container name still resolves.
+    Docker cannot change aliases in place, so the container is reconnected:
+    its connections on that network are cut and its address may change.
+    """
+    def reconnect(network: str, aliases: List[str]) -> bool:
+        if DOCKER_CLIENT:
+            try:
+                DOCKER_CLIENT.disconnect_network(network, container_id)
+            except (docker_api.DockerAPIError, OSError):
+                pass
+            try:
+                DOCKER_CLIENT.connect_network(network, container_id, aliases)
+                return True
+            except (docker_api.DockerAPIError, OSError):
+                return False
+        alias_flags = ' '.join(f"--alias {shlex.quote(alias)}" for alias in aliases)
+        run_command(docker_command(f"docker network disconnect {network} {container_id}"))
+        success, _ = run_command(docker_command(f"docker network connect {alias_flags} {network} {container_id}"))
+        return success
+
+    for network, aliases in container_networks(container_id).items():
+        if (compose_service in aliases) == enabled:
+            continue
+        changed = [a for a in aliases if a != compose_service] + ([compose_service] if enabled else [])
+        if not reconnect(network, changed):
+            # Never leave the container off the network: put the old aliases back
+            reconnect(network, aliases)
+            return False
+    return True
+
+
+def wait_nginx_drained(timeout: int = BLUE_GREEN_DRAIN_TIMEOUT) -> bool:
+    """Wait until no nginx worker from before the last reload is still shutting down; True if none is"""
+    deadline = time.time() + timeout
+    while True:
+        draining, _ = nginx_exec(['sh', '-c', 'grep -qs "shutting down" /proc/[0-9]*/cmdline'])
+        if not draining:
+            return True
+        if time.time() >= deadline:
+            return False
+        time.sleep(1)
+
+
+def nginx_upstream_hosts(compose_service: str) -> List[str]:
+    """Hosts nginx.conf proxies a service to: its name, or a container's during a blue/green deploy"""
+    try:
+        with open(NGINX_CONF, 'r') as f:
+            conf = f.read()
+    except OSError:
+        return []
+    return [m.group(0)[len(m.group(1)):] for m in nginx_upstream_pattern(compose_service).finditer(conf)]
+
+
+def write_in_place(path: str, text: str):
+    """
+    Rewrite a file keeping its inode. nginx.conf is bind-mounted as a single
+    file, so replacing it by rename would leave nginx reading the old copy.
+    """
+    with open(path, 'r+') as f:
+        f.write(text)
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def switch_nginx_upstream(compose_service: str, host: str) -> Tuple[bool, str]:
+    """
+    Point nginx's proxy_pass for a service at host (a container name, or the
+    service name for normal operation) and reload gracefully: in-flight
+    requests finish on the old workers, new ones go to host.
+
+    The new config is checked with 'nginx -t' before the reload and put back
+    if it fails, so nginx keeps serving the current upstream. If nginx is not
+    running the file is just rewritten for its next start.
+
+    Returns:
+        Tuple of (switched, error)
+    """
+    with open(NGINX_CONF, 'r') as f:
+        original = f.read()
+    updated, count = nginx_upstream_pattern(compose_service).subn(rf"\g<1>{host}", original)
+    if not count:
+        return False, f"no proxy_pass to {compose_service} in {NGINX_CONF}"
+    if updated != original:
+        write_in_place(NGINX_CONF, updated)
+
+    valid, output = nginx_exec(['nginx', '-t'])
+    if not valid and output == 'nginx is not running':
+        return True, ''
+    if valid:
+        valid, output = nginx_exec(['nginx', '-s', 'reload'])
+    if not valid:
+        if updated != original:
+            write_in_place(NGINX_CONF, original)
+        lines = output.strip().splitlines()
+        return False, lines[-1] if lines else 'nginx rejected the configuration'
+    return True, ''
+
+
+def blue_green_expired(state: Dict) -> bool:
+    switched_at = datetime.fromisoformat(state['switched_at'])
+    return (datetime.now() - switched_at).total_seconds() >= state.get('grace_seconds', BLUE_GREEN_GRACE)
+
+
+# ============================================
+# STARTUP ORCHESTRATOR
+# ============================================
+
+# Deadline for a cold start of both compose files (systemd allows 600s)
+STARTUP_TIMEOUT = 480
+
+# The app compose file has no depends_on for the databases (they are in
+# db-docker-compose.yml); a service using one of these variables needs it healthy
+DATASTORE_VARIABLES = {
+    'POSTGRESQL_DB_': 'postgres',
+    'DAGKNOWS_ELASTIC_URL': 'elasticsearch',
+}
+
+
+def load_startup_graph(compose_files: List[str] = None) -> Dict[str, Dict]:
+    """
+    One dependency graph across the compose files:
+    {service: {'compose_file': file, 'depends_on': {dependency: condition}}}.
+
+    Conditions come from depends_on (the list form means service_started),
+    plus service_healthy edges to the data stores a service's environment uses.
+    """
+    graph = {}
+    for compose_file in compose_files or COMPOSE_FILES:
+        try:
+            with open(compose_file, 'r') as f:
+                compose = yaml.load(f, Loader=manifest_store.YAML_LOADER) or {}
+        except (OSError, yaml.YAMLError):
+            continue
+
+        for name, definition in (compose.get('services') or {}).items():
+            definition = definition or {}
+            depends_on = definition.get('depends_on') or []
+            if isinstance(depends_on, dict):
+                conditions = {dep: (spec or {}).get('condition', 'service_started')
+                              for dep, spec in depends_on.items()}
+            else:
+                conditions = {dep: 'service_started' for dep in depends_on}
+
+            environment = definition.get('environment') or []
+            variables = list(environment) if isinstance(environment, dict) else \
+                [entry.split('=', 1)[0] for entry in environment]
+            for prefix, datastore in DATASTORE_VARIABLES.items():
+                if datastore != name and any(v.startswith(prefix) for v in variables):
+                    conditions.setdefault(datastore, 'service_healthy')
+
+            graph[name] = {'compose_file': compose_file, 'depends_on': conditions}
+
+    # Drop edges to services no compose file defines (e.g., an external database)
+    for node in graph.values():
+        node['depends_on'] = {dep: cond for dep, cond in node['depends_on'].items() if dep in graph}
+    return graph
+
+
+class StartupOrchestrator:
+    """
+    Start compose services in dependency order, each one as soon as its own
+    depends_on conditions hold, so independent branches (e.g., wsfe while
+    Elasticsearch is still starting) come up in parallel instead of in the
+    fixed database-then-app sequence.
+
+    Services in the graph but not in 'services' are not started, only
+    waited on (e.g., the databases when starting docker-compose.yml alone).
+    """
+
+    def __init__(self, graph: Dict[str, Dict], services: List[str], timeout: int, wait: bool = True):
+        self.graph = graph
+        self.services = services
+        self.wait_ready = wait
+        watched = set(services)
+        for svc in services:
+            watched.update(graph[svc]['depends_on'])
+        self.waiter = ReadinessWaiter(sorted(watched), timeout, fail_fast=True)
+        self.start = 0.0
+        self.launched_at = {}
+        self.started_at = {}
+        self.blocked_by = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(services)))
+        self.finished = False
+
+    def _elapsed(self) -> float:
+        return time.time() - self.start
+
+    def _satisfied_at(self, dependency: str, condition: str) -> Optional[float]:
+        """When a depends_on condition was met (seconds), or None if not yet"""
+        if condition == 'service_started' and dependency in self.started_at:
+            return self.started_at[dependency]
+        return self.waiter.ready_at.get(dependency)
+
+    def _launch_ready(self):
+        """Start every service whose dependencies are now satisfied"""
+        with self.lock:
+            if self.finished:
+                return  # Waiting is over; the executor no longer takes work
+            for svc in self.services:
+                if svc in self.launched_at or self.errors:
+                    continue
+                gates = []
+                for dependency, condition in self.graph[svc]['depends_on'].items():
+                    satisfied = self._satisfied_at(dependency, condition)
+                    if satisfied is None:
+                        break
+                    gates.append((satisfied, dependency))
+                else:
+                    self.launched_at[svc] = self._elapsed()
+                    self.blocked_by[svc] = max(gates)[1] if gates else None
+                    self.executor.submit(self._start_service, svc)
+
+    def _start_service(self, svc: str):
+        success, output = recreate_service(svc, self.graph[svc]['compose_file'])
+        if not success:
+            error = output.strip().splitlines()[-1] if output.strip() else 'docker compose up failed'
+            with self.lock:
+                self.errors[svc] = error
+            print_error(f"{svc}: failed to start: {error}")
+            self.waiter.stop()
+            return
+
+        with self.lock:
+            self.started_at[svc] = self._elapsed()
+            all_started = len(self.started_at) == len(self.services)
+        print(f"  \u2192 {svc}: started ({self.started_at[svc]:.0f}s)")
+        if not self.wait_ready and all_started:
+            self.waiter.stop()
+        self._launch_ready()
+
+    def _on_ready(self, svc: str, state: str, seconds: float):
+        print(f"  \u2713 {svc}: {state} ({seconds:.0f}s)")
+        self._launch_ready()
+
+    def run(self) -> bool:
+        """Start the services; True once all are ready (or started, with wait=False)"""
+        self.start = time.time()
+
+        # The first service starts alone: it creates the shared network, which
+        # parallel 'compose up' calls would otherwise race to create
+        first = next((svc for svc in self.services if not self.graph[svc]['depends_on']), None)
+        if first:
+            self.launched_at[first] = 0.0
+            self.blocked_by[first] = None
+            self._start_service(first)
+        else:
+            self._launch_ready()
+        self.waiter.wait(self._on_ready, start=self.start)
+        with self.lock:
+            self.finished = True
+        self.executor.shutdown(wait=True)
+
+        if self.errors:
+            return False
+        if self.wait_ready:
+            return all(svc in self.waiter.ready_at for svc in self.services)
+        return len(self.started_at) == len(self.services)
+
+    def finished_at(self, svc: str) -> Optional[float]:
+        if svc in self.waiter.ready_at:
+            return self.waiter.ready_at[svc]
+        return None if self.wait_ready else self.started_at.get(svc)
+
+    def critical_path(self) -> List[str]:
+        """Chain of services that determined the total start time, first to last"""
+        finished = {svc: self.finished_at(svc) for svc in self.services}
+        finished = {svc: at for svc, at in finished.items() if at is not None}
+        if not finished:
+            return []
+        path = [max(finished, key=finished.get)]
+        while self.blocked_by.get(path[-1]) and self.blocked_by[path[-1]] not in path:
+            path.append(self.blocked_by[path[-1]])
+        return list(reversed(path))
+
+
+# ============================================
+# IMAGE BUNDLES (air-gapped installs)
+# ============================================
+
+COMPOSE_FILES = ['docker-compose.yml', 'db-docker-compose.yml']
+COMPOSE_VARIABLE = re.compile(r'\$\{(\w+)(?::?-([^}]*))?\}')
+
+
+def list_infra_images() -> List[str]:
+    """
+    Third-party images referenced by the compose files (nginx, postgres,
+    elasticsearch, mcp server), i.e. everything not tracked in the manifest.
+    """
+    images = []
+    for compose_file in COMPOSE_FILES:
+        try:
+            with open(compose_file, 'r') as f:
+                compose = yaml.load(f, Loader=manifest_store.YAML_LOADER) or {}
+        except (OSError, yaml.YAMLError):
+            continue
+
+        for definition in (compose.get('services') or {}).values():
+            ref = (definition or {}).get('image')
+            if not ref:
+                continue
+            ref = COMPOSE_VARIABLE.sub(lambda m: os.environ.get(m.group(1)) or m.group(2) or '', ref)
+            if ':' not in ref.rsplit('/', 1)[-1]:
+                ref += ':latest'
+            repository = ref.rsplit(':', 1)[0].rsplit('/', 1)[-1]
+            if repository not in SERVICES and ref not in images:
+                images.append(ref)
+    return images
+
+
+def open_image_save(images: List[str]) -> Tuple[BinaryIO, Callable[[], Tuple[bool, str]]]:
+    """
+    Start one 'docker save' of all images as a stream.
+
+    Returns:
+        Tuple of (stream, finish); finish() closes it and returns (success, error)
+    """
+    if DOCKER_CLIENT:
+        conn, response = DOCKER_CLIENT.save(images)
+
+        def finish_api() -> Tuple[bool, str]:
+            conn.close()
+            return True, ""
+
+        return response, finish_api
+
+    process = subprocess.Popen(docker_command(f"docker save {' '.join(images)}"), shell=True,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def finish_cli() -> Tuple[bool, str]:
+        error = process.stderr.read().decode(errors='replace').strip()
+        process.stdout.close()
+        return process.wait() == 0, error
+
+    return process.stdout, finish_cli
+
+
+def load_image_stream(stream: BinaryIO) -> Tuple[bool, List[str]]:
+    """Feed a 'docker save' tar stream to docker load. Returns (success, messages)."""
+    if DOCKER_CLIENT:
+        return DOCKER_CLIENT.load(stream)
+
+    try:
+        result = subprocess.run(docker_command("docker load"), shell=True, stdin=stream,
+                                capture_output=True, text=True)
+    except Exception as e:
+        return False, [str(e)]
+    messages = [line for line in (result.stdout + result.stderr).splitlines() if line.strip()]
+    return result.returncode == 0, messages
+
+
+# ============================================
+# REGISTRY MIRROR (local pull-through cache)
+# ============================================
+
+MIRROR_CONTAINER = 'dkapp-registry-mirror'
+MIRROR_IMAGE = 'registry:2'
+MIRROR_PORT = 5000
+MIRROR_DATA_DIR = 'registry-mirror'
+MIRROR_UPSTREAM = 'https://public.ecr.aws'
+
+# Images outside the manifest that compose also pulls from the registry
+MIRROR_EXTRA_REPOSITORIES = ['dagknows_mcp_server']
+
+
+def mirror_container_state() -> str:
+    """State of the local mirror container ('running', 'exited', ...) or '' if it does not exist"""
+    if DOCKER_CLIENT:
+        try:
+            return DOCKER_CLIENT.inspect_container(MIRROR_CONTAINER).get('State', {}).get('Status', '')
+        except (docker_api.DockerAPIError, OSError):
+            return ''
+
+    success, output = run_command(docker_command(
+        f"docker inspect --format='{{{{.State.Status}}}}' {MIRROR_CONTAINER}"
+    ))
+    return output if success else ''
+
+
+def wait_for_registry(client: registry_v2.RegistryClient, timeout: int = 30) -> bool:
+    """Poll the registry's /v2/ endpoint until it answers or timeout seconds pass"""
+    deadline = time.time() + timeout
+    while True:
+        reachable, _ = client.ping()
+        if reachable or time.time() >= deadline:
+            return reachable
+        time.sleep(1)
+
+
+def mirror_cached_tags(repository: str) -> List[str]:
+    """Tags the mirror on this host has cached for repository (read from its storage directory)"""
+    tags_dir = os.path.join(MIRROR_DATA_DIR, 'docker', 'registry', 'v2', 'repositories',
+                            repository, '_manifests', 'tags')
+    try:
+        return sorted(os.listdir(tags_dir))
+    except OSError:
+        return []
+
+
+def directory_size(path: str) -> int:
+    """Total size in bytes of the files under path"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+# ============================================
+# ECR TAG RESOLUTION (uses AWS CLI, not Docker login)
+# ============================================
+
+
+def check_ecr_access() -> bool:
+    """Check if AWS CLI can access ECR Public API (served from the ECR cache when warm)"""
+    success, _ = ecr_cache.check_access()
+    return success
+
+
+def resolve_tag_from_ecr(service_name: str, image_digest: str = None) -> Optional[str]:
+    """
+    Query ECR Public to find the semantic version tag for a service.
+    
+    Args:
+        service_name: Name of the service (e.g., 'req_router')
+        image_digest: Optional digest to match (e.g., 'sha256:abc123...')
+        
+    Returns:
+        Semantic version tag (e.g., '1.35') or None if unable to resolve
+    """
+    # Image listing comes from the on-disk ECR cache, refetched when stale
+    success, image_details, _ = ecr_cache.describe_images(service_name)
+    
+    if not success:
+        return None
+    
+    # If we have a digest, try to match it first
+    if image_digest:
+        # Clean up digest format (remove brackets and prefix)
+        clean_digest = image_digest.strip('[]').split('@')[-1] if '@' in image_digest else image_digest
+        
+        for image_detail in image_details:
+            ecr_digest = image_detail.get('imageDigest', '')
+            if clean_digest and ecr_digest and (ecr_digest == clean_digest or clean_digest in ecr_digest or ecr_digest in clean_digest):
+                tags = ecr_cache.semantic_tags(image_detail.get('imageTags', []))
+                if tags:
+                    return tags[0]
+    
+    # Fallback: Find the image tagged as 'latest' and get its semantic version
+    for image_detail in image_details:
+        tags = image_detail.get('imageTags', [])
+        if 'latest' in tags:
+            tags = ecr_cache.semantic_tags(tags)
+            if tags:
+                return tags[0]
+    
+    return None
+
+
+# ============================================
+# VERSION MANAGER CLASS
+# ============================================
+
+class VersionManager:
+    def __init__(self):
+        self.manifest_file = 'version-manifest.yaml'
+        self.versions_env = 'versions.env'
+        self.backup_dir = '.version-backups'
+        self.store = manifest_store.ManifestStore(self.manifest_file, self.backup_dir)
+        self.default_manifest = None
+        self.manifest = self.load_manifest()
+        # Saves only journal changes; the manifest file is rewritten once, at exit
+        atexit.register(self.flush_manifest)
+
+    def load_manifest(self) -> Dict:
+        """Load version manifest (with changes journaled by an interrupted run) or create default"""
+        manifest = self.store.load()
+        if self.store.pending:
+            print_info(f"Recovered {self.store.pending} unsaved manifest change(s) from the journal")
+        if self.store.discarded:
+            print_warning(f"{self.manifest_file} was modified since {self.store.discarded} journaled "
+                          f"change(s) were recorded; keeping the file as it is")
+        if manifest:
+            return manifest
+        # Versioning is not enabled yet: nothing is written unless a command changes the default
+        self.default_manifest = self.create_default_manifest()
+        return copy.deepcopy(self.default_manifest)
+
+    def create_default_manifest(self) -> Dict:
+        """Create a default manifest structure"""
+        return {
+            'schema_version': '1.0',
+            'deployment_id': f'dkapp-{datetime.now().strftime("%Y%m%d")}',
+            'customer_id': '',
+            'ecr': {
+                'registry': 'public.ecr.aws',
+                'repository_alias': 'n5k3t9x2',
+                'use_private': False,
+                'private_registry': '',
+                'private_region': 'us-east-1'
+            },
+            'services': {},
+            'history': {},
+            'custom_overrides': {}
+        }
+
+    def save_manifest(self):
+        """Save manifest changes (journaled; see manifest_store)"""
+        if self.manifest == self.default_manifest and not os.path.exists(self.manifest_file):
+            return
+        self.store.record(self.manifest)
+
+    def flush_manifest(self):
+        """Write the manifest file if changes were saved (atomically, backing up the previous version)"""
+        if not (self.store.pending or self.store.discarded):
+            return
+        try:
+            self.store.flush(self.manifest)
+        except OSError as e:
+            print_error(f"Could not write {self.manifest_file}: {e} (changes remain in the journal)")
+
+    def backup_manifest(self) -> Optional[str]:
+        """Backup current manifest before changes (identical backups share storage)"""
+        return self.store.backup()
+
+    def get_registry(self) -> str:
+        """Get current registry URL"""
+        ecr = self.manifest.get('ecr', {})
+        if ecr.get('use_private') and ecr.get('private_registry'):
+            return ecr.get('private_registry')
+        registry = ecr.get('registry', 'public.ecr.aws')
+        # Pull-through mirror serves the same repository paths as public ECR
+        mirror = self.get_mirror()
+        if mirror.get('enabled') and mirror.get('host'):
+            registry = mirror['host']
+        alias = ecr.get('repository_alias', 'n5k3t9x2')
+        return f"{registry}/{alias}"
+
+    def get_mirror(self) -> Dict:
+        """Registry mirror settings from the manifest's ecr section"""
+        return self.manifest.get('ecr', {}).get('mirror') or {}
+
+    def get_full_image(self, service: str, tag: str = None) -> str:
+        """Get full image name with registry and tag"""
+        registry = self.get_registry()
+        if tag is None:
+            tag = self.get_current_tag(service)
+        return f"{registry}/{service}:{tag}"
+
+    def get_current_tag(self, service: str) -> str:
+        """Get current tag for a service"""
+        # Check custom overrides first
+        override = self.manifest.get('custom_overrides', {}).get(service, {})
+        if override.get('tag'):
+            return override['tag']
+        # Then check services
+        return self.manifest.get('services', {}).get(service, {}).get('current_tag', 'latest')
+
+    def get_history_entry(self, service: str, tag: str) -> Dict:
+        """Most recent history entry for a tag of a service ({} if none)"""
+        history = self.manifest.get('history', {}).get(service, [])
+        return next((entry for entry in history if entry.get('tag') == tag), {})
+
+    def pinning_enabled(self) -> bool:
+        return bool((self.manifest.get('pinning') or {}).get('enabled'))
+
+    def get_pinned_digests(self, inventory: Optional[docker_api.Inventory] = None) -> Dict[str, str]:
+        """
+        Registry digest to deploy per service: the one recorded when its
+        current version was pulled. A service is left out (deployed by tag)
+        when nothing was recorded, when a custom override changed its tag, or
+        when the local image lacks that digest (e.g. loaded from a bundle), since
+        compose would then pull it again.
+        """
+        inventory = inventory or get_inventory(containers=False)
+        pins = {}
+        for name, info in self.manifest.get('services', {}).items():
+            recorded = DIGEST_PATTERN.findall(info.get('image_digest', ''))
+            if name not in SERVICES or not recorded or info.get('current_tag') != self.get_current_tag(name):
+                continue
+            local = inventory.image(info.get('image_id', '')) or inventory.image(self.get_full_image(name))
+            if not local:
+                # Not pulled here yet: compose fetches exactly the recorded content
+                pins[name] = recorded[0]
+                continue
+            local_digests = {d.split('@', 1)[-1] for d in local.get('RepoDigests') or []}
+            digest = next((d for d in recorded if d in local_digests), '')
+            if digest:
+                pins[name] = digest
+        return pins
+
+    def get_previous_tag(self, service: str) -> Optional[str]:
+        """Get previous tag for a service from history"""
+        history = self.manifest.get('history', {}).get(service, [])
+        current_tag = self.get_current_tag(service)
+
+        # First pass: look for entry explicitly marked 'previous'
+        # that differs from what's currently deployed
+        for entry in history:
+            if entry.get('status') == 'previous' and entry.get('tag') != current_tag:
+                return entry.get('tag')
+
+        # Second pass: find the first non-current, non-rolled-back entry
+        # with a different tag. Handles post-rollback state where no 'previous' exists.
+        for entry in history:
+            tag = entry.get('tag')
+            status = entry.get('status', '')
+            if status not in ('current', 'rolled-back') and tag != current_tag:
+                return tag
+
+        return None
+
+    # ==================
+    # SHOW COMMANDS
+    # ==================
+
+    def show(self):
+        """Display current versions"""
+        print_header("Current Deployed Versions")
+
+        services = self.manifest.get('services', {})
+        overrides = self.manifest.get('custom_overrides', {})
+
+        if not services:
+            print_warning("No versions tracked yet. Run 'make migrate-versions' to initialize.")
+            return
+
+        for name in SERVICES:
+            info = services.get(name, {})
+            tag = info.get('current_tag', 'unknown')
+            deployed = info.get('deployed_at', '')[:10] if info.get('deployed_at') else 'unknown'
+
+            # Check for override
+            override = overrides.get(name, {})
+            if override.get('tag'):
+                tag = override['tag']
+                reason = override.get('reason', 'custom')
+                print(f"  {name:.<40} {tag:<15} ({deployed}) [{reason}]")
+            else:
+                print(f"  {name:.<40} {tag:<15} ({deployed})")
+
+        staged = self.get_staged()
+        if staged:
+            prepared = self.manifest['staged'].get('prepared_at', '')[:19]
+            changed = [f"{svc} \u2192 {info['tag']}" for svc, info in staged.items() if info.get('changed')]
+            print()
+            print_info(f"Update staged {prepared}: {', '.join(changed) if changed else 'no changes'}")
+            print_info("Apply with: make update-safe PREFETCHED=1")
+
+        print()
+
+    def history(self, service: str = None):
+        """Show version history"""
+        print_header("Version History")
+
+        history = self.manifest.get('history', {})
+
+        if not history:
+            print_warning("No version history available.")
+            return
+
+        if service:
+            if service in history:
+                print(f"\n{Colors.BOLD}{service}:{Colors.ENDC}")
+                for entry in history[service][:HISTORY_LIMIT]:
+                    tag = entry.get('tag', 'unknown')
+                    deployed = entry.get('deployed_at', '')[:19] if entry.get('deployed_at') else 'unknown'
+                    status = entry.get('status', '')
+                    status_str = f" [{status}]" if status else ""
+                    print(f"  {tag:<20} {deployed:<25} {status_str}")
+            else:
+                print_warning(f"No history for service: {service}")
+        else:
+            for svc in SERVICES:
+                entries = history.get(svc, [])
+                if entries:
+                    print(f"\n{Colors.BOLD}{svc}:{Colors.ENDC}")
+                    for entry in entries[:HISTORY_LIMIT]:
+                        tag = entry.get('tag', 'unknown')
+                        deployed = entry.get('deployed_at', '')[:19] if entry.get('deployed_at') else 'unknown'
+                        status = entry.get('status', '')
+                        status_str = f" [{status}]" if status else ""
+                        print(f"  {tag:<20} {deployed:<25} {status_str}")
+        print()
+
+    # ==================
+    # PULL COMMANDS
+    # ==================
+
+    def pull(self, service: str, tag: str, force: bool = False):
+        """Pull specific version for a service
+
+        Each service has its own version (e.g., req_router:1.35, taskservice:1.42)
+        """
+        if service not in SERVICES:
+            print_error(f"Unknown service: {service}")
+            print_info(f"Available services: {', '.join(SERVICES)}")
+            return
+
+        print_header(f"Pulling {service}:{tag}")
+
+        registry = self.get_registry()
+        image = f"{registry}/{service}:{tag}"
+
+        if not force and LocalImageIndex.build().is_present(image):
+            print_info(f"{image} already present locally (use --force to re-pull)")
+            success, output = True, ""
+        else:
+            print_info(f"Pulling {image}...")
+            success, output = docker_pull_with_retry(image)
+
+        if success:
+            print_success(f"Pulled {service}:{tag}")
+            self.update_service_version(service, tag)
+            self.save_manifest()
+            self.generate_env()
+            print_info("Run 'make down && make up' to apply changes")
+        else:
+            print_error(f"Failed to pull {service}:{tag}")
+            print(f"  {output}")
+
+    def pull_from_manifest(self, workers: Optional[int] = None, force: bool = False):
+        """Pull versions specified in manifest
+
+        Images whose tag already resolves locally to the manifest's recorded
+        digest are skipped unless force is set.
+        """
+        print_header("Pulling Versions from Manifest")
+
+        services = self.manifest.get('services', {})
+        if not services:
+            print_warning("No versions in manifest. Using :latest for all services.")
+
+        registry = self.get_registry()
+        local_index = None if force else LocalImageIndex.build()
+        digests = {name: f"{info.get('image_digest', '')} {info.get('image_id', '')}"
+                   for name, info in services.items()}
+        pins = self.get_pinned_digests() if self.pinning_enabled() else {}
+        jobs = pull_images([(name, self.get_current_tag(name)) for name in SERVICES], registry, workers,
+                           local_index=local_index, digests=digests, pins=pins)
+        print_pull_report(jobs)
+
+        return all(job.success for job in jobs)
+
+    def pull_latest(self, workers: Optional[int] = None):
+        """Pull :latest for all services and update manifest
+        
+        This is the recommended way to update all services to latest.
+        It pulls images, updates manifest, and resolves semantic versions from ECR.
+        """
+        print_header("Pulling Latest Images")
+
+        registry = self.get_registry()
+
+        # Step 1: Pull all :latest images
+        jobs = pull_images([(svc, 'latest') for svc in SERVICES], registry, workers)
+        print_pull_report(jobs)
+        pulled_services = [job.service for job in jobs if job.success]
+
+        if not pulled_services:
+            print_error("No images were pulled")
+            return False
+
+        # Step 2: Update manifest with 'latest' for all pulled services
+        print()
+        print_info("Updating manifest...")
+        inventory = get_inventory(containers=False)
+        for svc in pulled_services:
+            self.update_service_version(svc, 'latest', inventory=inventory)
+        self.save_manifest()
+        print_success("Manifest updated")
+
+        # Step 3: Try to resolve semantic versions from ECR
+        print()
+        if self.pinning_enabled():
+            # versions.env pins the pulled digests; the tag is only for display
+            self.generate_env()
+            print_info("Digests pinned; resolve display tags any time with: make resolve-tags")
+        elif check_ecr_access():
+            resolved = self.resolve_latest_tags(pulled_services, save=True)
+            if resolved > 0:
+                print_success(f"Resolved {resolved} service(s) to semantic versions")
+            else:
+                print_warning("Could not resolve semantic versions - using 'latest' tags")
+                print_info("You can retry later with: make resolve-tags")
+        else:
+            print_warning("ECR not accessible - keeping 'latest' tags")
+            print_info("Configure AWS CLI for tag resolution, or run: make resolve-tags")
+
+        print()
+        print_info("Run 'make down && make up' to apply changes")
+        return True
+
+    # ==================
+    # ROLLBACK COMMANDS
+    # ==================
+
+    def rollback(self, service: str = None, tag: str = None, all_services: bool = False, interactive: bool = True,
+                 restart: bool = True):
+        """Rollback to previous version
+
+        Target images are taken from the local image store when the digest
+        recorded in history is still there (retagging the cached image if the
+        tag itself moved); only missing images are pulled. With restart, the
+        rolled-back services that are running are then recreated.
+        """
+        print_header("DagKnows Rollback")
+
+        if all_services:
+            services_to_rollback = SERVICES
+        elif service:
+            services_to_rollback = [service]
+        else:
+            print_error("Specify --service or --all")
+            return False
+
+        # Show what will be rolled back
+        rollback_plan = []
+        for svc in services_to_rollback:
+            current = self.get_current_tag(svc)
+            if tag:
+                target = tag
+            else:
+                target = self.get_previous_tag(svc)
+
+            if target and target != current:
+                rollback_plan.append((svc, current, target))
+
+        if not rollback_plan:
+            print_warning("No services to rollback (no previous versions available)")
+            return False
+
+        # Show plan
+        print("Services to rollback:\n")
+        for svc, current, target in rollback_plan:
+            print(f"  {svc}: {current} \u2192 {target}")
+        print()
+
+        # Confirm if interactive
+        if interactive:
+            if not confirm("Proceed with rollback?"):
+                print("Rollback cancelled.")
+                return False
+
+        # Execute rollback
+        start = time.time()
+        registry = self.get_registry()
+        inventory = get_inventory(containers=False)
+        local_index = LocalImageIndex.build(inventory)
+        rolled_back = []
+
+        for svc, current, target in rollback_plan:
+            image = f"{registry}/{svc}:{target}"
+            entry = self.get_history_entry(svc, target)
+            recorded_id = entry.get('image_id', '')
+
+            if local_index.is_present(image, f"{entry.get('image_digest', '')} {recorded_id}"):
+                source = 'local image'
+            elif recorded_id and inventory.image(recorded_id) and tag_image(recorded_id, image):
+                source = f"cached image {recorded_id[7:19]}"
             else:
-                print_error(f"Failed to pull {svc}:latest")
-                if output:
-                    print(f"  {output}")
+                print_info(f"Pulling {svc}:{target} (not available locally)...")
+                success, output = docker_pull_with_retry(image)
+                if not success:
+                    print_error(f"Failed to pull {svc}:{target}")
+                    if output:
+                        print(f"  {output}")
+                    continue
+                source = 'pulled'
+
+            rolled_back.append((svc, target))
+            print_success(f"Rolled back {svc}: {current} \u2192 {target} ({source})")
+
+        # Update manifest (one image listing for all services)
+        success_count = len(rolled_back)
+        if success_count == 0:
+            print_error("Rollback failed")
+            return False
+
+        inventory = get_inventory(containers=False)
+        for svc, target in rolled_back:
+            self.update_service_version(svc, target, is_rollback=True, inventory=inventory)
+        self.save_manifest()
+        self.generate_env()
+        print_success(f"\nRolled back {success_count} service(s)")
+
+        running = {name for name, info in get_inventory().services().items() if info['state'] == 'running'}
+        to_restart = [SERVICE_TO_COMPOSE[svc] for svc, _ in rolled_back if SERVICE_TO_COMPOSE[svc] in running]
+        if not restart or not to_restart:
+            print_info("Run 'make up' to apply changes")
+            return True
+
+        if not self.restart_services(to_restart):
+            return False
+        print_success(f"Rollback applied in {time.time() - start:.1f}s")
+        return True
+
+    def restart_services(self, compose_services: List[str]) -> bool:
+        """Recreate running services with the versions in versions.env and wait until they are healthy"""
+        for compose_svc in compose_services:
+            self.blue_green_finish(compose_svc)
+
+        if not prepare_compose_env():
+            print_error("Could not decrypt .env.gpg; run 'make up' to apply changes")
+            return False
+        print_info(f"Recreating {', '.join(compose_services)}...")
+        success, output = recreate_services(compose_services)
+        if not success:
+            print_error(f"Recreate failed: {output.strip()[-300:]}")
+            return False
+
+        waiter = ReadinessWaiter(compose_services, SERVICE_HEALTH_TIMEOUT, fail_fast=True)
+        if not waiter.wait():
+            for compose_svc in waiter.pending():
+                print_error(f"{compose_svc}: {waiter.states.get(compose_svc, 'not created')}")
+            return False
+        return True
+
+    # ==================
+    # UPDATE COMMANDS
+    # ==================
+
+    def set_version(self, service: str, tag: str):
+        """Set specific version for a service (for hotfixes)"""
+        print_header(f"Setting Custom Version")
+
+        if service not in SERVICES:
+            print_error(f"Unknown service: {service}")
+            print_info(f"Valid services: {', '.join(SERVICES)}")
+            return False
+
+        # Pull the image first
+        registry = self.get_registry()
+        image = f"{registry}/{service}:{tag}"
+        print_info(f"Pulling {image}...")
+
+        success, output = docker_pull_with_retry(image)
+        if not success:
+            print_error(f"Failed to pull image: {image}")
+            print(f"  {output}")
+            return False
+
+        print_success(f"Pulled {service}:{tag}")
+
+        # Update manifest
+        self.update_service_version(service, tag)
+
+        # Also add to custom_overrides for tracking
+        if 'custom_overrides' not in self.manifest:
+            self.manifest['custom_overrides'] = {}
 
-        if not pulled_services:
+        self.manifest['custom_overrides'][service] = {
+            'tag': tag,
+            'reason': 'Custom version set via CLI',
+            'applied_at': datetime.now().isoformat()
+        }
+
+        self.save_manifest()
+        self.generate_env()
+
+        print_success(f"Set {service} to {tag}")
+        print_info("Run 'make up' to apply changes")
+        return True
+
+    def get_staged(self) -> Dict:
+        """Images staged by prefetch, keyed by service (empty if nothing is staged)"""
+        return (self.manifest.get('staged') or {}).get('services') or {}
+
+    def prefetch(self, workers: Optional[int] = None) -> bool:
+        """Pull and verify the images update-safe would install, without touching running services
+
+        Staged images are recorded in the manifest's 'staged' section so that
+        'update-safe --prefetched' only has to swap containers.
+        """
+        print_header("Prefetching Update")
+
+        registry = self.get_registry()
+        jobs = pull_images([(svc, 'latest') for svc in SERVICES], registry, workers)
+        print_pull_report(jobs)
+        pulled = [job for job in jobs if job.success]
+        if not pulled:
             print_error("No images were pulled")
             return False
 
-        print_success(f"\nPulled {len(pulled_services)}/{len(SERVICES)} services")
+        print()
+        print_info("Verifying staged images...")
+        ecr_cache.prefetch([job.service for job in pulled])
+        staged = {}
+        inventory = get_inventory(containers=False)
+        for job in pulled:
+            digest = format_repo_digests(inventory, job.image)
+            image_id = inventory.image_id(job.image)
+            if not image_id or not DIGEST_PATTERN.search(digest):
+                print(f"  \u2717 {job.service}: pulled image has no registry digest, not staged")
+                continue
 
-        # Step 2: Update manifest with 'latest' for all pulled services
+            # Matching by digest also confirms the pulled content is what ECR lists for the tag
+            tag = resolve_tag_from_ecr(job.service, digest) or 'latest'
+            if tag != 'latest':
+                tag_image(job.image, f"{registry}/{job.service}:{tag}")
+
+            current = self.manifest.get('services', {}).get(job.service, {})
+            changed = image_id != current.get('image_id') or tag != self.get_current_tag(job.service)
+            staged[job.service] = {
+                'tag': tag,
+                'image_digest': digest,
+                'image_id': image_id,
+                'changed': changed
+            }
+            note = f"{self.get_current_tag(job.service)} \u2192 {tag}" if changed else f"{tag} (unchanged)"
+            print(f"  \u2713 {job.service}: {note}")
+
+        if not staged:
+            print_error("Nothing could be staged")
+            return False
+
+        self.manifest['staged'] = {
+            'prepared_at': datetime.now().isoformat(),
+            'prepared_by': os.environ.get('USER', 'system'),
+            'registry': registry,
+            'services': staged
+        }
+        self.save_manifest()
+
+        changed = sum(1 for info in staged.values() if info['changed'])
+        print()
+        print_success(f"Staged {len(staged)}/{len(SERVICES)} images ({changed} changed)")
+        print_info("Apply during the maintenance window with: make update-safe PREFETCHED=1")
+        return True
+
+    def update_safe(self, workers: Optional[int] = None, prefetched: bool = False, full_restart: bool = False,
+                    blue_green: bool = False):
+        """Safe update to latest versions with automatic backup and rollback on failure
+
+        This pulls :latest for all services since each service has its own version.
+        For updating a specific service to a specific tag, use: make version-pull SERVICE=x TAG=y
+
+        With prefetched, the images staged by 'prefetch' are used and nothing
+        is pulled, so the maintenance window only covers the container swap.
+        Running services are updated with a rolling restart unless full_restart
+        is set, in which case everything goes down and comes back up. With
+        blue_green, req-router and the UI are swapped blue/green instead of
+        recreated in place.
+        """
+        print_header("DagKnows Safe Update")
+
+        registry = self.get_registry()
+        staged = {}
+        if prefetched:
+            staged = self.get_staged()
+            if not staged:
+                print_error("No staged images found. Run 'make prefetch' first.")
+                return False
+            if self.manifest['staged'].get('registry') != registry:
+                print_error("Images were staged for a different registry. Run 'make prefetch' again.")
+                return False
+
+            local_index = LocalImageIndex.build()
+            missing = [svc for svc, info in staged.items()
+                       if not local_index.is_present(f"{registry}/{svc}:{info['tag']}",
+                                                     f"{info['image_digest']} {info['image_id']}")]
+            if missing:
+                print_error(f"Staged images no longer present locally: {', '.join(missing)}")
+                print_info("Run 'make prefetch' again")
+                return False
+
+            print_info(f"Using images staged {self.manifest['staged'].get('prepared_at', '')[:19]}")
+        else:
+            print_info("This will update all services to their latest versions")
         print()
+
+        # Step 1: Create backup
+        print_info("Creating backup before update...")
+        backup_path = self.backup_manifest()
+        if backup_path:
+            print_success(f"Backup created: {backup_path}")
+
+        # Also backup data if needed
+        print_info("Creating data backup...")
+        success, _ = run_command("make backups", capture=False)
+        if success:
+            print_success("Data backup created")
+        else:
+            print_warning("Data backup skipped (may require manual backup)")
+
+        # Step 2: Pull new images (latest for all services), unless already staged
+        if prefetched:
+            pulled_services = [svc for svc in SERVICES if svc in staged]
+        else:
+            print_info("Pulling latest images...")
+            jobs = pull_images([(svc, 'latest') for svc in SERVICES], registry, workers)
+            print_pull_report(jobs)
+            pulled_services = [job.service for job in jobs if job.success]
+
+        if not pulled_services:
+            print_error("No images were pulled")
+            return False
+
+        if len(pulled_services) < len(SERVICES):
+            print_warning(f"Only {len(pulled_services)}/{len(SERVICES)} images pulled")
+            if not confirm("Continue with partial update?"):
+                print("Update cancelled.")
+                return False
+
+        print_success("Images staged" if prefetched else "Images pulled successfully")
+
+        # Step 3: Update manifest with pulled versions
         print_info("Updating manifest...")
+        inventory = get_inventory(containers=False)
         for svc in pulled_services:
-            self.update_service_version(svc, 'latest')
+            self.update_service_version(svc, staged.get(svc, {}).get('tag', 'latest'), inventory=inventory)
+        self.manifest.pop('staged', None)
         self.save_manifest()
-        print_success("Manifest updated")
 
-        # Step 3: Try to resolve semantic versions from ECR
-        print()
-        if check_ecr_access():
-            resolved = self.resolve_latest_tags(pulled_services, save=True)
-            if resolved > 0:
-                print_success(f"Resolved {resolved} service(s) to semantic versions")
-            else:
-                print_warning("Could not resolve semantic versions - using 'latest' tags")
-                print_info("You can retry later with: make resolve-tags")
+        # Step 4: Resolve 'latest' tags to semantic versions from ECR. With
+        # digest pinning versions.env does not depend on the tag, so that waits
+        # until the services have been restarted.
+        unresolved = [svc for svc in pulled_services if self.get_current_tag(svc) == 'latest']
+        pinned = self.pinning_enabled()
+        if unresolved and not pinned:
+            print()
+            self.resolve_tags_after_update(unresolved)
         else:
-            print_warning("ECR not accessible - keeping 'latest' tags")
-            print_info("Configure AWS CLI for tag resolution, or run: make resolve-tags")
+            self.generate_env()
+
+        # Step 5: Restart only what changed, one service at a time
+        if not full_restart and list_compose_containers():
+            success = self.rolling_restart(pulled_services, blue_green)
+        else:
+            success = self.restart_all_after_update()
+
+        if unresolved and pinned:
+            print()
+            self.resolve_tags_after_update(unresolved)
+        return success
+
+    def resolve_tags_after_update(self, services: List[str]):
+        """Resolve the 'latest' tags an update recorded, warning if none could be"""
+        resolved = self.resolve_latest_tags(services, save=True)
+        if resolved == 0:
+            print_warning("Could not resolve semantic versions - using 'latest' tags")
+            print_info("You can retry later with: make resolve-tags")
+
+    def restart_all_after_update(self) -> bool:
+        """Bring everything down and up on the new versions, offering a rollback if unhealthy"""
+        self.blue_green_finish()
+        print_info("Stopping services...")
+        run_command("docker compose down")
+        print_success("Services stopped")
+
+        # Start services
+        print_info("Starting services with new images...")
+        success, _ = run_command("make up", capture=False)
+        if not success:
+            print_error("Failed to start services")
+            return False
+
+        # Health check
+        self.wait_ready()
+
+        print_info("Verifying service health...")
+        if self.verify_health():
+            print_success("All services healthy!")
+            print_success("Update completed successfully!")
+            return True
+        else:
+            print_error("Health check failed!")
+            if confirm("Rollback to previous version?"):
+                self.rollback(all_services=True, interactive=False, restart=False)
+                run_command("make up", capture=False)
+                print_warning("Rolled back to previous version")
+            return False
+
+    def rolling_restart(self, services: List[str], blue_green: bool = False) -> bool:
+        """Recreate services whose image changed, one at a time, rolling back any that fail
+
+        Services are recreated dependents-first (reverse depends_on order) and
+        each must become healthy before the next one is touched. A service
+        that fails is put back on the image it was running; the others keep
+        their new versions. With blue_green, the services in
+        BLUE_GREEN_SERVICES are deployed next to the running container instead.
+        """
+        print_info("Rolling restart of changed services...")
+        registry = self.get_registry()
+        inventory = get_inventory()
+        running = {name: info['image_id'] for name, info in inventory.services().items()
+                   if info['state'] == 'running'}
+
+        changed = []
+        for svc in services:
+            compose_svc = SERVICE_TO_COMPOSE[svc]
+            if inventory.image_id(self.get_full_image(svc)) == running.get(compose_svc):
+                print(f"  = {compose_svc}: image unchanged, not restarted")
+            else:
+                changed.append(compose_svc)
+
+        if not changed:
+            print_success("All services already run the new images, nothing to restart")
+            return True
+
+        # Recreating a service ends its blue/green grace period (compose scales it back to one)
+        for compose_svc in changed:
+            self.blue_green_finish(compose_svc)
+
+        if not prepare_compose_env():
+            print_error("Could not decrypt .env.gpg; services were not restarted")
+            return False
+
+        failed = []
+        for compose_svc in compose_restart_order(changed):
+            svc = COMPOSE_TO_SERVICE[compose_svc]
+            if blue_green and svc in BLUE_GREEN_SERVICES:
+                if not self.blue_green_deploy(svc):
+                    failed.append(compose_svc)
+                continue
+
+            start = time.time()
+            print_info(f"Recreating {compose_svc} ({self.get_current_tag(svc)})...")
+            success, output = recreate_service(compose_svc)
+            healthy, state = wait_for_service(compose_svc) if success else (False, output)
+            if healthy:
+                healthy, summary = probe_service(compose_svc)
+                if summary:
+                    state = f"{state}, {summary}" if healthy else f"probe failed: {summary}"
+
+            if healthy:
+                print_success(f"{compose_svc} {state} ({time.time() - start:.0f}s)")
+                continue
+
+            print_error(f"{compose_svc} failed: {state}")
+            failed.append(compose_svc)
+            old_image_id = running.get(compose_svc)
+            if not old_image_id:
+                print_warning(f"{compose_svc} was not running before the update; nothing to roll back to")
+                continue
+
+            # Roll back to the image the container was running before
+            previous_tag = self.get_previous_tag(svc)
+            if not previous_tag or inventory.image_id(self.get_full_image(svc, previous_tag)) != old_image_id:
+                previous_tag = f"rollback-{old_image_id.split(':')[-1][:12]}"
+                tag_image(old_image_id, f"{registry}/{svc}:{previous_tag}")
+
+            print_warning(f"Rolling back {compose_svc} to {previous_tag}...")
+            self.update_service_version(svc, previous_tag, is_rollback=True,
+                                        inventory=get_inventory(containers=False))
+            self.save_manifest()
+            self.generate_env()
+            success, _ = recreate_service(compose_svc)
+            healthy, state = wait_for_service(compose_svc) if success else (False, 'recreate failed')
+            if healthy:
+                print_warning(f"{compose_svc} rolled back to {previous_tag} ({state})")
+            else:
+                print_error(f"{compose_svc} still failing after rollback: {state}")
 
         print()
-        print_info("Run 'make down && make up' to apply changes")
+        if failed:
+            print_error(f"Update failed for: {', '.join(failed)}")
+            print_info(f"{len(changed) - len(failed)}/{len(changed)} changed services updated")
+            return False
+
+        print_success(f"Update completed: {len(changed)} service(s) restarted, others untouched")
+        return True
+
+    def blue_green(self, action: str, service: str = None, grace: Optional[int] = None) -> bool:
+        """Blue/green deploys of the stateless services behind nginx"""
+        if action == 'status':
+            return self.blue_green_status()
+        if action == 'finish':
+            return self.blue_green_finish(service)
+        if not service:
+            print_error(f"--service is required ({', '.join(BLUE_GREEN_SERVICES)})")
+            return False
+        if action == 'deploy':
+            return self.blue_green_deploy(service, grace)
+        if action == 'switch-back':
+            return self.blue_green_switch_back(service)
+        print_error(f"Unknown bluegreen action: {action}")
+        return False
+
+    def blue_green_deploy(self, service: str, grace: Optional[int] = None) -> bool:
+        """Start the manifest version of a service next to the running one and move nginx to it
+
+        The new container is warmed up directly, then nginx.conf's upstream is
+        switched to it with a graceful reload, so no request sees a missing
+        upstream. The old container keeps running for grace seconds for an
+        instant switch-back; 'bluegreen finish' (or the next deploy after the
+        grace period) removes it.
+        """
+        if service not in BLUE_GREEN_SERVICES:
+            print_error(f"Blue/green is only supported for: {', '.join(BLUE_GREEN_SERVICES)}")
+            return False
+        compose_svc = SERVICE_TO_COMPOSE[service]
+        grace = BLUE_GREEN_GRACE if grace is None else grace
+        tag = self.get_current_tag(service)
+        print_info(f"Blue/green deploy of {compose_svc} {tag}...")
+
+        self.blue_green_finish(expired_only=True)
+        if compose_svc in self.manifest.get('blue_green', {}):
+            print_error(f"{compose_svc} still has a previous deploy in its grace period")
+            print_info(f"Run 'bluegreen finish --service={service}' or 'bluegreen switch-back --service={service}' first")
+            return False
+
+        running = [c for c in service_containers(compose_svc) if c.get('State') == 'running']
+        if len(running) != 1:
+            print_error(f"Expected one running {compose_svc} container, found {len(running)}")
+            return False
+        old = running[0]
+        if old.get('Image') == self.get_full_image(service, tag):
+            print_success(f"{old['Name']} already runs {tag}")
+            return True
+        old_tag = docker_api.split_reference(old.get('Image', ''))[1]
+
+        def abandon(new: Optional[Dict], reason: str) -> bool:
+            print_error(reason)
+            if new:
+                remove_container(new['ID'])
+            print_info(f"{old['Name']} ({old_tag}) kept serving; manifest set back to {old_tag}")
+            self.update_service_version(service, old_tag, is_rollback=True)
+            self.save_manifest()
+            self.generate_env()
+            return False
+
+        if not prepare_compose_env():
+            print_error("Could not decrypt .env.gpg; nothing was started")
+            return False
+        success, output = start_alongside(compose_svc)
+        new = next((c for c in service_containers(compose_svc) if c['ID'] != old['ID']), None)
+        if not success or not new:
+            return abandon(new, f"Could not start a second {compose_svc} container: {output.strip()[-200:]}")
+
+        print_info(f"Warming up {new['Name']} ({tag})...")
+        warmed, summary = warm_up(compose_svc, new['ID'])
+        if not warmed:
+            return abandon(new, f"{new['Name']} did not become ready: {summary}")
+        print_success(f"{new['Name']} ready: {summary}")
+
+        start = time.time()
+        switched, error = switch_nginx_upstream(compose_svc, new['Name'])
+        if not switched:
+            return abandon(new, f"nginx switch failed: {error}")
+        print_success(f"nginx switched to {new['Name']} in {(time.time() - start) * 1000:.0f}ms")
+
+        result = probe_services([compose_svc])[0]
+        if not result.passed:
+            switch_nginx_upstream(compose_svc, old['Name'])
+            abandon(new, f"{compose_svc} failing through nginx ({result.summary()}); switched back")
+            # No grace period is recorded, so nothing else would put the service name back
+            switch_nginx_upstream(compose_svc, compose_svc)
+            return False
+
+        # Other clients (e.g. mcp-server) resolve the service name, which both
+        # containers answer to: take the old one off it once nginx is done with it
+        if not wait_nginx_drained():
+            print_warning(f"nginx still has requests on {old['Name']} after {BLUE_GREEN_DRAIN_TIMEOUT}s; "
+                          f"taking it off '{compose_svc}' anyway")
+        if not set_service_alias(old['ID'], compose_svc, enabled=False):
+            print_warning(f"Could not take {old['Name']} off '{compose_svc}'; "
+                          f"other services may reach either version until 'bluegreen finish'")
+
+        self.manifest.setdefault('blue_green', {})[compose_svc] = {
+            'service': service,
+            'active': new['Name'],
+            'active_id': new['ID'],
+            'tag': tag,
+            'standby': old['Name'],
+            'standby_id': old['ID'],
+            'standby_tag': old_tag,
+            'switched_at': datetime.now().isoformat(),
+            'grace_seconds': grace,
+        }
+        self.save_manifest()
+        print_success(f"{compose_svc} {tag} is live ({result.summary()})")
+        print_info(f"{old['Name']} ({old_tag}) kept for {grace // 60} min: "
+                   f"make bluegreen-switchback SERVICE={service}")
+        return True
+
+    def blue_green_switch_back(self, service: str) -> bool:
+        """Move nginx back to the previous container of a blue/green deploy and drop the new one"""
+        compose_svc = SERVICE_TO_COMPOSE.get(service, service)
+        state = self.manifest.get('blue_green', {}).get(compose_svc)
+        if not state:
+            print_error(f"No blue/green deploy of {compose_svc} to switch back from")
+            return False
+
+        standby = next((c for c in service_containers(compose_svc) if c['ID'] == state['standby_id']), None)
+        if not standby or standby.get('State') != 'running':
+            print_error(f"{state['standby']} is no longer running; use 'rollback --service={state['service']}'")
+            return False
+
+        # Put the standby back on the service name first: reconnecting may
+        # change its address, which nginx picks up when it reloads below
+        if not set_service_alias(state['standby_id'], compose_svc, enabled=True):
+            print_error(f"Could not put {state['standby']} back on '{compose_svc}'; "
+                        f"use 'rollback --service={state['service']}'")
+            return False
+
+        start = time.time()
+        switched, error = switch_nginx_upstream(compose_svc, state['standby'])
+        if not switched:
+            print_error(f"nginx switch failed: {error}")
+            return False
+        print_success(f"nginx switched back to {state['standby']} ({state['standby_tag']}) "
+                      f"in {(time.time() - start) * 1000:.0f}ms")
+
+        remove_container(state['active_id'])
+        switch_nginx_upstream(compose_svc, compose_svc)
+        del self.manifest['blue_green'][compose_svc]
+        self.update_service_version(state['service'], state['standby_tag'], is_rollback=True)
+        self.save_manifest()
+        self.generate_env()
+        print_success(f"Removed {state['active']}; {compose_svc} is back on {state['standby_tag']}")
+        return True
+
+    def blue_green_finish(self, service: str = None, expired_only: bool = False) -> bool:
+        """
+        End blue/green grace periods: remove the previous containers and point
+        nginx at the plain service name again. Needed before anything that
+        recreates or removes the service's containers ('docker compose down'
+        or 'up', startup at boot), which would leave nginx.conf naming a
+        container that is gone.
+        """
+        pending = self.manifest.get('blue_green', {})
+        compose_svc = SERVICE_TO_COMPOSE.get(service, service) if service else None
+        finished = True
+        for name, state in list(pending.items()):
+            if compose_svc and name != compose_svc:
+                continue
+            if expired_only and not blue_green_expired(state):
+                continue
+            remove_container(state['standby_id'])
+            switched, error = switch_nginx_upstream(name, name)
+            if not switched:
+                print_error(f"{name}: could not restore nginx upstream: {error}")
+                finished = False
+                continue
+            del pending[name]
+            self.save_manifest()
+            print_success(f"{name}: removed {state['standby']}, {state['tag']} stays live")
+
+        if expired_only:
+            return finished
+        # A container name left in nginx.conf without a deploy to go with it
+        # (e.g. the manifest was restored from a backup) is reset as well
+        for name in (SERVICE_TO_COMPOSE[svc] for svc in BLUE_GREEN_SERVICES):
+            if (compose_svc and name != compose_svc) or name in pending:
+                continue
+            if any(host != name for host in nginx_upstream_hosts(name)):
+                switched, error = switch_nginx_upstream(name, name)
+                if not switched:
+                    print_error(f"{name}: could not restore nginx upstream: {error}")
+                    finished = False
+                    continue
+                print_success(f"{name}: nginx points at the service name again")
+        return finished
+
+    def blue_green_status(self) -> bool:
+        pending = self.manifest.get('blue_green', {})
+        if not pending:
+            print_info("No blue/green deploys in their grace period")
+            return True
+        for name, state in pending.items():
+            switched_at = datetime.fromisoformat(state['switched_at'])
+            remaining = state.get('grace_seconds', BLUE_GREEN_GRACE) - (datetime.now() - switched_at).total_seconds()
+            print(f"  {name}: {state['active']} ({state['tag']}) live, "
+                  f"{state['standby']} ({state['standby_tag']}) on standby, "
+                  + (f"{remaining / 60:.0f} min left" if remaining > 0 else "grace period over"))
         return True
 
+    def check_updates(self, registry: str = None) -> bool:
+        """
+        Check every service's repository for a newer release tag via the
+        registry v2 API (no AWS CLI needed), all services concurrently.
+        Responses are cached in registry_v2.RESPONSE_CACHE_DIR and revalidated
+        with conditional requests, so repeated checks mostly get 304s.
+        """
+        print_header("Available Updates")
+
+        registry = registry or self.get_registry()
+        host, _, namespace = registry.partition('/')
+        # Local registries and the mirror are plain HTTP (docker's insecure-registries)
+        plain_http = host.startswith(('localhost', '127.')) or host == self.get_mirror().get('host')
+        client = registry_v2.RegistryClient(host, 'http' if plain_http else 'https',
+                                            credentials=registry_v2.docker_credentials(host),
+                                            cache=registry_v2.ResponseCache())
+        services = self.manifest.get('services', {})
+        print_info(f"Checking {registry} for newer versions...")
+        print()
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=len(SERVICES)) as executor:
+            checks = list(executor.map(
+                lambda name: check_service_update(
+                    client, f"{namespace}/{name}" if namespace else name, name, self.get_current_tag(name),
+                    DIGEST_PATTERN.findall(services.get(name, {}).get('image_digest', ''))
+                ),
+                SERVICES
+            ))
+        elapsed = time.time() - start
+
+        labels = {'update': 'update', 'current': 'up to date', 'unknown': '?', 'error': 'ERROR'}
+        print(f"  {'SERVICE':<16} {'CURRENT':<14} {'LATEST':<14} {'STATUS':<11} DOWNLOAD")
+        for check in checks:
+            if check.status == 'update':
+                detail = image_bundle.format_size(check.download)
+                if check.download != check.size:
+                    detail += f" of {image_bundle.format_size(check.size)}"
+            else:
+                detail = check.note
+            print(f"  {check.service:<16} {check.current:<14} {check.latest or '-':<14} "
+                  f"{labels[check.status]:<11} {detail}")
+
+        updates = [check for check in checks if check.status == 'update']
+        errors = [check for check in checks if check.status == 'error']
+        print()
+        if updates:
+            total = sum(check.download for check in updates)
+            print_success(f"{len(updates)} update(s) available, ~{image_bundle.format_size(total)} to download")
+            print_info("To update: make update-safe (or make version-pull SERVICE=x TAG=y)")
+        elif not errors:
+            print_success("All services are up to date")
+        if errors and len(errors) == len(checks) and not client.credentials and self.manifest.get('ecr', {}).get('use_private'):
+            print_info("Private ECR needs credentials: run 'make ecr-login' first")
+
+        stats = client.stats
+        print_info(f"Checked {len(checks)} repositories in {elapsed:.1f}s "
+                   f"({stats['requests']} requests, {stats['not_modified']} not modified, "
+                   f"{stats['cached']} from cache)")
+        return len(errors) < len(checks)
+
     # ==================
-    # ROLLBACK COMMANDS
+    # PINNING COMMANDS
     # ==================
 
-    def rollback(self, service: str = None, tag: str = None, all_services: bool = False, interactive: bool = True):
-        """Rollback to previous version"""
-        print_header("DagKnows Rollback")
+    def pinning(self, action: str) -> bool:
+        """Deploy by image digest (enable/disable) or show what is pinned (status)"""
+        if action == 'status':
+            return self.pinning_status()
 
-        if all_services:
-            services_to_rollback = SERVICES
-        elif service:
-            services_to_rollback = [service]
+        enable = action == 'enable'
+        if self.pinning_enabled() == enable:
+            print_info(f"Digest pinning is already {'enabled' if enable else 'disabled'}")
+            return True
+        self.manifest['pinning'] = {
+            'enabled': enable,
+            'changed_at': datetime.now().isoformat(),
+            'changed_by': os.environ.get('USER', 'system')
+        }
+        self.save_manifest()
+        self.generate_env()
+        if enable:
+            print_success("versions.env now deploys images by digest")
+            self.pinning_status()
         else:
-            print_error("Specify --service or --all")
-            return False
+            print_success("versions.env now deploys images by tag")
+        print_info("Run 'make up' to apply changes")
+        return True
 
-        # Show what will be rolled back
-        rollback_plan = []
-        for svc in services_to_rollback:
-            current = self.get_current_tag(svc)
-            if tag:
-                target = tag
+    def pinning_status(self) -> bool:
+        """Print the reference each service is deployed by"""
+        print_header("Digest Pinning")
+        enabled = self.pinning_enabled()
+        print(f"Pinning: {'enabled' if enabled else 'disabled'}\n")
+
+        pins = self.get_pinned_digests()
+        print(f"  {'SERVICE':<16} {'TAG':<20} DEPLOYED BY")
+        for name in SERVICES:
+            if not enabled:
+                reference = 'tag'
+            elif name in pins:
+                reference = pins[name][:19]
             else:
-                target = self.get_previous_tag(svc)
+                reference = f"{Colors.WARNING}tag (no usable digest recorded){Colors.ENDC}"
+            print(f"  {name:<16} {self.get_current_tag(name):<20} {reference}")
 
-            if target and target != current:
-                rollback_plan.append((svc, current, target))
+        if enabled and any(name not in pins for name in SERVICES):
+            print()
+            print_info("Pull a service again (e.g. make version-pull) to record its digest")
+        return True
 
-        if not rollback_plan:
-            print_warning("No services to rollback (no previous versions available)")
-            return False
+    # ==================
+    # IMAGE GC COMMANDS
+    # ==================
 
-        # Show plan
-        print("Services to rollback:\n")
-        for svc, current, target in rollback_plan:
-            print(f"  {svc}: {current} \u2192 {target}")
+    def gc(self, dry_run: bool = False, assume_yes: bool = False) -> bool:
+        """Remove local images of our services that no rollback can need
+
+        Kept for every service: the current tag, the tags and images in its
+        history (up to HISTORY_LIMIT), custom overrides, staged and blue/green
+        tags, 'latest', and any image a container uses. Everything else from
+        our repositories goes, including untagged old versions left behind by
+        pulls of 'latest' that no history entry refers to.
+        """
+        print_header("Image Garbage Collection")
+
+        keep_tags = {svc: {'latest'} for svc in SERVICES}
+        keep_ids = container_image_ids()
+        registries = {self.get_registry(), DEFAULT_REGISTRY}
+
+        for svc, info in self.manifest.get('services', {}).items():
+            keep_tags.setdefault(svc, set()).add(info.get('current_tag'))
+            keep_ids.add(info.get('image_id'))
+            if info.get('image'):
+                registries.add(info['image'].rsplit('/', 1)[0])
+        keep_digests = set()
+        for svc, entries in self.manifest.get('history', {}).items():
+            keep_tags.setdefault(svc, set()).update(entry.get('tag') for entry in entries)
+            # A tag that has since moved leaves its old image untagged; history still needs it
+            for entry in entries:
+                keep_ids.add(entry.get('image_id'))
+                keep_digests.update(DIGEST_PATTERN.findall(entry.get('image_digest') or ''))
+        for svc, info in self.manifest.get('custom_overrides', {}).items():
+            keep_tags.setdefault(svc, set()).add(info.get('tag'))
+        for svc, info in self.get_staged().items():
+            keep_tags.setdefault(svc, set()).add(info.get('tag'))
+            keep_ids.add(info.get('image_id'))
+        for state in self.manifest.get('blue_green', {}).values():
+            keep_tags.setdefault(state['service'], set()).update((state['tag'], state['standby_tag']))
+
+        images = list_images_with_sizes()
+        keep_ids.update(image.get('Id') for image in images
+                        if any(d.split('@', 1)[-1] in keep_digests for d in image.get('RepoDigests') or []))
+        repos = {f"{registry}/{svc}": svc for registry in registries for svc in SERVICES}
+        plan = plan_image_gc(images, repos, keep_tags, keep_ids)
+        if not plan:
+            print_success("Nothing to remove: every local image is current, in history or in use")
+            return True
+
+        deleted = [entry for entry in plan if entry['delete']]
+        total = sum(entry['bytes'] for entry in deleted)
+        for entry in sorted(plan, key=lambda e: e['refs'][0]):
+            refs = ', '.join(ref if not ref.startswith('sha256:') else f"<untagged {ref[7:19]}>"
+                             for ref in entry['refs'])
+            if entry['delete']:
+                print(f"  - {refs} ({image_bundle.format_size(entry['bytes'])})")
+            else:
+                print(f"  - {refs} (tag only, image kept)")
         print()
+        print_info(f"{len(deleted)} image(s) to delete, {len(plan) - len(deleted)} tag(s) to untag: "
+                   f"~{image_bundle.format_size(total)} reclaimable")
 
-        # Confirm if interactive
-        if interactive:
-            if not confirm("Proceed with rollback?"):
-                print("Rollback cancelled.")
-                return False
+        if dry_run:
+            print_info("Dry run: nothing was removed (run 'make gc' to remove)")
+            return True
+        if not assume_yes and not confirm("Remove these images?"):
+            print("Cancelled.")
+            return False
+
+        failed = 0
+        freed = 0
+        for entry in plan:
+            for ref in entry['refs']:
+                success, output = remove_image(ref)
+                if not success:
+                    print_warning(f"Could not remove {ref}: {output.strip()[-200:]}")
+                    failed += 1
+                    break
+            else:
+                freed += entry['bytes']
+
+        if failed:
+            print_warning(f"{failed} image(s) could not be removed")
+        print_success(f"Freed ~{image_bundle.format_size(freed)}")
+        return not failed
+
+    # ==================
+    # ECR COMMANDS
+    # ==================
 
-        # Execute rollback
-        registry = self.get_registry()
-        success_count = 0
+    def ecr_login(self):
+        """Login to private ECR"""
+        print_header("ECR Login")
 
-        for svc, current, target in rollback_plan:
-            print_info(f"Rolling back {svc} to {target}...")
+        ecr = self.manifest.get('ecr', {})
 
-            # Pull the target image
-            image = f"{registry}/{svc}:{target}"
-            success, output = docker_pull_with_retry(image)
+        if not ecr.get('use_private') or not ecr.get('private_registry'):
+            print_info("Using public ECR - no authentication required")
+            return True
 
-            if not success:
-                print_error(f"Failed to pull {svc}:{target}")
-                if output:
-                    print(f"  {output}")
-                continue
+        region = ecr.get('private_region', 'us-east-1')
+        registry = ecr.get('private_registry')
 
-            # Update manifest
-            self.update_service_version(svc, target, is_rollback=True)
-            success_count += 1
-            print_success(f"Rolled back {svc}: {current} \u2192 {target}")
+        print_info(f"Logging into private ECR: {registry}")
 
-        if success_count > 0:
-            self.save_manifest()
-            self.generate_env()
-            print_success(f"\nRolled back {success_count} service(s)")
-            print_info("Run 'make up' to apply changes")
+        cmd = f"aws ecr get-login-password --region {region} | docker login --username AWS --password-stdin {registry}"
+        success, output = run_command(cmd)
+
+        if success:
+            print_success("Successfully logged into ECR")
             return True
         else:
-            print_error("Rollback failed")
+            print_error("Failed to login to ECR")
+            print(f"  {output}")
+            print_info("Make sure AWS CLI is configured with valid credentials")
             return False
 
+    def ecr_cache(self, clear: bool = False, service: str = None):
+        """Show or invalidate the on-disk ECR describe-images cache"""
+        print_header("ECR Cache")
+
+        if clear:
+            removed = ecr_cache.invalidate(service)
+            target = service or 'all repositories'
+            print_success(f"Invalidated {removed} cache entr{'y' if removed == 1 else 'ies'} ({target})")
+            return True
+
+        entries = ecr_cache.cache_status()
+        if not entries:
+            print_info("ECR cache is empty")
+            return True
+
+        print(f"  {'REPOSITORY':<16} {'AGE':>8} {'STATE':<6} {'IMAGES':>6} {'PAGES':>5}")
+        for entry in entries:
+            state = 'fresh' if entry['fresh'] else 'stale'
+            print(f"  {entry['repository']:<16} {entry['age']:>7.0f}s {state:<6} {entry['images']:>6} {entry['pages']:>5}")
+        print()
+        print_info(f"TTL: {ecr_cache.get_ttl()}s (set DK_ECR_CACHE_TTL to change)")
+        return True
+
     # ==================
-    # UPDATE COMMANDS
+    # BUNDLE COMMANDS
     # ==================
 
-    def set_version(self, service: str, tag: str):
-        """Set specific version for a service (for hotfixes)"""
-        print_header(f"Setting Custom Version")
+    def bundle_export(self, output: str = None, compression: str = 'auto', include_infra: bool = True) -> bool:
+        """Export every image pinned in the manifest as one compressed bundle
 
-        if service not in SERVICES:
-            print_error(f"Unknown service: {service}")
-            print_info(f"Valid services: {', '.join(SERVICES)}")
+        Intended for air-gapped installs: copy the bundle across and run
+        bundle-import there. With output '-' the bundle is written to the
+        real stdout (main() sends progress to stderr), so it can be piped.
+        """
+        print_header("Exporting Image Bundle")
+
+        try:
+            compression = image_bundle.choose_compression(compression)
+        except image_bundle.BundleError as e:
+            print_error(str(e))
             return False
 
-        # Pull the image first
         registry = self.get_registry()
-        image = f"{registry}/{service}:{tag}"
-        print_info(f"Pulling {image}...")
+        services = self.manifest.get('services', {})
+        service_images = {svc: self.get_full_image(svc) for svc in SERVICES}
+        unpinned = [svc for svc in SERVICES if self.get_current_tag(svc) == 'latest']
+        if unpinned:
+            print_warning(f"Not pinned to a version, bundling ':latest': {', '.join(unpinned)}")
+            print_info("Run 'make resolve-tags' first to record semantic versions")
+
+        images = list(service_images.values())
+        infra_images = list_infra_images() if include_infra else []
+        images.extend(infra_images)
+
+        inventory = get_inventory(containers=False)
+        missing = [image for image in images if not inventory.image(image)]
+        if missing:
+            print_error(f"{len(missing)} image(s) are not present locally:")
+            for image in missing:
+                print(f"    {image}")
+            print_info("Pull them first with: make pull-from-manifest")
+            return False
 
-        success, output = docker_pull_with_retry(image)
-        if not success:
-            print_error(f"Failed to pull image: {image}")
-            print(f"  {output}")
+        now = datetime.now()
+        metadata = {
+            'format': image_bundle.BUNDLE_FORMAT,
+            'created_at': now.isoformat(),
+            'created_ts': int(now.timestamp()),
+            'created_by': os.environ.get('USER', 'system'),
+            'deployment_id': self.manifest.get('deployment_id', ''),
+            'registry': registry,
+            'services': {
+                svc: {
+                    'image': service_images[svc].rsplit(':', 1)[0],
+                    'tag': self.get_current_tag(svc),
+                    'image_digest': services.get(svc, {}).get('image_digest', ''),
+                    'image_id': inventory.image_id(image)
+                }
+                for svc, image in service_images.items()
+            },
+            'infra_images': infra_images
+        }
+
+        output = output or image_bundle.default_bundle_name(compression, now.strftime('%Y%m%d-%H%M%S'))
+        print_info(f"Bundling {len(images)} images ({compression}) into {'stdout' if output == '-' else output}...")
+
+        start = time.time()
+        writer = None
+        try:
+            writer = image_bundle.CompressedWriter(output, compression)
+            stream, finish_save = open_image_save(images)
+            try:
+                stats = image_bundle.write_bundle(writer, metadata, stream)
+            finally:
+                saved, save_error = finish_save()
+            writer.close()
+            writer = None
+            if not saved:
+                raise image_bundle.BundleError(save_error or "docker save failed")
+        except (image_bundle.BundleError, docker_api.DockerAPIError, tarfile.TarError, OSError) as e:
+            if writer:
+                try:
+                    writer.close()
+                except (image_bundle.BundleError, OSError):
+                    pass
+            if output != '-' and os.path.exists(output):
+                os.remove(output)
+            print_error(f"Bundle export failed: {e}")
             return False
 
-        print_success(f"Pulled {service}:{tag}")
+        elapsed = max(time.time() - start, 0.001)
+        print_success(f"Exported {len(images)} images in {elapsed:.1f}s")
+        print(f"  Image data:  {image_bundle.format_size(stats['bytes'])} "
+              f"({stats['bytes'] / elapsed / (1024 * 1024):.0f} MB/s)")
+        if output != '-':
+            print(f"  Bundle size: {image_bundle.format_size(os.path.getsize(output))}")
+            print()
+            print_info(f"On the target host: make bundle-import BUNDLE={output}")
+        return True
 
-        # Update manifest
-        self.update_service_version(service, tag)
+    def bundle_import(self, input_path: str) -> bool:
+        """Load an image bundle and pin the manifest and versions.env to its versions"""
+        print_header("Importing Image Bundle")
 
-        # Also add to custom_overrides for tracking
-        if 'custom_overrides' not in self.manifest:
-            self.manifest['custom_overrides'] = {}
+        start = time.time()
+        reader = None
+        try:
+            reader = image_bundle.DecompressedReader(input_path)
+            metadata, image_stream, finish = image_bundle.read_bundle(reader)
+            print_info(f"Bundle created {metadata.get('created_at', 'unknown')[:19]} "
+                       f"by {metadata.get('created_by', 'unknown')} ({reader.compression})")
+            print_info("Loading images...")
+            try:
+                loaded, messages = load_image_stream(image_stream)
+            finally:
+                image_stream.close()
+            # docker's own answer first: when loading fails, the bundle reader
+            # then hits the closed stream, which is only a consequence
+            for message in messages:
+                print(f"  {message}")
+            if not loaded:
+                print_error("docker load failed")
+            try:
+                stats = finish()
+            except image_bundle.ImageStreamClosed:
+                if loaded:
+                    raise
+            if not loaded:
+                return False
+        except (image_bundle.BundleError, tarfile.TarError, OSError, EOFError) as e:
+            print_error(f"Bundle import failed: {e}")
+            return False
+        finally:
+            if reader:
+                reader.close()
 
-        self.manifest['custom_overrides'][service] = {
-            'tag': tag,
-            'reason': 'Custom version set via CLI',
-            'applied_at': datetime.now().isoformat()
-        }
+        elapsed = max(time.time() - start, 0.001)
+        print_success(f"Loaded {image_bundle.format_size(stats['bytes'])} of image data in {elapsed:.1f}s")
+
+        # Retag to this install's registry if the bundle came from another one
+        registry = self.get_registry()
+        imported = {svc: info for svc, info in metadata.get('services', {}).items() if svc in SERVICES}
+        for svc, info in imported.items():
+            tag = info.get('tag', 'latest')
+            source = f"{info.get('image')}:{tag}"
+            target = f"{registry}/{svc}:{tag}"
+            if source != target and not tag_image(source, target):
+                print_error(f"Failed to tag {source} as {target}")
+                return False
+
+        inventory = get_inventory(containers=False)
+        for svc, info in imported.items():
+            tag = info.get('tag', 'latest')
+            self.update_service_version(svc, tag, inventory=inventory)
+            # Loaded images carry no RepoDigests; keep the ones recorded at export
+            entry = self.manifest['services'][svc]
+            entry['image_digest'] = info.get('image_digest') or entry['image_digest']
+            entry['image_id'] = entry.get('image_id') or info.get('image_id', '')
+            print(f"  \u2713 {svc}: {tag}")
 
         self.save_manifest()
         self.generate_env()
-
-        print_success(f"Set {service} to {tag}")
-        print_info("Run 'make up' to apply changes")
+        print_success("Bundle imported")
+        print_info("Run 'make down && make up' to apply changes")
         return True
 
-    def update_safe(self):
-        """Safe update to latest versions with automatic backup and rollback on failure
+    # ==================
+    # MIRROR COMMANDS
+    # ==================
 
-        This pulls :latest for all services since each service has its own version.
-        For updating a specific service to a specific tag, use: make version-pull SERVICE=x TAG=y
-        """
-        print_header("DagKnows Safe Update")
+    def mirror(self, action: str, host: str = None, port: int = MIRROR_PORT,
+               workers: Optional[int] = None) -> bool:
+        """Manage the local pull-through registry mirror"""
+        if action == 'status':
+            return self.mirror_status()
 
-        print_info("This will update all services to their latest versions")
-        print()
+        if self.manifest.get('ecr', {}).get('use_private'):
+            print_error("Registry mirror mode only supports public ECR (private ECR tokens expire)")
+            return False
 
-        # Step 1: Create backup
-        print_info("Creating backup before update...")
-        backup_path = self.backup_manifest()
-        if backup_path:
-            print_success(f"Backup created: {backup_path}")
+        if action == 'setup':
+            return self.mirror_setup(port, host)
+        if action == 'enable':
+            if not host:
+                print_error("--host is required (e.g., --host=mirror.internal:5000)")
+                return False
+            return self.mirror_enable(host)
+        if action == 'disable':
+            return self.mirror_disable()
+        if action == 'warm':
+            return self.mirror_warm(workers)
+        print_error(f"Unknown mirror action: {action}")
+        return False
 
-        # Also backup data if needed
-        print_info("Creating data backup...")
-        success, _ = run_command("make backups", capture=False)
-        if success:
-            print_success("Data backup created")
+    def mirror_setup(self, port: int = MIRROR_PORT, host: str = None) -> bool:
+        """Run the registry mirror container on this host and point this install at it
+
+        Other hosts on the LAN then only need: mirror enable --host=<this-host>:<port>
+        """
+        print_header("Registry Mirror Setup")
+
+        state = mirror_container_state()
+        if state == 'running':
+            print_info(f"{MIRROR_CONTAINER} is already running")
+        elif state:
+            print_info(f"Starting existing {MIRROR_CONTAINER} container...")
+            success, output = run_command(docker_command(f"docker start {MIRROR_CONTAINER}"))
+            if not success:
+                print_error(f"Failed to start {MIRROR_CONTAINER}")
+                print(f"  {output}")
+                return False
         else:
-            print_warning("Data backup skipped (may require manual backup)")
+            print_info(f"Creating {MIRROR_CONTAINER} (proxy for {MIRROR_UPSTREAM}, port {port})...")
+            os.makedirs(MIRROR_DATA_DIR, exist_ok=True)
+            cmd = (f"docker run -d --name {MIRROR_CONTAINER} --restart always -p {port}:5000 "
+                   f"-e REGISTRY_PROXY_REMOTEURL={MIRROR_UPSTREAM} "
+                   f"-v {os.path.abspath(MIRROR_DATA_DIR)}:/var/lib/registry {MIRROR_IMAGE}")
+            success, output = run_command(docker_command(cmd))
+            if not success:
+                print_error(f"Failed to create {MIRROR_CONTAINER}")
+                print(f"  {output}")
+                return False
 
-        # Step 2: Pull new images (latest for all services)
-        print_info("Pulling latest images...")
-        registry = self.get_registry()
-        pulled_services = []
+        if not wait_for_registry(registry_v2.RegistryClient(f"localhost:{port}")):
+            print_error(f"Registry mirror did not answer on localhost:{port}")
+            print_info(f"Check its logs with: docker logs {MIRROR_CONTAINER}")
+            return False
+        print_success(f"Registry mirror listening on port {port}")
 
-        for svc in SERVICES:
-            image = f"{registry}/{svc}:latest"
-            success, output = docker_pull_with_retry(image)
-            if success:
-                pulled_services.append(svc)
-                print(f"  \u2713 {svc}")
-            else:
-                print(f"  \u2717 {svc} (failed)")
-                if output:
-                    print(f"    {output}")
+        return self.mirror_enable(host or f"localhost:{port}")
 
-        if len(pulled_services) < len(SERVICES):
-            print_warning(f"Only {len(pulled_services)}/{len(SERVICES)} images pulled")
-            if not confirm("Continue with partial update?"):
-                print("Update cancelled.")
-                return False
+    def mirror_enable(self, host: str) -> bool:
+        """Pull all images through the mirror at host (rewrites manifest and versions.env)"""
+        print_header("Enabling Registry Mirror")
 
-        print_success("Images pulled successfully")
+        reachable, error = registry_v2.RegistryClient(host).ping()
+        if not reachable:
+            print_error(f"Registry mirror is not reachable: {error}")
+            return False
 
-        # Step 3: Update manifest with pulled versions
-        print_info("Updating manifest...")
-        for svc in pulled_services:
-            self.update_service_version(svc, 'latest')
-        self.save_manifest()
+        old_registry = self.get_registry()
+        ecr = self.manifest.setdefault('ecr', {})
+        ecr['mirror'] = {
+            'enabled': True,
+            'host': host,
+            'upstream': MIRROR_UPSTREAM,
+            'enabled_at': datetime.now().isoformat()
+        }
+        self._switch_registry(old_registry)
 
-        # Step 4: Resolve 'latest' tags to semantic versions from ECR
-        print()
-        resolved = self.resolve_latest_tags(pulled_services, save=True)
-        if resolved == 0:
-            print_warning("Could not resolve semantic versions - using 'latest' tags")
-            print_info("You can retry later with: make resolve-tags")
+        print_success(f"Images now pull through {host}")
+        if not host.startswith(('localhost:', '127.')):
+            print_info(f"Docker needs {host} listed in \"insecure-registries\" in /etc/docker/daemon.json")
+        print_info("Warm the mirror ahead of time with: make mirror-warm")
+        return True
 
-        # Step 5: Stop services
-        print_info("Stopping services...")
-        run_command("docker compose down")
-        print_success("Services stopped")
+    def mirror_disable(self) -> bool:
+        """Go back to pulling from ECR directly (the mirror container is left running)"""
+        print_header("Disabling Registry Mirror")
 
-        # Step 7: Start services
-        print_info("Starting services with new images...")
-        success, _ = run_command("make up", capture=False)
-        if not success:
-            print_error("Failed to start services")
-            return False
+        mirror = self.get_mirror()
+        if not mirror.get('enabled'):
+            print_info("Registry mirror is not enabled")
+            return True
 
-        # Step 8: Health check
-        print_info("Waiting for services to initialize (30s)...")
-        time.sleep(30)
+        old_registry = self.get_registry()
+        mirror['enabled'] = False
+        self._switch_registry(old_registry)
+        print_success(f"Images now pull from {self.get_registry()}")
+        return True
 
-        print_info("Verifying service health...")
-        if self.verify_health():
-            print_success("All services healthy!")
-            print_success("Update completed successfully!")
-            return True
-        else:
-            print_error("Health check failed!")
-            if confirm("Rollback to previous version?"):
-                self.rollback(all_services=True, interactive=False)
-                run_command("make up", capture=False)
-                print_warning("Rolled back to previous version")
-            return False
+    def _switch_registry(self, old_registry: str):
+        """
+        Retag local images of the current versions under the new registry (so
+        nothing is re-downloaded) and rewrite image references to it.
+        """
+        new_registry = self.get_registry()
+        local_index = LocalImageIndex.build()
+        services = self.manifest.get('services', {})
 
-    def check_updates(self):
-        """Check for available updates (placeholder - requires ECR API access)"""
-        print_header("Available Updates")
+        for svc in SERVICES + MIRROR_EXTRA_REPOSITORIES:
+            tag = self.get_current_tag(svc) if svc in SERVICES else 'latest'
+            source = f"{old_registry}/{svc}:{tag}"
+            if source in local_index.by_tag:
+                tag_image(source, f"{new_registry}/{svc}:{tag}")
+            if svc in services:
+                services[svc]['image'] = f"{new_registry}/{svc}"
 
-        print_info("Checking for updates...")
-        print()
+        self.save_manifest()
+        self.generate_env()
 
-        # For now, just show current versions and suggest checking ECR
-        services = self.manifest.get('services', {})
+    def mirror_warm(self, workers: Optional[int] = None) -> bool:
+        """Make the mirror fetch and cache the current version of every image"""
+        print_header("Warming Registry Mirror")
 
-        for name in SERVICES:
-            current = self.get_current_tag(name)
-            if current == 'latest':
-                print(f"  \u2713 {name}: latest (always up to date)")
+        mirror = self.get_mirror()
+        if not mirror.get('enabled'):
+            print_error("Registry mirror is not enabled (run: make mirror-setup)")
+            return False
+
+        client = registry_v2.RegistryClient(mirror['host'], timeout=registry_v2.BLOB_TIMEOUT)
+        alias = self.manifest.get('ecr', {}).get('repository_alias', 'n5k3t9x2')
+        images = [(svc, self.get_current_tag(svc)) for svc in SERVICES]
+        images += [(repo, 'latest') for repo in MIRROR_EXTRA_REPOSITORIES]
+
+        def warm(image: Tuple[str, str]) -> Tuple[str, str, bool, int, float, str]:
+            repo, tag = image
+            start = time.time()
+            try:
+                size = client.fetch_image(f"{alias}/{repo}", tag)
+                return repo, tag, True, size, time.time() - start, ""
+            except registry_v2.RegistryError as e:
+                return repo, tag, False, 0, time.time() - start, str(e)
+
+        workers = min(get_pull_workers(workers), len(images))
+        print_info(f"Fetching {len(images)} images through {mirror['host']} with {workers} worker(s)...")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(warm, images))
+
+        failed = 0
+        for repo, tag, success, size, elapsed, error in results:
+            if success:
+                print(f"  \u2713 {repo}:{tag} ({image_bundle.format_size(size)}, {elapsed:.1f}s)")
             else:
-                print(f"  ? {name}: {current} (check ECR for newer versions)")
+                failed += 1
+                print(f"  \u2717 {repo}:{tag}: {error}")
 
         print()
-        print_info("To check for updates, visit:")
-        print(f"  https://gallery.ecr.aws/n5k3t9x2")
-        print()
-        print_info("To update to latest:")
-        print(f"  make update-safe")
-        print()
+        if failed:
+            print_warning(f"Warmed {len(results) - failed}/{len(results)} images")
+            return False
+        print_success(f"Warmed {len(results)} images")
+        return True
 
-    # ==================
-    # ECR COMMANDS
-    # ==================
+    def mirror_status(self) -> bool:
+        """Show mirror settings, container state and what it has cached"""
+        print_header("Registry Mirror Status")
 
-    def ecr_login(self):
-        """Login to private ECR"""
-        print_header("ECR Login")
+        mirror = self.get_mirror()
+        print(f"  {'Enabled':.<30} {'yes' if mirror.get('enabled') else 'no'}")
+        print(f"  {'Mirror host':.<30} {mirror.get('host', '-')}")
+        print(f"  {'Upstream':.<30} {mirror.get('upstream', MIRROR_UPSTREAM)}")
+        print(f"  {'Pulling from':.<30} {self.get_registry()}")
 
-        ecr = self.manifest.get('ecr', {})
+        state = mirror_container_state()
+        print(f"  {'Local container':.<30} {state or 'not on this host'}")
+        if os.path.isdir(MIRROR_DATA_DIR):
+            print(f"  {'Cache size':.<30} {image_bundle.format_size(directory_size(MIRROR_DATA_DIR))}")
 
-        if not ecr.get('use_private') or not ecr.get('private_registry'):
-            print_info("Using public ECR - no authentication required")
+        if not mirror.get('host'):
+            print()
             return True
 
-        region = ecr.get('private_region', 'us-east-1')
-        registry = ecr.get('private_registry')
-
-        print_info(f"Logging into private ECR: {registry}")
+        client = registry_v2.RegistryClient(mirror['host'])
+        reachable, error = client.ping()
+        print(f"  {'Reachable':.<30} {'yes' if reachable else error}")
+        if not reachable:
+            print()
+            return False
 
-        cmd = f"aws ecr get-login-password --region {region} | docker login --username AWS --password-stdin {registry}"
-        success, output = run_command(cmd)
+        try:
+            cached = set(client.catalog())
+        except registry_v2.RegistryError as e:
+            print_warning(f"Could not list cached repositories: {e}")
+            cached = set()
 
-        if success:
-            print_success("Successfully logged into ECR")
-            return True
-        else:
-            print_error("Failed to login to ECR")
-            print(f"  {output}")
-            print_info("Make sure AWS CLI is configured with valid credentials")
-            return False
+        alias = self.manifest.get('ecr', {}).get('repository_alias', 'n5k3t9x2')
+        print()
+        print(f"  {'REPOSITORY':<22} {'CURRENT TAG':<20} {'CACHED'}")
+        for svc in SERVICES + MIRROR_EXTRA_REPOSITORIES:
+            repository = f"{alias}/{svc}"
+            tag = self.get_current_tag(svc) if svc in SERVICES else 'latest'
+            local_tags = mirror_cached_tags(repository)
+            if local_tags:
+                status = 'yes' if tag in local_tags else f"no ({len(local_tags)} other tag(s))"
+            else:
+                status = 'repository cached' if repository in cached else 'no'
+            print(f"  {svc:<22} {tag:<20} {status}")
+        print()
+        return True
 
     # ==================
     # TAG RESOLUTION
@@ -926,6 +3430,9 @@ class VersionManager:
         if services is None:
             services = SERVICES
         
+        # Warm the ECR cache for all services at once instead of one CLI call per service
+        ecr_cache.prefetch([svc for svc in services if self.get_current_tag(svc) == 'latest'])
+        
         resolved_count = 0
         
         for svc in services:
@@ -974,8 +3481,12 @@ class VersionManager:
     # HELPER METHODS
     # ==================
 
-    def update_service_version(self, service: str, tag: str, is_rollback: bool = False):
-        """Update service version in manifest"""
+    def update_service_version(self, service: str, tag: str, is_rollback: bool = False,
+                               inventory: Optional[docker_api.Inventory] = None):
+        """
+        Update service version in manifest. Callers updating several services
+        pass one inventory (local image listing) for all of them.
+        """
         now = datetime.now().isoformat()
 
         # Initialize services dict if needed
@@ -989,18 +3500,18 @@ class VersionManager:
         # Update current version
         registry = self.get_registry()
 
-        # Get image digest
-        digest = ""
-        success, output = run_command(f"docker inspect --format='{{{{.RepoDigests}}}}' {registry}/{service}:{tag}")
-        if success:
-            digest = output
+        # Get image digest (and ID, which still matches after an air-gapped bundle import)
+        image = f"{registry}/{service}:{tag}"
+        inventory = inventory or get_inventory(containers=False, images=[image])
+        digest = format_repo_digests(inventory, image)
 
         self.manifest['services'][service] = {
             'image': f"{registry}/{service}",
             'current_tag': tag,
             'deployed_at': now,
             'deployed_by': os.environ.get('USER', 'system'),
-            'image_digest': digest
+            'image_digest': digest,
+            'image_id': inventory.image_id(image)
         }
 
         # Update history
@@ -1024,7 +3535,9 @@ class VersionManager:
         self.manifest['history'][service].insert(0, {
             'tag': tag,
             'deployed_at': now,
-            'status': 'current'
+            'status': 'current',
+            'image_digest': digest,
+            'image_id': inventory.image_id(image)
         })
 
         # Keep only last HISTORY_LIMIT entries
@@ -1039,64 +3552,152 @@ class VersionManager:
         """Generate versions.env from manifest"""
         print_info("Generating versions.env...")
 
+        # Write the manifest first so the fingerprint matches what is on disk
+        self.flush_manifest()
         registry = self.get_registry()
 
         lines = [
             "# DagKnows Service Versions",
             "# Auto-generated from version-manifest.yaml - DO NOT EDIT MANUALLY",
             f"# Generated: {datetime.now().isoformat()}",
+            FINGERPRINT_PREFIX + versions_env_fingerprint(os.getcwd()),
             "",
             f"DK_ECR_REGISTRY={registry}",
             ""
         ]
 
+        # With pinning, compose gets 'repo:tag@sha256:...': docker uses the
+        # digest and ignores the tag, which is kept for display
+        pins = self.get_pinned_digests() if self.pinning_enabled() else {}
         for name in SERVICES:
             var_name = name.upper()
             image = f"{registry}/{name}"
             tag = self.get_current_tag(name)
+            if name in pins:
+                tag = f"{tag}@{pins[name]}"
 
             lines.append(f"DK_{var_name}_IMAGE={image}")
             lines.append(f"DK_{var_name}_TAG={tag}")
             lines.append("")
 
-        with open(self.versions_env, 'w') as f:
-            f.write('\n'.join(lines))
+        # Route the mcp-server image (not version-tracked) through the mirror too
+        if self.get_mirror().get('enabled'):
+            lines.append(f"DK_MCP_SERVER_IMAGE={registry}/dagknows_mcp_server")
+            lines.append("")
+
+        # Replace atomically: compose may be reading versions.env concurrently
+        manifest_store.write_atomic(self.versions_env, '\n'.join(lines).encode())
 
         print_success(f"Generated {self.versions_env}")
 
-    def verify_health(self) -> bool:
-        """Verify all services are healthy"""
-        success, output = run_command("docker compose ps --format json")
-        if not success:
+    def wait_ready(self, timeout: Optional[int] = None, compose_file: str = 'docker-compose.yml') -> bool:
+        """Wait until every service in compose_file is ready, returning as soon as they are"""
+        services = list(load_compose_dependencies(compose_file))
+        if not services:
+            print_error(f"No services found in {compose_file}")
             return False
 
-        try:
-            healthy_count = 0
-            total_count = 0
+        waiter = ReadinessWaiter(services, timeout)
+        print_info(f"Waiting for {len(services)} services to become ready (up to {waiter.timeout}s)...")
+        start = time.time()
+        ready = waiter.wait(lambda svc, state, seconds: print(f"  \u2713 {svc}: {state} ({seconds:.0f}s)"))
 
-            for line in output.strip().split('\n'):
-                if not line.strip():
-                    continue
-                container = json.loads(line)
-                service = container.get('Service', '')
-                state = container.get('State', '')
-                health = container.get('Health', '')
-
-                if service in SERVICE_TO_COMPOSE.values():
-                    total_count += 1
-                    if state == 'running':
-                        if health in ('healthy', ''):  # Empty health means no healthcheck defined
-                            healthy_count += 1
-                            print(f"  \u2713 {service}: {state}" + (f" [{health}]" if health else ""))
-                        else:
-                            print(f"  \u2717 {service}: {state} [{health}]")
-                    else:
-                        print(f"  \u2717 {service}: {state}")
-
-            return healthy_count >= total_count * 0.8  # Allow 80% healthy for partial success
-        except json.JSONDecodeError:
+        if ready:
+            print_success(f"All services ready in {time.time() - start:.0f}s")
+            return True
+
+        print_warning(f"Not ready after {waiter.timeout}s:")
+        for svc in waiter.pending():
+            print(f"  \u2717 {svc}: {waiter.states[svc]}")
+        return False
+
+    def startup(self, compose_files: List[str] = None, timeout: Optional[int] = None,
+                wait: bool = True) -> bool:
+        """
+        Start the services of compose_files (default: databases and app) along
+        one dependency graph, in parallel where the graph allows, then print
+        the critical path. With wait=False, return once everything has started.
+        """
+        graph = load_startup_graph(COMPOSE_FILES + [f for f in compose_files or [] if f not in COMPOSE_FILES])
+        selected = compose_files or COMPOSE_FILES
+        services = [svc for svc, node in graph.items() if node['compose_file'] in selected]
+        if not services:
+            print_error(f"No services found in {', '.join(selected)}")
+            return False
+
+        # Starting scales each service back to one container: end any blue/green
+        # grace period first, so nginx.conf does not name a container that goes
+        if 'docker-compose.yml' in selected:
+            self.blue_green_finish()
+
+        if not prepare_compose_env():
+            print_error("Could not decrypt .env.gpg")
             return False
 
+        orchestrator = StartupOrchestrator(graph, services, timeout or STARTUP_TIMEOUT, wait)
+        external = [svc for svc in orchestrator.waiter.services if svc not in services]
+        print_info(f"Starting {len(services)} services"
+                   + (f" (waiting on {', '.join(external)})" if external else "")
+                   + f", deadline {orchestrator.waiter.timeout}s...")
+        success = orchestrator.run()
+
+        elapsed = time.time() - orchestrator.start
+        path = orchestrator.critical_path() if wait else []
+        if path:
+            print(f"\nCritical path ({orchestrator.finished_at(path[-1]):.0f}s):")
+            for svc in path:
+                launched = orchestrator.launched_at.get(svc)
+                finished = orchestrator.finished_at(svc)
+                launched_text = f"{launched:.0f}s" if launched is not None else "-"
+                finished_text = f"{finished:.0f}s" if finished is not None else "-"
+                print(f"  {svc:<16} start {launched_text:>5}   ready {finished_text:>5}")
+        print()
+
+        if success:
+            print_success(f"{len(services)} services {'ready' if wait else 'started'} in {elapsed:.0f}s")
+            return True
+
+        if orchestrator.errors:
+            print_error(f"Startup failed: {', '.join(orchestrator.errors)} did not start")
+        else:
+            print_error(f"Startup incomplete after {orchestrator.waiter.timeout}s:")
+            for svc in orchestrator.waiter.services:
+                if svc in orchestrator.waiter.ready_at or (not wait and svc in orchestrator.started_at):
+                    continue
+                blocked = svc in services and svc not in orchestrator.launched_at
+                state = 'waiting on dependencies' if blocked else orchestrator.waiter.states[svc]
+                print(f"  \u2717 {svc}: {state}")
+        return False
+
+    def verify_health(self) -> bool:
+        """Verify all services are running and the probed ones are serving requests
+
+        Every app service must be running and not unhealthy or starting; the
+        services in health_probe.PROBES (including the databases) must also
+        pass their probe: accepted responses within their latency budget.
+        """
+        inventory = get_inventory()
+        services = inventory.services()
+        healthy = True
+
+        for compose_svc in SERVICE_TO_COMPOSE.values():
+            info = services.get(compose_svc)
+            if not info:
+                print(f"  \u2717 {compose_svc}: not created")
+                healthy = False
+                continue
+            state, health = info['state'], info['health']
+            label = f"{state}" + (f" [{health}]" if health else "")
+            if state != 'running' or health not in ('healthy', ''):
+                print(f"  \u2717 {compose_svc}: {label}")
+                healthy = False
+            elif compose_svc not in health_probe.PROBES:
+                print(f"  \u2713 {compose_svc}: {label}")
+
+        results = probe_services(inventory=inventory)
+        print_probe_results(results)
+        return healthy and all(result.passed for result in results)
+
 
 # ============================================
 # MAIN
@@ -1117,7 +3718,16 @@ Examples:
   %(prog)s rollback --all                    Rollback all services
   %(prog)s set --service=wsfe --tag=v1.2.3-hotfix  Set custom version
   %(prog)s update-safe                       Safe update with rollback
+  %(prog)s prefetch                          Stage the next update ahead of time
+  %(prog)s update-safe --prefetched          Apply the staged update (no pulls)
+  %(prog)s pull-latest --workers=8           Pull latest with 8 concurrent pulls
   %(prog)s check-updates                     Check for available updates
+  %(prog)s gc --dry-run                      Show which old images would be removed
+  %(prog)s bundle-export --output=b.tar.zst  Export images for an air-gapped host
+  %(prog)s bundle-import --input=b.tar.zst   Import them on the air-gapped host
+  %(prog)s bluegreen deploy --service=req_router  Zero-downtime swap of req-router
+  %(prog)s mirror setup                      Run a pull-through registry mirror here
+  %(prog)s mirror enable --host=h:5000       Pull through the mirror on host h
         """
     )
 
@@ -1134,18 +3744,27 @@ Examples:
     pull_parser = subparsers.add_parser('pull', help='Pull specific version for a service')
     pull_parser.add_argument('--service', required=True, help='Service name (each service has its own version)')
     pull_parser.add_argument('--tag', required=True, help='Tag to pull (e.g., 1.35)')
+    pull_parser.add_argument('--force', action='store_true', help='Pull even if the image is already present')
 
     # Pull from manifest
-    subparsers.add_parser('pull-from-manifest', help='Pull versions from manifest')
+    pull_manifest_parser = subparsers.add_parser('pull-from-manifest', help='Pull versions from manifest')
+    pull_manifest_parser.add_argument('--workers', type=int,
+                                      help=f'Concurrent pulls (default: DK_PULL_WORKERS or {DEFAULT_PULL_WORKERS})')
+    pull_manifest_parser.add_argument('--force', action='store_true',
+                                      help='Pull even if the recorded digest is already present')
 
     # Pull latest (ignores manifest, updates it after)
-    subparsers.add_parser('pull-latest', help='Pull :latest for all services and update manifest')
+    pull_latest_parser = subparsers.add_parser('pull-latest', help='Pull :latest for all services and update manifest')
+    pull_latest_parser.add_argument('--workers', type=int,
+                                    help=f'Concurrent pulls (default: DK_PULL_WORKERS or {DEFAULT_PULL_WORKERS})')
 
     # Rollback command
     rollback_parser = subparsers.add_parser('rollback', help='Rollback to previous version')
     rollback_parser.add_argument('--service', help='Service to rollback')
     rollback_parser.add_argument('--tag', help='Specific tag to rollback to')
     rollback_parser.add_argument('--all', action='store_true', help='Rollback all services')
+    rollback_parser.add_argument('--no-restart', action='store_true',
+                                 help='Only update the manifest and versions.env; do not recreate services')
 
     # Set command
     set_parser = subparsers.add_parser('set', help='Set specific version for a service')
@@ -1156,27 +3775,137 @@ Examples:
     subparsers.add_parser('resolve-tags', help='Resolve latest tags to semantic versions from ECR')
 
     # Update safe command
-    subparsers.add_parser('update-safe', help='Safe update to latest with backup and rollback')
+    update_safe_parser = subparsers.add_parser('update-safe', help='Safe update to latest with backup and rollback')
+    update_safe_parser.add_argument('--workers', type=int,
+                                    help=f'Concurrent pulls (default: DK_PULL_WORKERS or {DEFAULT_PULL_WORKERS})')
+    update_safe_parser.add_argument('--prefetched', action='store_true',
+                                    help="Use the images staged by 'prefetch' instead of pulling")
+    update_safe_parser.add_argument('--full-restart', action='store_true',
+                                    help='Stop and start all services instead of a rolling restart')
+    update_safe_parser.add_argument('--blue-green', action='store_true',
+                                    help='Swap req-router and the UI blue/green instead of recreating them')
+
+    # Prefetch command
+    prefetch_parser = subparsers.add_parser('prefetch', help='Pull and stage the next update without restarting anything')
+    prefetch_parser.add_argument('--workers', type=int,
+                                 help=f'Concurrent pulls (default: DK_PULL_WORKERS or {DEFAULT_PULL_WORKERS})')
 
     # Check updates command
-    subparsers.add_parser('check-updates', help='Check for available updates')
+    updates_parser = subparsers.add_parser('check-updates', help='Check for available updates')
+    updates_parser.add_argument('--registry',
+                                help='Registry and namespace to check (default: the one images are pulled from)')
 
     # Generate env command
-    subparsers.add_parser('generate-env', help='Generate versions.env from manifest')
+    env_parser = subparsers.add_parser('generate-env', help='Generate versions.env from manifest')
+    env_parser.add_argument('--force', action='store_true',
+                            help='Regenerate even if versions.env is up to date')
+
+    # Image garbage collection
+    gc_parser = subparsers.add_parser('gc', help='Remove local images that are neither in use nor in history')
+    gc_parser.add_argument('--dry-run', action='store_true', help='Only show what would be removed and the space freed')
+    gc_parser.add_argument('--yes', action='store_true', help='Do not ask for confirmation')
 
     # ECR login command
     subparsers.add_parser('ecr-login', help='Login to private ECR')
 
+    # ECR cache command
+    ecr_cache_parser = subparsers.add_parser('ecr-cache', help='Show or invalidate the ECR describe-images cache')
+    ecr_cache_parser.add_argument('--clear', action='store_true', help='Invalidate cached entries')
+    ecr_cache_parser.add_argument('--service', help='Only invalidate this repository')
+
+    # Bundle commands (air-gapped installs)
+    bundle_export_parser = subparsers.add_parser('bundle-export', help='Export pinned images as one compressed bundle')
+    bundle_export_parser.add_argument('--output', help="Bundle file ('-' for stdout; default: dkapp-bundle-<time>.tar.zst|gz)")
+    bundle_export_parser.add_argument('--compression', choices=['auto', 'zstd', 'gzip'], default='auto',
+                                      help='Compression (default: zstd if installed, else gzip)')
+    bundle_export_parser.add_argument('--no-infra', action='store_true',
+                                      help='Leave out nginx, postgres, elasticsearch and mcp-server images')
+
+    bundle_import_parser = subparsers.add_parser('bundle-import', help='Load an image bundle and update the manifest')
+    bundle_import_parser.add_argument('--input', required=True, help="Bundle file ('-' for stdin)")
+
+    # Digest pinning command
+    pinning_parser = subparsers.add_parser('pinning', help='Deploy images by digest instead of tag')
+    pinning_parser.add_argument('action', choices=['enable', 'disable', 'status'],
+                                help='enable/disable: switch versions.env to digests or tags; status: show pins')
+
+    # Config agent commands
+    config_agent_parser = subparsers.add_parser('config-agent', help='Keep the decrypted .env.gpg in memory for a while')
+    config_agent_parser.add_argument('action', choices=['start', 'stop', 'status'],
+                                     help='start: decrypt once and serve the values; stop: drop them')
+    config_agent_parser.add_argument('--ttl', type=int,
+                                     help=f'Seconds to keep the values (default: DK_CONFIG_TTL or {config_agent.DEFAULT_TTL})')
+
+    with_config_parser = subparsers.add_parser('with-config', help='Run a command with the configuration in its environment')
+    with_config_parser.add_argument('cmd', nargs=argparse.REMAINDER, help='Command to run (after --)')
+
+    # Registry mirror command
+    mirror_parser = subparsers.add_parser('mirror', help='Manage the local pull-through registry mirror')
+    mirror_parser.add_argument('action', choices=['setup', 'enable', 'disable', 'warm', 'status'],
+                               help='setup: run mirror here; enable/disable: use a mirror; warm: prefetch images')
+    mirror_parser.add_argument('--host', help='Mirror address as host:port (default for setup: localhost:PORT)')
+    mirror_parser.add_argument('--port', type=int, default=MIRROR_PORT, help=f'Port for setup (default: {MIRROR_PORT})')
+    mirror_parser.add_argument('--workers', type=int,
+                               help=f'Concurrent images for warm (default: DK_PULL_WORKERS or {DEFAULT_PULL_WORKERS})')
+
+    # Dependency-ordered parallel startup
+    startup_parser = subparsers.add_parser('startup', help='Start services in dependency order, in parallel')
+    startup_parser.add_argument('--compose-file', action='append', dest='compose_files',
+                                help='Only start this compose file\'s services (repeatable; default: both)')
+    startup_parser.add_argument('--timeout', type=int,
+                                help=f'Deadline in seconds (default: {STARTUP_TIMEOUT})')
+    startup_parser.add_argument('--no-wait', action='store_true',
+                                help='Return once every service has started, without waiting for health')
+
+    # Blue/green deploys of the services behind nginx
+    blue_green_parser = subparsers.add_parser('bluegreen', help='Blue/green deploy of req-router or the UI')
+    blue_green_parser.add_argument('action', choices=['deploy', 'switch-back', 'finish', 'status'],
+                                   help='deploy: start manifest version alongside and switch nginx; '
+                                        'switch-back: return to the previous container; finish: remove it')
+    blue_green_parser.add_argument('--service', help=f"Service ({', '.join(BLUE_GREEN_SERVICES)})")
+    blue_green_parser.add_argument('--grace', type=int,
+                                   help=f'Seconds to keep the previous container (default: {BLUE_GREEN_GRACE})')
+
+    # Wait for readiness (used after 'docker compose up' instead of fixed sleeps)
+    wait_ready_parser = subparsers.add_parser('wait-ready', help='Wait until services are healthy')
+    wait_ready_parser.add_argument('--timeout', type=int,
+                                   help=f'Deadline in seconds (default: DK_READY_TIMEOUT or {DEFAULT_READY_TIMEOUT})')
+    wait_ready_parser.add_argument('--compose-file', default='docker-compose.yml',
+                                   help='Compose file whose services to wait for (default: docker-compose.yml)')
+
     args = parser.parse_args()
 
     # Change to script directory
     script_dir = Path(__file__).parent.absolute()
     os.chdir(script_dir)
 
+    # Streaming a bundle to stdout: keep all messages on stderr
+    if args.command == 'bundle-export' and args.output == '-':
+        sys.stdout = sys.stderr
+
+    # Configuration commands need neither the manifest nor Docker
+    if args.command == 'config-agent':
+        sys.exit(0 if config_agent_command(args.action, args.ttl) else 1)
+    if args.command == 'with-config':
+        command = args.cmd[1:] if args.cmd[:1] == ['--'] else args.cmd
+        if not command:
+            print_error("Usage: version-manager.py with-config -- COMMAND...")
+            sys.exit(1)
+        values = config_agent.load_config(start_agent=True)
+        if values is None:
+            print_error("Could not decrypt .env.gpg")
+            sys.exit(1)
+        config_agent.exec_with_config(command, values)
+        print_error(f"Could not run {command[0]}")
+        sys.exit(127)
+
     vm = VersionManager()
 
     # Commands that require Docker access
-    docker_commands = {'pull', 'pull-from-manifest', 'pull-latest', 'rollback', 'update-safe'}
+    docker_commands = {'pull', 'pull-from-manifest', 'pull-latest', 'rollback', 'set', 'update-safe',
+                       'prefetch', 'startup', 'wait-ready', 'bundle-export', 'bundle-import', 'bluegreen', 'gc'}
+    if args.command == 'mirror' and args.action in ('setup', 'enable', 'disable'):
+        docker_commands.add('mirror')
 
     # Check Docker access for commands that need it
     if args.command in docker_commands:
@@ -1188,25 +3917,55 @@ Examples:
     elif args.command == 'history':
         vm.history(getattr(args, 'service', None))
     elif args.command == 'pull':
-        vm.pull(args.service, args.tag)
+        vm.pull(args.service, args.tag, args.force)
     elif args.command == 'pull-from-manifest':
-        vm.pull_from_manifest()
+        vm.pull_from_manifest(args.workers, args.force)
     elif args.command == 'pull-latest':
-        vm.pull_latest()
+        vm.pull_latest(args.workers)
     elif args.command == 'rollback':
-        vm.rollback(args.service, args.tag, args.all)
+        vm.rollback(args.service, args.tag, args.all, restart=not args.no_restart)
     elif args.command == 'set':
         vm.set_version(args.service, args.tag)
     elif args.command == 'update-safe':
-        vm.update_safe()
+        vm.update_safe(args.workers, args.prefetched, args.full_restart, args.blue_green)
+    elif args.command == 'prefetch':
+        if not vm.prefetch(args.workers):
+            sys.exit(1)
     elif args.command == 'check-updates':
-        vm.check_updates()
+        if not vm.check_updates(args.registry):
+            sys.exit(1)
     elif args.command == 'generate-env':
         vm.generate_env()
+    elif args.command == 'gc':
+        if not vm.gc(args.dry_run, args.yes):
+            sys.exit(1)
     elif args.command == 'ecr-login':
         vm.ecr_login()
+    elif args.command == 'ecr-cache':
+        vm.ecr_cache(args.clear, args.service)
     elif args.command == 'resolve-tags':
         vm.resolve_latest_tags()
+    elif args.command == 'bundle-export':
+        if not vm.bundle_export(args.output, args.compression, not args.no_infra):
+            sys.exit(1)
+    elif args.command == 'bundle-import':
+        if not vm.bundle_import(args.input):
+            sys.exit(1)
+    elif args.command == 'startup':
+        if not vm.startup(args.compose_files, args.timeout, not args.no_wait):
+            sys.exit(1)
+    elif args.command == 'wait-ready':
+        if not vm.wait_ready(args.timeout, args.compose_file):
+            sys.exit(1)
+    elif args.command == 'bluegreen':
+        if not vm.blue_green(args.action, args.service, args.grace):
+            sys.exit(1)
+    elif args.command == 'pinning':
+        if not vm.pinning(args.action):
+            sys.exit(1)
+    elif args.command == 'mirror':
+        if not vm.mirror(args.action, args.host, args.port, args.workers):
+            sys.exit(1)
     else:
         parser.print_help()
 